@@ -23,7 +23,9 @@ if "inited" not in st.session_state:
     st.session_state["2-Pitch"] = {
         # option
         "show_f0": True,
-        "resolution_ratio": 1
+        "f0_backend": "pyin",
+        "resolution_ratio": 1,
+        "pitch_class_spectrum": "stft",
         # data
     }
     st.session_state["3-Time"] = {
@@ -37,11 +39,20 @@ if "inited" not in st.session_state:
         
         "beat_frames": [],
         "beat_ma_window": 3,
+        "beat_percussive": False,
         
     }
     st.session_state["4-Chord"] = {
+        # option
+        "hmm_smoothing": True,
+        "self_transition": 0.9,
+        "beat_synchronous": False,
+        "beat_aggregate": "median",
+        "hpss_harmonic": False,
+
         # data
-        "chord_df": None,
+        "chord_segments": None,
+        "chord_segments_modified": None,
         
         # flag
         "chord_df_ready": False,
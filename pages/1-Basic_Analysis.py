@@ -7,6 +7,7 @@ import numpy as np
 import librosa
 import pandas as pd
 from src.st_helper import convert_df, get_shift, update_sessions, use_plotly
+from src.audio_store import load_audio
 from src.basic_info import plot_waveform, signal_RMS_analysis, plot_spectrogram
 
 
@@ -28,7 +29,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -64,7 +65,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -74,7 +76,7 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
     
     use_plotly()
@@ -8,6 +8,8 @@ import librosa
 import pandas as pd
 import seaborn as sns
 from src.st_helper import convert_df, get_shift, update_sessions, use_plotly
+from src.audio_store import load_audio
+from src.f0 import F0_BACKENDS, F0_BACKEND_NAMES
 from src.pitch_estimation import (
     plot_mel_spectrogram, 
     plot_constant_q_transform, 
@@ -34,7 +36,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -68,7 +70,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -78,7 +81,7 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
             
     use_plotly()
@@ -96,7 +99,16 @@ if file is not None:
         st.subheader("Mel-frequency spectrogram")
         with_pitch = st.checkbox("Show pitch", value=st.session_state["2-Pitch"]["show_f0"])
         st.session_state["2-Pitch"]["show_f0"] = with_pitch
-        fig2_1, ax2_1 = plot_mel_spectrogram(y_sub, sr, shift_array, with_pitch)
+        if with_pitch:
+            f0_backend = st.selectbox(
+                "f0 method",
+                F0_BACKENDS,
+                index=F0_BACKENDS.index(st.session_state["2-Pitch"].get("f0_backend", "pyin")),
+                format_func=lambda b: F0_BACKEND_NAMES[b],
+            )
+            st.session_state["2-Pitch"]["f0_backend"] = f0_backend
+        fig2_1, ax2_1 = plot_mel_spectrogram(y_sub, sr, shift_array, with_pitch,
+                                             f0_backend=st.session_state["2-Pitch"].get("f0_backend", "pyin"))
         st.pyplot(fig2_1)
 
     # Constant-Q transform
@@ -142,11 +154,18 @@ if file is not None:
         st.subheader("Pitch class(chroma)")
         resolution_ratio = st.number_input("Use higher resolution", value=st.session_state["2-Pitch"]["resolution_ratio"], min_value=1, max_value=100, step=1)
         st.session_state["2-Pitch"]["resolution_ratio"] = resolution_ratio
+        # 解析度改變時只重新對應快取的頻譜，不重新計算
+        pitch_class_spectrum = st.radio("Spectrum", ["stft", "cqt"], horizontal=True,
+                                        format_func=str.upper,
+                                        index=["stft", "cqt"].index(st.session_state["2-Pitch"].get("pitch_class_spectrum", "stft")))
+        st.session_state["2-Pitch"]["pitch_class_spectrum"] = pitch_class_spectrum
         if st.session_state["use_plotly"]:
-            fig2_4, ax2_4, df_pitch_class = plot_pitch_class(y_sub, sr, resolution_ratio=resolution_ratio, use_plotly=True, return_data=True)
+            fig2_4, ax2_4, df_pitch_class = plot_pitch_class(y_sub, sr, resolution_ratio=resolution_ratio, use_plotly=True, return_data=True,
+                                                                 spectrum=pitch_class_spectrum)
             st.plotly_chart(fig2_4)
         else:
-            fig2_4, ax2_4, df_pitch_class = plot_pitch_class(y_sub, sr, resolution_ratio=resolution_ratio, use_plotly=False, return_data=True)
+            fig2_4, ax2_4, df_pitch_class = plot_pitch_class(y_sub, sr, resolution_ratio=resolution_ratio, use_plotly=False, return_data=True,
+                                                                 spectrum=pitch_class_spectrum)
             st.pyplot(fig2_4)
         st.write(df_pitch_class)
         
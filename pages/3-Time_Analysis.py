@@ -7,7 +7,8 @@ import numpy as np
 import librosa
 import pandas as pd
 from src.beat_track import onsets_detection, plot_onset_strength, beat_analysis, predominant_local_pulse, static_tempo_estimation, plot_tempogram, onset_click_plot, beat_plot, plot_bpm
-from src.st_helper import convert_df, get_shift, update_sessions, use_plotly, sengment_change_clean
+from src.st_helper import convert_df, get_shift, update_sessions, use_plotly, sengment_change_clean, get_rate_curve
+from src.audio_store import load_audio
 import numpy as np
 
 st.title('Time Analysis')
@@ -28,7 +29,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -61,7 +62,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -71,7 +73,7 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
             
     use_plotly()
@@ -129,11 +131,13 @@ if file is not None:
                                         help="If the size is 3, the onset ratio curve will be the average of every 3 seconds."
                                     )
         st.session_state["3-Time"]["onset_ma_window"] = onset_beat_window
+        # MA1~MA10一起算好，之後修改onset或換window只需增量更新
+        onset_rate_curve = get_rate_curve("onset", o_times[clicks])
         if st.session_state["use_plotly"]:
-            fig3_1c, ax3_1c = plot_bpm(o_times[clicks], shift_time, onset_beat_window, True, title="Onset Ratio Curve", ytitle="Onsets per minute")
+            fig3_1c, ax3_1c = plot_bpm(o_times[clicks], shift_time, onset_beat_window, True, title="Onset Ratio Curve", ytitle="Onsets per minute", rate_curve=onset_rate_curve)
             st.plotly_chart(fig3_1c)
         else:
-            fig3_1c, ax3_1c = plot_bpm(o_times[clicks], shift_time, onset_beat_window, False, title="Onset Ratio Curve", ytitle="Onsets per minute")
+            fig3_1c, ax3_1c = plot_bpm(o_times[clicks], shift_time, onset_beat_window, False, title="Onset Ratio Curve", ytitle="Onsets per minute", rate_curve=onset_rate_curve)
             st.pyplot(fig3_1c)
         # 下載onset data
         st.markdown("#### Onset Data")
@@ -182,10 +186,17 @@ if file is not None:
         # 計算beat
         spec_type = st.selectbox("spec_type", ["mel", "stft"])
         spec_hop_length = st.number_input("spec_hop_length", value=512)
+        # 只用打擊樂成分追蹤beat(HPSS遮罩有快取，與Timbre頁共用)
+        beat_percussive = st.checkbox("Percussive part only (HPSS)",
+                                      value=st.session_state["3-Time"].get("beat_percussive", False))
+        if beat_percussive != st.session_state["3-Time"].get("beat_percussive", False):
+            st.session_state["3-Time"]["beat_percussive"] = beat_percussive
+            st.session_state["3-Time"]["beat_frames"] = []
         fig3_3a, ax3_3b, beats_data = beat_analysis(y_sub, sr,
             spec_type=spec_type,
             spec_hop_length=spec_hop_length,
-            shift_array=shift_array
+            shift_array=shift_array,
+            component="percussive" if beat_percussive else None,
         )
         b_times, b_env, b_tempo, b_beats = beats_data
         st.pyplot(fig3_3a)
@@ -210,11 +221,12 @@ if file is not None:
                                 help="If the size is 3, the beat ratio curve will be the average of every 3 seconds."
         )
         st.session_state["3-Time"]["beat_ma_window"] = beat_window
+        beat_rate_curve = get_rate_curve("beat", b_times[b_clicks])
         if st.session_state["use_plotly"]:
-            fig3_3c, ax3_3c = plot_bpm(b_times[b_clicks], shift_time, beat_window, True,  ytitle="Beats per minute")
+            fig3_3c, ax3_3c = plot_bpm(b_times[b_clicks], shift_time, beat_window, True,  ytitle="Beats per minute", rate_curve=beat_rate_curve)
             st.plotly_chart(fig3_3c)
         else:
-            fig3_3c, ax3_3c = plot_bpm(b_times[b_clicks], shift_time, beat_window, False,  ytitle="Beats per minute")
+            fig3_3c, ax3_3c = plot_bpm(b_times[b_clicks], shift_time, beat_window, False,  ytitle="Beats per minute", rate_curve=beat_rate_curve)
             st.pyplot(fig3_3c)
         # 下載beat data
         st.markdown("#### Beat Data")
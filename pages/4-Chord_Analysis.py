@@ -8,12 +8,18 @@ import librosa
 import pandas as pd
 import seaborn as sns
 from src.st_helper import convert_df, get_shift, update_sessions
+from src.audio_store import load_audio
 from src.chord_recognition import (
+    CHORD_LABELS,
+    ChordSegments,
     plot_chord_recognition,
     plot_binary_template_chord_recognition,
     chord_table,
     compute_chromagram,
+    chord_recognition_hmm,
     chord_recognition_template,
+    get_beat_bounds,
+    recognize_chords,
     plot_chord,
     plot_user_chord
 )
@@ -36,7 +42,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -70,7 +76,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -80,48 +87,116 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
 
 #%%
 if file is not None:
 
+    # 只用和聲成分計算chroma，減少鼓聲的影響
+    hpss_harmonic = st.checkbox("Harmonic part only (HPSS)",
+                                value=st.session_state["4-Chord"].get("hpss_harmonic", False))
+    st.session_state["4-Chord"]["hpss_harmonic"] = hpss_harmonic
     tab1, tab2, tab3 = st.tabs(["STFT Chroma", "Chords Result (Default)", "Chords Result (User)"])
     shift_time, shift_array = get_shift(start_time, end_time) # shift_array為y_sub的時間刻度
     
     # STFT Chroma 
     with tab1:
-        chroma, _, _, _, duration = compute_chromagram(y_sub, sr)
+        chroma, Fs_X, _, Fs, duration = compute_chromagram(y_sub, sr, component="harmonic" if hpss_harmonic else None)
         fig4_1, ax4_1 = plot_chord(chroma, "STFT Chroma", shift_time=shift_time)
         st.pyplot(fig4_1)
         
     with tab2:
-        _, chord_max = chord_recognition_template(chroma, norm_sim='max')
+        # HMM平滑，避免和弦在相鄰frame間來回跳動
+        hmm_smoothing = st.checkbox("Smooth chords (HMM)",
+                                    value=st.session_state["4-Chord"].get("hmm_smoothing", True))
+        st.session_state["4-Chord"]["hmm_smoothing"] = hmm_smoothing
+        if hmm_smoothing:
+            self_transition = st.slider("Self-transition probability",
+                                        min_value=0.5, max_value=0.999,
+                                        value=st.session_state["4-Chord"].get("self_transition", 0.9),
+                                        step=0.001, format="%.3f",
+                                        help="Probability of keeping the same chord in the next frame. Higher values give longer chords.")
+            st.session_state["4-Chord"]["self_transition"] = self_transition
+        # 每個beat一個和弦：chroma先依beat聚合，辨識的frame數少很多
+        beat_synchronous = st.checkbox("One chord per beat",
+                                       value=st.session_state["4-Chord"].get("beat_synchronous", False),
+                                       help="Pool the chroma of every beat (from the beat tracker) before recognizing the chords.")
+        st.session_state["4-Chord"]["beat_synchronous"] = beat_synchronous
+        if beat_synchronous:
+            aggregate = st.radio("Beat pooling", ["median", "mean"], horizontal=True,
+                                 index=["median", "mean"].index(st.session_state["4-Chord"].get("beat_aggregate", "median")))
+            st.session_state["4-Chord"]["beat_aggregate"] = aggregate
+        # 與Time頁的節拍一致(可只用打擊部分)
+        beat_component = "percussive" if st.session_state["3-Time"].get("beat_percussive", False) else None
+        beat_bounds = None
+        if beat_synchronous:
+            beat_bounds = get_beat_bounds(y_sub, sr, chroma.shape[1], hop_length=int(round(Fs / Fs_X)), feature_sr=Fs,
+                                          component=beat_component)
+        _, chord_max = recognize_chords(chroma,
+                                        self_prob=st.session_state["4-Chord"].get("self_transition", 0.9) if hmm_smoothing else None,
+                                        beat_bounds=beat_bounds,
+                                        aggregate=st.session_state["4-Chord"].get("beat_aggregate", "median"))
+        # 設定改變時重新產生預設的和弦表
+        chord_settings = (hmm_smoothing, st.session_state["4-Chord"].get("self_transition", 0.9),
+                          beat_synchronous, st.session_state["4-Chord"].get("beat_aggregate", "median"),
+                          hpss_harmonic, beat_component)
+        if st.session_state["4-Chord"].get("chord_settings") != chord_settings:
+            st.session_state["4-Chord"]["chord_settings"] = chord_settings
+            st.session_state["4-Chord"]["chord_df_ready"] = False
         fig4_2, ax4_2 = plot_chord(chord_max, "Chord Recognition Result", cmap="crest", include_minor=True, shift_time=shift_time)
         st.pyplot(fig4_2)
         sec_per_frame = duration/chroma.shape[1]
-        chord_results_df = pd.DataFrame({
-            "Frame": np.arange(chroma.shape[1]),
-            "Time(s)": np.arange(chroma.shape[1])*sec_per_frame + shift_time,
-            "Chord": chord_table(chord_max)
-        })
+        chord_segments = ChordSegments.from_chord_max(chord_max)
+        st.download_button(
+            label="Download chord segments",
+            data=convert_df(chord_segments.to_dataframe(sec_per_frame, shift_time)),
+            file_name="chord_segments.csv",
+        )
         if st.session_state["4-Chord"]["chord_df_ready"] == False:
-            st.session_state["4-Chord"]["chord_df"] = chord_results_df.copy()
-            st.session_state["4-Chord"]["chord_df_modified"] = chord_results_df.copy()
+            st.session_state["4-Chord"]["chord_segments"] = chord_segments
+            st.session_state["4-Chord"]["chord_segments_modified"] = chord_segments
+            st.session_state["4-Chord"]["chord_editor_version"] = st.session_state["4-Chord"].get("chord_editor_version", 0) + 1
             st.session_state["4-Chord"]["chord_df_ready"] = True
     
     with tab3:
-        # 建立chord result dataframe
+        chord_store = st.session_state["4-Chord"]
+        # 以segment(開始時間、和弦)編輯，而不是每個frame一列
         if st.button("Reset"):
-            st.session_state["4-Chord"]["chord_df_modified"] = st.session_state["4-Chord"]["chord_df"].copy()
+            chord_store["chord_segments_modified"] = chord_store["chord_segments"]
+            chord_store["chord_editor_version"] = chord_store.get("chord_editor_version", 0) + 1
+        editor_key = f"chord_segment_editor_{chord_store.get('chord_editor_version', 0)}"
+        if editor_key not in st.session_state:
+            # 編輯器第一次出現(或離開頁面後回來)：以目前的結果為基礎，之後的修改由編輯器自己保存
+            chord_store["chord_segments_base"] = chord_store["chord_segments_modified"]
+        base_segments = chord_store["chord_segments_base"]
         
-        st.session_state["4-Chord"]["chord_df_modified"] = st.data_editor(
-            st.session_state["4-Chord"]["chord_df_modified"],
-            use_container_width=True
+        edited_df = st.data_editor(
+            base_segments.to_dataframe(sec_per_frame, shift_time)[["Start(s)", "End(s)", "Chord"]],
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "Start(s)": st.column_config.NumberColumn("Start(s)", min_value=float(shift_time), format="%.2f", required=True),
+                "End(s)": st.column_config.NumberColumn("End(s)", format="%.2f", disabled=True,
+                                                        help="The next segment starts here. Add a row to split a segment, delete one to merge it."),
+                "Chord": st.column_config.SelectboxColumn("Chord", options=CHORD_LABELS, required=True),
+            },
+            key=editor_key,
         )
+        previous_segments = chord_store["chord_segments_modified"]
+        user_segments = ChordSegments.from_table(edited_df, sec_per_frame, base_segments.n_frames, shift_time)
+        chord_store["chord_segments_modified"] = user_segments
         
-        fig4_1b, ax4_1b = plot_user_chord(st.session_state["4-Chord"]["chord_df_modified"])
+        # 以segment畫圖，成本只與segment數量有關，每次重新執行都重畫，畫完就關掉figure
+        changed = previous_segments.changed_span(user_segments)
+        if changed is not None:
+            st.caption(f"Last edit: {changed[0]*sec_per_frame + shift_time:.2f}s ~ {changed[1]*sec_per_frame + shift_time:.2f}s")
+        fig4_1b, ax4_1b = plot_user_chord(user_segments, shift_time=shift_time)
         st.pyplot(fig4_1b)
-
-
-
+        plt.close(fig4_1b)
+        st.download_button(
+            label="Download chord segments",
+            data=convert_df(user_segments.to_dataframe(sec_per_frame, shift_time)),
+            file_name="chord_segments_user.csv",
+            key="download_user_segments",
+        )
@@ -7,8 +7,12 @@ import numpy as np
 import librosa
 import pandas as pd
 from src.st_helper import convert_df, get_shift, update_sessions
+from src.audio_store import load_audio
 from src.structure_analysis import (
-    plot_self_similarity
+    plot_self_similarity,
+    plot_novelty,
+    plot_ssm_novelty,
+    get_ssm_feature,
 )
 
 st.title("Structure analysis")
@@ -29,7 +33,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -63,7 +67,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -73,7 +78,7 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
 
 #%%
@@ -82,5 +87,62 @@ if file is not None:
     st.subheader("Self-similarity matrix")
     affinity = st.checkbox("Affinity", value=False)
     self_similarity_hop_length = st.number_input("Self similarity hop length", value=1024)
-    fig5_1, ax5_1 = plot_self_similarity(y_sub, sr, affinity=affinity, hop_length=self_similarity_hop_length)
+    # 每個beat一欄：矩陣邊長約少10~40倍
+    beat_synchronous = st.checkbox("Beat-synchronous", value=False,
+                                   help="Pool the features of every beat (from the beat tracker) into one row/column.")
+    beat_aggregate = "median"
+    # 與Time頁的節拍一致(可只用打擊部分)
+    beat_component = "percussive" if st.session_state["3-Time"].get("beat_percussive", False) else None
+    if beat_synchronous:
+        beat_aggregate = st.radio("Beat pooling", ["median", "mean"], horizontal=True)
+        _, beat_bounds = get_ssm_feature(y_sub, sr, self_similarity_hop_length, True, beat_aggregate, beat_component)
+        seconds_per_column = float(np.median(np.diff(beat_bounds))) * self_similarity_hop_length / sr
+    else:
+        seconds_per_column = self_similarity_hop_length / sr
+    # 長的音檔使用稀疏矩陣，記憶體不會隨長度平方成長
+    ssm_mode = st.selectbox(
+        "Matrix",
+        ["dense", "band", "knn"],
+        format_func=lambda m: {"dense": "Dense", "band": "Sparse: diagonal band", "knn": "Sparse: k nearest neighbours"}[m],
+    )
+    ssm_bandwidth, ssm_k, ssm_mutual = 256, 5, False
+    if ssm_mode == "band":
+        band_seconds = st.number_input("Band width (s)", value=30.0, min_value=1.0, step=5.0)
+        ssm_bandwidth = max(1, int(band_seconds / seconds_per_column))
+    elif ssm_mode == "knn":
+        ssm_k = st.number_input("Neighbours per frame (k)", value=5, min_value=1, max_value=100, step=1)
+        ssm_mutual = st.checkbox("Mutual neighbours only", value=False,
+                                 help="Link two frames only if each is among the other's k nearest (as librosa).")
+    if ssm_mode != "dense":
+        st.caption("Sparse matrices hold raw cosine similarities, not the dense affinity, "
+                   "so their matrices and novelty curves differ from the dense ones.")
+    fig5_1, ax5_1 = plot_self_similarity(y_sub, sr, affinity=affinity, hop_length=self_similarity_hop_length,
+                                         mode=ssm_mode, bandwidth=ssm_bandwidth, k=ssm_k,
+                                         beat_synchronous=beat_synchronous, aggregate=beat_aggregate,
+                                         mutual=ssm_mutual, beat_component=beat_component)
     st.pyplot(fig5_1)
+
+    st.subheader("Novelty")
+    novelty_L = st.number_input(f"Kernel size L ({'beats' if beat_synchronous else 'frames'})",
+                                value=10, min_value=1, max_value=200, step=1)
+    if ssm_mode == "band" and ssm_bandwidth < 2 * novelty_L:
+        st.warning("Band width is smaller than 2L, the novelty curve differs from that of the full cosine matrix.", icon="⚠️")
+    fig5_2, ax5_2, novelty = plot_novelty(y_sub, sr, L=novelty_L, hop_length=self_similarity_hop_length,
+                                          mode=ssm_mode, bandwidth=ssm_bandwidth, k=ssm_k,
+                                          shift_time=start_time, beat_synchronous=beat_synchronous,
+                                          aggregate=beat_aggregate, mutual=ssm_mutual, beat_component=beat_component)
+    st.pyplot(fig5_2)
+    df_novelty = pd.DataFrame({"Time(s)": novelty.times + start_time, "Novelty": novelty.novelty})
+    st.download_button(
+        label="Download novelty",
+        data=convert_df(df_novelty),
+        file_name="novelty.csv",
+    )
+
+    st.subheader("Multi-scale novelty")
+    if st.checkbox("Compare chroma SSMs and kernel sizes", value=False):
+        # 兩組平滑/降採樣參數共用同一份chroma
+        ssm_figs, fig5_3, ax5_3, ssms, novelties = plot_ssm_novelty(y_sub, sr)
+        for col, fig_ssm in zip(st.columns(len(ssm_figs)), ssm_figs):
+            col.pyplot(fig_ssm)
+        st.pyplot(fig5_3)
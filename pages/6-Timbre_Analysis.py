@@ -7,10 +7,14 @@ import numpy as np
 import librosa
 import pandas as pd
 from src.st_helper import convert_df, get_shift, update_sessions
+from src.audio_store import load_audio
+from src.analysis import compute_timbre
 from src.timbre_analysis import (
+    DESCRIPTOR_TITLES,
     spectral_centroid_analysis,
     rolloff_frequency_analysis,
     spectral_bandwidth_analysis,
+    timbre_descriptor_analysis,
     harmonic_percussive_source_separation
 )
 
@@ -32,7 +36,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -66,7 +70,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -76,20 +81,29 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
 
 #%%
 if file is not None:
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Spectral Centroid", "Rolloff Frequency", "Spectral Bandwidth", "Harmonic Percussive Source Separation"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Spectral Centroid", "Rolloff Frequency", "Spectral Bandwidth",
+                                            "Other Descriptors", "Harmonic Percussive Source Separation"])
 
     shift_time, shift_array = get_shift(start_time, end_time) # shift_array為y_sub的時間刻度
 
+    # 所有音色特徵從同一個頻譜一次算完，rolloff的百分比不論選幾個都只做一次累積和
+    with tab2:
+        st.subheader("Rolloff Frequency Analysis")
+        roll_percents = st.multiselect("Select rolloff frequency", [0.85, 0.90, 0.95, 0.99], default=[0.99])
+        if not roll_percents:
+            roll_percents = [0.99]
+    timbre = compute_timbre(y_sub, sr, roll_percents=roll_percents + [0.01])
+
     # spectral_centroid_analysis
     with tab1:
         st.subheader("Spectral Centroid Analysis")
-        fig6_1, ax6_1, centroid_value = spectral_centroid_analysis(y_sub, sr, shift_array)
+        fig6_1, ax6_1, centroid_value = spectral_centroid_analysis(y_sub, sr, shift_array, timbre=timbre)
         st.pyplot(fig6_1)
         
         df_centroid = pd.DataFrame(centroid_value.T, columns=["Time(s)", "Centroid"])
@@ -104,11 +118,10 @@ if file is not None:
 
     # rolloff_frequency_analysis
     with tab2:
-        st.subheader("Rolloff Frequency Analysis")
-        roll_percent = st.selectbox("Select rolloff frequency", [0.90, 0.95, 0.99])
-        fig6_2, ax6_2, rolloff_value = rolloff_frequency_analysis(y_sub, sr, roll_percent=roll_percent, shift_array=shift_array)
+        fig6_2, ax6_2, rolloff_value = rolloff_frequency_analysis(y_sub, sr, roll_percent=roll_percents,
+                                                                  shift_array=shift_array, timbre=timbre)
         st.pyplot(fig6_2)
-        df_rolloff = pd.DataFrame(rolloff_value.T, columns=["Time(s)", "Rolloff", "Rolloff_min"])
+        df_rolloff = pd.DataFrame(rolloff_value.T, columns=["Time(s)"] + [f"Rolloff({p})" for p in roll_percents] + ["Rolloff_min"])
         df_rolloff["Time(s)"] = df_rolloff["Time(s)"] + shift_time
         st.dataframe(df_rolloff, use_container_width=True)
         st.download_button(
@@ -121,7 +134,7 @@ if file is not None:
     # spectral_bandwidth_analysis
     with tab3:
         st.subheader("Spectral Bandwidth Analysis")
-        fig6_3, ax6_3, bandwidth_value = spectral_bandwidth_analysis(y_sub, sr, shift_array)
+        fig6_3, ax6_3, bandwidth_value = spectral_bandwidth_analysis(y_sub, sr, shift_array, timbre=timbre)
         st.pyplot(fig6_3)
         df_bandwidth = pd.DataFrame(bandwidth_value.T, columns=["Time(s)", "Bandwidth"])
         df_bandwidth["Time(s)"] = df_bandwidth["Time(s)"] + shift_time
@@ -133,10 +146,34 @@ if file is not None:
             mime="text/csv",
         )
 
-    # harmonic_percussive_source_separation
+    # flatness, contrast, zero-crossing rate, MFCC
     with tab4:
+        st.subheader("Other Timbre Descriptors")
+        descriptor = st.selectbox("Select descriptor", list(DESCRIPTOR_TITLES), format_func=DESCRIPTOR_TITLES.get)
+        fig6_5, ax6_5, descriptor_value = timbre_descriptor_analysis(y_sub, sr, descriptor, shift_array, timbre=timbre)
+        st.pyplot(fig6_5)
+        if descriptor_value.shape[0] == 2:
+            columns = ["Time(s)", DESCRIPTOR_TITLES[descriptor]]
+        else:
+            columns = ["Time(s)"] + [f"{descriptor}_{i}" for i in range(descriptor_value.shape[0] - 1)]
+        df_descriptor = pd.DataFrame(descriptor_value.T, columns=columns)
+        df_descriptor["Time(s)"] = df_descriptor["Time(s)"] + shift_time
+        st.dataframe(df_descriptor, use_container_width=True)
+        st.download_button(
+            label=f"Download {DESCRIPTOR_TITLES[descriptor].lower()} data",
+            data=convert_df(df_descriptor),
+            file_name=f"{descriptor}.csv",
+            mime="text/csv",
+        )
+
+    # harmonic_percussive_source_separation
+    with tab5:
         st.subheader("Harmonic Percussive Source Separation")
-        fig6_4, ax6_4, (Harmonic_data) = harmonic_percussive_source_separation(y_sub, sr, shift_array)
+        hpss_downsample = st.select_slider("Mask resolution", options=[1, 2, 3],
+                                           format_func=lambda f: "Full (exact)" if f == 1 else f"1/{f} (faster)",
+                                           help="Compute the harmonic/percussive masks on a downsampled spectrogram.")
+        fig6_4, ax6_4, (Harmonic_data) = harmonic_percussive_source_separation(y_sub, sr, shift_array,
+                                                                               downsample=hpss_downsample)
         D, H, P, t = Harmonic_data
         st.pyplot(fig6_4)
 
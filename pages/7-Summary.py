@@ -5,14 +5,19 @@ import matplotlib.pyplot as plt
 import numpy as np
 import librosa
 import pandas as pd
-from src.st_helper import convert_df, get_shift, update_sessions, warning_region
+from src.st_helper import convert_df, get_shift, update_sessions, warning_region, get_rate_curve
+from src.audio_store import load_audio
 from src.basic_info import plot_waveform, signal_RMS_analysis, plot_spectrogram
 from src.chord_recognition import (
+    ChordSegments,
     plot_chord_recognition,
     plot_binary_template_chord_recognition,
     chord_table,
     compute_chromagram,
+    chord_recognition_hmm,
     chord_recognition_template,
+    get_beat_bounds,
+    recognize_chords,
     plot_chord,
     plot_user_chord,
     plot_chord_block,
@@ -48,7 +53,7 @@ with st.expander("上傳檔案(Upload Files)"):
         st.write(f"File size: `{file.size}`")
 
         # 載入音檔
-        y, sr = librosa.load(file, sr=22050)
+        y, sr = load_audio(file, sr=22050)
         st.write(f"Sample rate: `{sr}`")
         duration = float(np.round(len(y)/sr-0.005, 2)) # 時間長度，取小數點後2位，向下取整避免超過音檔長度
         st.write(f"Duration(s): `{duration}`")
@@ -85,7 +90,8 @@ if file is not None:
         start_time = 0.0
         end_index = duration
     # 根據選擇的聲音片段，取出聲音資料
-    start_index = int(start_time*sr)
+    start_index = int(start_time*sr) // 512 * 512 # 對齊hop(512)，片段的頻譜可直接從整首歌的快取切出
+    start_time = start_index / sr # 對齊後實際的開始時間，圖表、標籤與匯出的時間都以此為準
     end_index = int(end_time*sr)
     if end_index <= start_index:
         st.sidebar.warning("結束時間必須大於開始時間", icon="⚠️")
@@ -95,7 +101,7 @@ if file is not None:
     
     if use_segment: 
         with st.expander("聲音片段(Segment of the audio)"):
-            st.write(f"Selected segment: `{start_time}` ~ `{end_time}`, duration: `{end_time-start_time}`")
+            st.write(f"Selected segment: `{start_time:.3f}` ~ `{end_time}`, duration: `{end_time-start_time:.3f}`")
             st.audio(y_sub, format=file.type, sample_rate=sr)
     
     
@@ -123,22 +129,27 @@ if file is not None:
         
         
         # 取得和弦資料
-        if "chord_df_modified" in st.session_state["4-Chord"]:
-            chord_results_df = st.session_state["4-Chord"]["chord_df_modified"].copy()
+        if st.session_state["4-Chord"].get("chord_segments_modified") is not None:
+            chord_segments = st.session_state["4-Chord"]["chord_segments_modified"]
         else:
-            chroma, _, _, _, duration = compute_chromagram(y_sub, sr)
-            _, chord_max = chord_recognition_template(chroma, norm_sim='max')
-            sec_per_frame = duration/chroma.shape[1]
-            chord_results_df = pd.DataFrame({
-                "Frame": np.arange(chroma.shape[1]),
-                "Time(s)": np.arange(chroma.shape[1])*sec_per_frame + shift_time,
-                "Chord": chord_table(chord_max)
-            })
+            chord_store = st.session_state["4-Chord"]
+            chroma, Fs_X, _, Fs, duration = compute_chromagram(y_sub, sr,
+                                                               component="harmonic" if chord_store.get("hpss_harmonic", False) else None)
+            beat_bounds = None
+            if chord_store.get("beat_synchronous", False):
+                beat_bounds = get_beat_bounds(y_sub, sr, chroma.shape[1], hop_length=int(round(Fs / Fs_X)), feature_sr=Fs,
+                                              component="percussive" if st.session_state["3-Time"].get("beat_percussive", False) else None)
+            _, chord_max = recognize_chords(chroma,
+                                            self_prob=chord_store.get("self_transition", 0.9) if chord_store.get("hmm_smoothing", True) else None,
+                                            beat_bounds=beat_bounds,
+                                            aggregate=chord_store.get("beat_aggregate", "median"))
+            chord_segments = ChordSegments.from_chord_max(chord_max)
 
         # 繪製波形、頻譜、和弦
         plot_waveform(x_sub, y_sub, shift_time=shift_time, use_plotly=False, ax=ax_wave, xlabel='')
-        plot_mel_spectrogram(y_sub, sr, shift_array, with_pitch, ax=ax_spec, show_colorbar=False, xlabel='')
-        plot_chord_block(chord_results_df, shift_time, ax=ax_chord)
+        plot_mel_spectrogram(y_sub, sr, shift_array, with_pitch, ax=ax_spec, show_colorbar=False, xlabel='',
+                             f0_backend=st.session_state["2-Pitch"].get("f0_backend", "pyin"))
+        plot_chord_block(chord_segments, shift_time, ax=ax_chord)
         
         # 繪製速度
         if beats_mode == "Onset":
@@ -154,12 +165,14 @@ if file is not None:
                 use_plotly=False, 
                 ax=ax_bpm,
                 title="Onset Rate Curve",
-                ytitle="Onsets / min"
+                ytitle="Onsets / min",
+                rate_curve=get_rate_curve("onset", o_times[st.session_state["3-Time"]["onset_frames"]]),
             )
             ax_beat.set_title("Onset")
             
         else:
-            _, _, beats_data = beat_analysis(y_sub, sr)
+            _, _, beats_data = beat_analysis(y_sub, sr,
+                                             component="percussive" if st.session_state["3-Time"].get("beat_percussive", False) else None)
             b_times, b_env, b_tempo, b_beats = beats_data
             if st.session_state["3-Time"]["beat_frames"] == []:
                 st.session_state["3-Time"]["beat_frames"] = list(b_beats)
@@ -180,7 +193,8 @@ if file is not None:
                 use_plotly=False, 
                 ax=ax_bpm,
                 title="Beat Rate Curve",
-                ytitle="Beats / min"
+                ytitle="Beats / min",
+                rate_curve=get_rate_curve("beat", b_times[st.session_state["3-Time"]["beat_frames"]]),
             )
             ax_beat.set_title("Beat")
         ax_beat.set_xlabel("")
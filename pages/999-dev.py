@@ -16,7 +16,42 @@ with st.expander("Show memory usage"):
     mem_info = process.memory_info()
     print(f"Memory usage: {mem_info.rss / 1024 / 1024:.2f} MB")
     st.write(f"Memory usage: {mem_info.rss / 1024 / 1024:.2f} MB")
-    
+
+from src.audio_store import audio_cache_stats
+from src.features import feature_cache_stats
+from src.disk_cache import disk_cache
+
+with st.expander("Show cache usage"):
+    st.write("Decoded audio", audio_cache_stats())
+    st.write("Spectral features", feature_cache_stats())
+    st.write("Disk cache", disk_cache.stats())
+    if st.button("Clear disk cache"):
+        disk_cache.clear()
+
+from src.f0 import compare_f0_backends, synthetic_melody
+
+with st.expander("Compare f0 methods"):
+    f0_file = st.file_uploader("Audio (leave empty to use a synthetic melody)", type=["mp3", "wav", "ogg"])
+    if st.button("Run comparison"):
+        with st.spinner("Running..."):
+            if f0_file is None:
+                y_f0, f0_true = synthetic_melody()
+                st.write("Synthetic melody, scored against the true f0")
+                st.dataframe(compare_f0_backends(y_f0, 22050, reference=f0_true))
+            else:
+                from src.audio_store import load_audio
+                y_f0, sr_f0 = load_audio(f0_file, sr=22050)
+                st.write("Scored against librosa.pyin")
+                st.dataframe(compare_f0_backends(y_f0, sr_f0))
+
+from src.analysis import benchmark_hpss
+
+with st.expander("Compare HPSS implementations"):
+    st.write("Masks of src.hpss vs. librosa.decompose.hpss on noise with clicks (downsample 1 is exact)")
+    if st.button("Run HPSS benchmark"):
+        with st.spinner("Running..."):
+            st.dataframe(benchmark_hpss())
+
     
 st.session_state["use_plotly"] = st.checkbox("Use plotly", value=st.session_state["use_plotly"])
 st.session_state["debug"] = st.checkbox("Debug", value=st.session_state["debug"])
@@ -0,0 +1,1827 @@
+"""
+Compute layer of the analyses.
+
+Every `compute_*` function returns a small result object holding the arrays
+and their time axes, and the `plot_*` functions in the other `src` modules
+render from these objects. This module must stay importable without
+streamlit, matplotlib, plotly or seaborn, so that the analyses can run in
+batch jobs.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import librosa
+import numpy as np
+import scipy.signal
+import scipy.sparse
+import scipy.stats
+from numba import jit
+from numpy import typing as npt
+
+from src import hpss
+from src.features import (
+    cached_feature,
+    get_chroma,
+    get_cqt,
+    get_component_magnitude,
+    get_db,
+    get_hpss_masks,
+    get_magnitude,
+    get_mel_db,
+    get_onset_strength,
+    get_power,
+    get_stft,
+    get_tuning_pitches,
+)
+from src.f0 import estimate_f0
+from src import ssm
+from src import timbre
+
+CHROMA_LABELS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+CHORD_LABELS = CHROMA_LABELS + [s + 'm' for s in CHROMA_LABELS]
+
+
+#%% Basic information
+@dataclass
+class RMSResult:
+    times: np.ndarray
+    rms: np.ndarray  # shape=(1, n_frames)
+
+
+@dataclass
+class SpectrogramResult:
+    S_db: np.ndarray
+    times: np.ndarray
+    frequencies: np.ndarray
+
+
+def compute_rms(y: npt.ArrayLike, sr: int = 22050) -> RMSResult:
+    rms = librosa.feature.rms(y=y)
+    times = librosa.times_like(rms, sr=sr)
+    return RMSResult(times, rms)
+
+
+def compute_spectrogram(y: npt.ArrayLike, sr: int) -> SpectrogramResult:
+    S_db = get_db(y)
+    times = librosa.times_like(S_db, sr=sr)
+    frequencies = librosa.fft_frequencies(sr=sr)
+    return SpectrogramResult(S_db, times, frequencies)
+
+
+#%% Pitch
+@dataclass
+class MelSpectrogramResult:
+    S_db: np.ndarray
+    times: Optional[np.ndarray] = None  # f0的時間軸
+    f0: Optional[np.ndarray] = None
+    voiced_flag: Optional[np.ndarray] = None
+    voiced_probs: Optional[np.ndarray] = None
+
+
+@dataclass
+class ChromaResult:
+    chroma: np.ndarray
+    times: np.ndarray
+
+
+@dataclass
+class PitchClassResult:
+    probs: np.ndarray  # shape=(12*resolution_ratio,)
+    resolution_ratio: int
+
+    @property
+    def note_positions(self) -> np.ndarray:
+        """Boolean mask of the bins centered on the 12 notes."""
+        unit_pos = np.zeros(self.resolution_ratio, dtype=bool)
+        unit_pos[self.resolution_ratio // 2] = True
+        return np.tile(unit_pos, 12)
+
+
+@dataclass
+class F0Result:
+    times: np.ndarray
+    f0: np.ndarray  # 無聲的frame為nan
+    voiced_flag: np.ndarray
+    voiced_probs: np.ndarray
+
+
+def compute_f0(y: npt.ArrayLike, sr: int, backend: str = "pyin") -> F0Result:
+    """
+    f0 between C2 and C7 with one of the backends of `src.f0.F0_BACKENDS`.
+    """
+    f0, voiced_flag, voiced_probs = estimate_f0(y, sr, backend=backend,
+                                                fmin=librosa.note_to_hz('C2'),
+                                                fmax=librosa.note_to_hz('C7'))
+    return F0Result(librosa.times_like(f0, sr=sr), f0, voiced_flag, voiced_probs)
+
+
+def compute_mel_spectrogram(y: npt.ArrayLike, sr: int, with_pitch: bool = True,
+                            f0_backend: str = "pyin") -> MelSpectrogramResult:
+    result = MelSpectrogramResult(get_mel_db(y, sr))
+    if with_pitch:
+        f0 = compute_f0(y, sr, backend=f0_backend)
+        result.times = f0.times
+        result.f0, result.voiced_flag, result.voiced_probs = f0.f0, f0.voiced_flag, f0.voiced_probs
+    return result
+
+
+def compute_cqt_db(y: npt.ArrayLike, sr: int) -> np.ndarray:
+    return librosa.amplitude_to_db(get_cqt(y, sr), ref=np.max)
+
+
+def compute_chroma(y: npt.ArrayLike, sr: int) -> ChromaResult:
+    chroma = get_chroma(y, sr)
+    return ChromaResult(chroma, librosa.times_like(chroma, sr=sr))
+
+
+PITCH_CLASS_SPECTRA = ("stft", "cqt")
+
+
+def pitch_class_filterbank(freqs: npt.ArrayLike, n_chroma: int, tuning: float = 0.0,
+                           dc: bool = False, shift: int = 0, width: float = 4.0) -> scipy.sparse.csr_matrix:
+    """
+    Sparse version of `librosa.filters.chroma` (norm=2, ctroct=5,
+    octwidth=2, base_c) for arbitrary bin frequencies `freqs`.
+
+    Every frequency bin spreads over the pitch classes with a Gaussian bump
+    as wide as the distance to the next bin; only the pitch classes within
+    `width` bump widths are kept, so the matrix has ~40·n_chroma non-zeros
+    instead of n_chroma·len(freqs). With `dc`, `freqs[0]` is the 0 Hz bin of
+    an STFT (treated as librosa does). Row `c` is moved to `c + shift`.
+
+    Returns the (n_chroma × len(freqs)) filter bank.
+    """
+    freqs = np.asarray(freqs, dtype=np.float64)
+    if dc:
+        # STFT：最後一個bin的寬度取到下一個(等距)頻率
+        freqs = np.append(freqs, 2 * freqs[-1] - freqs[-2])
+        frqbins = n_chroma * librosa.hz_to_octs(freqs[1:], tuning=tuning, bins_per_octave=n_chroma)
+        # 0 Hz：比第一個bin低1.5個八度(librosa的作法)
+        frqbins = np.concatenate(([frqbins[0] - 1.5 * n_chroma], frqbins))
+        binwidthbins = np.maximum(np.diff(frqbins), 1.0)
+        frqbins = frqbins[:-1]
+    else:
+        frqbins = n_chroma * librosa.hz_to_octs(freqs, tuning=tuning, bins_per_octave=n_chroma)
+        diffs = np.diff(frqbins)
+        binwidthbins = np.maximum(np.append(diffs, diffs[-1] if len(diffs) else 1.0), 1.0)
+
+    # 每個頻率bin只保留距離中心width個寬度內的pitch class
+    half = np.ceil(width * binwidthbins).astype(np.int64)
+    full = 2 * half + 1 >= n_chroma
+    counts = np.where(full, n_chroma, 2 * half + 1)
+    cols = np.repeat(np.arange(len(frqbins)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    first = np.where(full, 0, np.round(frqbins).astype(np.int64) - half)
+    rows = np.mod(np.repeat(first, counts) + offsets, n_chroma)
+
+    n_chroma2 = np.round(float(n_chroma) / 2)
+    D = np.remainder(frqbins[cols] - rows + n_chroma2 + 10 * n_chroma, n_chroma) - n_chroma2
+    wts = np.exp(-0.5 * (2 * D / binwidthbins[cols]) ** 2)
+    norms = np.sqrt(np.bincount(cols, weights=wts ** 2, minlength=len(frqbins)))
+    wts /= norms[cols]
+    wts *= np.exp(-0.5 * ((frqbins[cols] / n_chroma - 5.0) / 2.0) ** 2)
+    # base_c：以C為第0個bin
+    rows = np.mod(rows - 3 * (n_chroma // 12) + shift, n_chroma)
+    return scipy.sparse.csr_matrix((wts, (rows, cols)), shape=(n_chroma, len(frqbins)))
+
+
+def compute_pitch_class(y: npt.ArrayLike, sr: int, resolution_ratio: int = 1,
+                        spectrum: str = "stft") -> PitchClassResult:
+    """
+    Pitch-class histogram of `y` with `12 * resolution_ratio` bins.
+
+    The cached magnitude spectrum ("stft": `get_magnitude`, "cqt": the CQT
+    of the chroma features, 36 bins per octave with the estimated tuning,
+    its bin frequencies shifted accordingly) is mapped to fractional
+    pitch classes with `pitch_class_filterbank` (tuning estimated as
+    `librosa.feature.chroma_stft` does). A bin counts in a frame when its
+    energy is at least 1/√2 of the frame's maximum; the histogram is the
+    fraction of frames each bin counts in, normalized to sum 1. The bin of
+    note C is `resolution_ratio // 2`.
+
+    Changing the resolution only re-maps the cached spectrum.
+    """
+    if spectrum not in PITCH_CLASS_SPECTRA:
+        raise ValueError(f"Unsupported spectrum: {spectrum}")
+    n_chroma = 12 * resolution_ratio
+
+    def compute():
+        if spectrum == "stft":
+            S = get_magnitude(y)
+            freqs = librosa.fft_frequencies(sr=sr, n_fft=2 * (S.shape[0] - 1))
+        else:
+            # 與get_chroma(method="cqt")共用同一個CQT(tuning=None)：librosa.cqt把fmin
+            # 移到估計的tuning，這裡用同樣的估計(get_tuning_pitches, power=1)還原每個bin的頻率
+            S = get_cqt(y, sr, n_bins=7 * 36, bins_per_octave=36, tuning=None)
+            cqt_tuning = librosa.pitch_tuning(get_tuning_pitches(y, sr, power=1), bins_per_octave=36)
+            fmin = librosa.note_to_hz('C1') * 2.0 ** (cqt_tuning / 36)
+            freqs = librosa.cqt_frequencies(7 * 36, fmin=fmin, bins_per_octave=36)
+        tuning = librosa.pitch_tuning(get_tuning_pitches(y, sr, power=1), bins_per_octave=n_chroma)
+        fb = pitch_class_filterbank(freqs, n_chroma, tuning=tuning, dc=spectrum == "stft",
+                                    shift=resolution_ratio // 2)
+        chroma = np.asarray(fb.astype(S.dtype) @ S)
+        peak = chroma.max(axis=0)
+        active = (chroma >= peak / np.sqrt(2)) & (peak > np.finfo(np.float32).tiny)
+        note_probs = active.mean(axis=1)
+        total = note_probs.sum()
+        return note_probs / total if total > 0 else note_probs
+
+    note_probs = cached_feature(y, "pitch_class", (sr, resolution_ratio, spectrum), compute)
+    return PitchClassResult(note_probs, resolution_ratio)
+
+
+#%% Time
+@dataclass
+class OnsetResult:
+    envelope: np.ndarray
+    times: np.ndarray
+    onset_frames: np.ndarray
+
+
+@dataclass
+class OnsetStrengthResult:
+    times: np.ndarray
+    envelopes: Dict[str, np.ndarray] = field(default_factory=dict)  # label -> envelope
+
+
+@dataclass
+class BeatResult:
+    times: np.ndarray
+    envelope: np.ndarray
+    tempo: float
+    beats: np.ndarray
+
+
+@dataclass
+class PulseResult:
+    times: np.ndarray
+    pulse: np.ndarray
+    beats: np.ndarray
+
+
+@dataclass
+class StaticTempoResult:
+    tempo: float        # default prior
+    utempo: float       # uniform prior
+    freqs: np.ndarray
+    autocorrelation: np.ndarray
+
+
+@dataclass
+class TempogramResult:
+    tempogram: np.ndarray
+    tempo: float
+    kind: str
+    hop_length: int
+
+
+def compute_onsets(y: npt.ArrayLike, sr: int) -> OnsetResult:
+    o_env = get_onset_strength(y, sr)
+    times = librosa.times_like(o_env, sr=sr)
+    onset_frames = librosa.onset.onset_detect(onset_envelope=o_env, sr=sr)
+    return OnsetResult(o_env, times, onset_frames)
+
+
+def compute_onset_strengths(
+    y: npt.ArrayLike, sr: int,
+    standard: bool = True, custom_mel: bool = False, cqt: bool = False,
+) -> OnsetStrengthResult:
+    result = OnsetStrengthResult(librosa.times_like(get_magnitude(y), sr=sr))
+    if standard:
+        result.envelopes['Mean (mel)'] = get_onset_strength(y, sr)
+    if custom_mel:
+        result.envelopes['Median (custom mel)'] = get_onset_strength(y, sr, aggregate='median',
+                                                                     fmax=8000, n_mels=256)
+    if cqt:
+        result.envelopes['Mean (CQT)'] = get_onset_strength(y, sr, spectrum='cqt')
+    return result
+
+
+def compute_beats(y: npt.ArrayLike, sr: int, hop_length: int = 512, component: Optional[str] = None) -> BeatResult:
+    """
+    Beat tracking on the median onset strength of `y`, or of its HPSS
+    component (e.g. component="percussive", see `get_component_magnitude`).
+    """
+    onset_env = get_onset_strength(y, sr, aggregate='median', hop_length=hop_length, component=component)
+    tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+    times = librosa.times_like(onset_env, sr=sr, hop_length=hop_length)
+    return BeatResult(times, onset_env, tempo, beats)
+
+
+def compute_plp(y: npt.ArrayLike, sr: int) -> PulseResult:
+    onset_env = get_onset_strength(y, sr)
+    pulse = librosa.beat.plp(onset_envelope=onset_env, sr=sr)
+    beats_plp = np.flatnonzero(librosa.util.localmax(pulse))
+    times = librosa.times_like(pulse, sr=sr)
+    return PulseResult(times, pulse, beats_plp)
+
+
+def compute_static_tempo(y: npt.ArrayLike, sr: int, hop_length: int = 512) -> StaticTempoResult:
+    onset_env = get_onset_strength(y, sr)
+    tempo = librosa.beat.tempo(onset_envelope=onset_env, sr=sr)
+
+    # Static tempo estimation
+    prior = scipy.stats.uniform(30, 300)  # uniform over 30-300 BPM
+    utempo = librosa.beat.tempo(onset_envelope=onset_env, sr=sr, prior=prior)
+
+    ac = librosa.autocorrelate(onset_env, max_size=2 * sr // hop_length)
+    freqs = librosa.tempo_frequencies(len(ac), sr=sr, hop_length=hop_length)
+    return StaticTempoResult(tempo.item(), utempo.item(), freqs, ac)
+
+
+def compute_tempogram(y: npt.ArrayLike, sr: int, kind: str = 'autocorr', hop_length: int = 512) -> TempogramResult:
+    oenv = get_onset_strength(y, sr, hop_length=hop_length)
+    tempo = librosa.beat.tempo(onset_envelope=oenv, sr=sr, hop_length=hop_length)[0]
+    if kind == 'fourier':
+        tempogram = np.abs(librosa.feature.fourier_tempogram(onset_envelope=oenv, sr=sr, hop_length=hop_length))
+    elif kind == 'autocorr':
+        tempogram = librosa.feature.tempogram(onset_envelope=oenv, sr=sr, hop_length=hop_length, norm=None)
+    else:
+        raise ValueError(f"Unsupported tempogram type: {kind}")
+    return TempogramResult(tempogram, tempo, kind, hop_length)
+
+
+def get_beat_frames(y: npt.ArrayLike, sr: int, hop_length: int = 512,
+                    component: Optional[str] = None) -> np.ndarray:
+    """The beat frames of `compute_beats` (cached), e.g. of the percussive part with component="percussive"."""
+    def compute():
+        onset_env = get_onset_strength(y, sr, aggregate='median', hop_length=hop_length, component=component)
+        return librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)[1]
+
+    params = (sr, hop_length) + ((component,) if component is not None else ())
+    return cached_feature(y, "beat_frames", params, compute, persist=True)
+
+
+def get_beat_bounds(y: npt.ArrayLike, sr: int, n_frames: int, hop_length: int,
+                    feature_sr: Optional[float] = None, component: Optional[str] = None) -> np.ndarray:
+    """
+    Beat boundaries of `y` in the frames of a feature with `n_frames`
+    frames, hop `hop_length` and sampling rate `feature_sr` (default `sr`):
+    0, the (distinct) frames closest to the beats, n_frames.
+    Beat i covers the feature frames `bounds[i] <= n < bounds[i+1]`.
+    The beats are those of `compute_beats(y, sr, component=component)`, so
+    they match the Time page when the same HPSS component is used.
+    """
+    feature_sr = sr if feature_sr is None else feature_sr
+    beat_times = librosa.frames_to_time(get_beat_frames(y, sr, component=component), sr=sr, hop_length=512)
+    # frame n的中心在n*hop，取最接近beat的frame
+    frames = np.round(beat_times * feature_sr / hop_length).astype(int)
+    return librosa.util.fix_frames(frames, x_min=0, x_max=n_frames, pad=True)
+
+
+@dataclass
+class BeatSyncFeature:
+    X: np.ndarray       # (features, beats)
+    bounds: np.ndarray  # 每個beat的frame範圍，len = beats + 1
+
+    @property
+    def n_frames(self) -> int:
+        return int(self.bounds[-1])
+
+    def expand(self, Y: np.ndarray) -> np.ndarray:
+        """Repeats every column of `Y` (…, beats) over the frames of its beat."""
+        return np.repeat(Y, np.diff(self.bounds), axis=-1)
+
+    def times(self, sr: int, hop_length: int) -> np.ndarray:
+        """Start time of every beat (plus the end time of the last one)."""
+        return librosa.frames_to_time(self.bounds, sr=sr, hop_length=hop_length)
+
+
+def beat_sync(X: npt.ArrayLike, bounds: npt.ArrayLike, aggregate: str = "median") -> BeatSyncFeature:
+    """
+    Pools the frames of the feature `X` (features × frames) between
+    consecutive `bounds` (see `get_beat_bounds`) into one column per beat,
+    with the median or the mean.
+    """
+    X = np.asarray(X)
+    bounds = librosa.util.fix_frames(bounds, x_min=0, x_max=X.shape[1], pad=True)
+    if aggregate == "mean":
+        return BeatSyncFeature(np.add.reduceat(X, bounds[:-1], axis=1) / np.diff(bounds), bounds)
+    if aggregate == "median":
+        return BeatSyncFeature(librosa.util.sync(X, bounds, aggregate=np.median), bounds)
+    raise ValueError(f"Unsupported aggregate: {aggregate}")
+
+
+def _count_in_windows(sorted_times: np.ndarray, centers: np.ndarray, window: float) -> np.ndarray:
+    """
+    Number of `sorted_times` strictly inside (x - window/2, x + window/2) for
+    every center x.
+    """
+    delta = window/2.0
+    return (np.searchsorted(sorted_times, centers + delta, side='left')
+            - np.searchsorted(sorted_times, centers - delta, side='right'))
+
+
+def _rate_grid(last_time: float, window: float, step: float) -> np.ndarray:
+    """Window centers of the rate curve: from window/2 to last_time - window/2."""
+    return np.arange(window/2.0, last_time - window/2.0, step)
+
+
+def compute_rate_curve(event_times: npt.ArrayLike, window: float = 3, step: float = 0.5):
+    """
+    Computes the number of events per minute in a sliding window.
+
+    The events in every window are counted with two binary searches in the
+    sorted event times, O((T + N) log N) for T windows and N events.
+
+    Returns
+    -------
+    time_array : np.ndarray
+        Centers of the windows (seconds), from window/2 to the last event
+        minus window/2.
+    rate_array : np.ndarray
+        Events per minute in each window.
+    """
+    onset_times = np.sort(np.asarray(event_times, dtype=np.float64))
+    if len(onset_times) == 0:
+        return np.zeros(0), np.zeros(0)
+    time_array = _rate_grid(onset_times[-1], window, step)
+    rate_array = _count_in_windows(onset_times, time_array, window) * 60 / window
+    return time_array, rate_array
+
+
+def compute_rate_curves(event_times: npt.ArrayLike, windows=range(1, 11), step: float = 0.5):
+    """
+    `compute_rate_curve` for several window sizes at once (the events are
+    sorted once). Returns {window: (time_array, rate_array)}.
+    """
+    onset_times = np.sort(np.asarray(event_times, dtype=np.float64))
+    curves = {}
+    for window in windows:
+        if len(onset_times) == 0:
+            curves[window] = (np.zeros(0), np.zeros(0))
+            continue
+        time_array = _rate_grid(onset_times[-1], window, step)
+        curves[window] = (time_array, _count_in_windows(onset_times, time_array, window) * 60 / window)
+    return curves
+
+
+class RateCurve:
+    """
+    Sliding-window event rates (see `compute_rate_curve`) for several window
+    sizes, updated incrementally when single events are added or removed.
+
+    Inserting or removing an event only recounts the windows that contain it
+    (about window/step of them) instead of the whole curve, so manual edits
+    of onsets/beats do not recompute everything.
+
+    Examples
+    --------
+    >>> curve = RateCurve(onset_times, windows=range(1, 11))
+    >>> curve.insert(12.3)
+    >>> time_array, rate_array = curve.curve(3)
+    """
+
+    # 一次變動超過這麼多個事件時直接重新計算
+    max_incremental_changes = 16
+
+    def __init__(self, event_times: npt.ArrayLike = (), windows=(3,), step: float = 0.5):
+        self.windows = tuple(windows)
+        self.step = step
+        self.reset(event_times)
+
+    @property
+    def event_times(self) -> np.ndarray:
+        """The sorted event times."""
+        return self._times
+
+    def reset(self, event_times: npt.ArrayLike) -> None:
+        """Recomputes every curve from scratch."""
+        self._times = np.sort(np.asarray(event_times, dtype=np.float64))
+        self._counts = {}
+        for window in self.windows:
+            centers = self._grid(window)
+            self._counts[window] = _count_in_windows(self._times, centers, window)
+
+    def insert(self, t: float) -> None:
+        """Adds one event at time `t`."""
+        t = float(t)
+        self._times = np.insert(self._times, np.searchsorted(self._times, t), t)
+        self._changed(t)
+
+    def remove(self, t: float) -> None:
+        """Removes one event at time `t` (it must be present)."""
+        t = float(t)
+        i = np.searchsorted(self._times, t)
+        if i >= len(self._times) or self._times[i] != t:
+            raise ValueError(f"No event at {t}")
+        self._times = np.delete(self._times, i)
+        self._changed(t)
+
+    def update(self, event_times: npt.ArrayLike) -> None:
+        """
+        Sets the events to `event_times`, inserting/removing only the events
+        that differ from the current ones.
+        """
+        new_times = np.sort(np.asarray(event_times, dtype=np.float64))
+        has_duplicates = np.any(np.diff(new_times) == 0) or np.any(np.diff(self._times) == 0)
+        added = np.setdiff1d(new_times, self._times)
+        removed = np.setdiff1d(self._times, new_times)
+        if has_duplicates or len(added) + len(removed) > self.max_incremental_changes:
+            self.reset(new_times)
+            return
+        for t in removed:
+            self.remove(t)
+        for t in added:
+            self.insert(t)
+
+    def curve(self, window: float):
+        """Returns (time_array, rate_array) of one of the window sizes."""
+        return self._grid(window), self._counts[window] * 60 / window
+
+    def curves(self):
+        """Returns {window: (time_array, rate_array)} of every window size."""
+        return {window: self.curve(window) for window in self.windows}
+
+    def _grid(self, window: float) -> np.ndarray:
+        if len(self._times) == 0:
+            return np.zeros(0)
+        return _rate_grid(self._times[-1], window, self.step)
+
+    def _changed(self, t: float) -> None:
+        for window in self.windows:
+            centers = self._grid(window)
+            counts = self._counts[window]
+            n_old = len(counts)
+            # 最後一個事件改變時曲線的長度也會變，新增的點要重新計算
+            if len(centers) > n_old:
+                counts = np.concatenate([counts, _count_in_windows(self._times, centers[n_old:], window)])
+            else:
+                counts = counts[:len(centers)]
+            # 包含t的window，左右各多算一點避免浮點誤差
+            delta = window/2.0
+            lo = max(0, np.searchsorted(centers, t - delta, side='left') - 1)
+            hi = min(len(centers), np.searchsorted(centers, t + delta, side='right') + 1)
+            if hi > lo:
+                counts[lo:hi] = _count_in_windows(self._times, centers[lo:hi], window)
+            self._counts[window] = counts
+
+
+#%% Chord
+def normalize_feature_sequence(X: np.ndarray, norm: str = '2', threshold: float = 0.0001, v=None) -> np.ndarray:
+    """
+    Normalizes the columns of a feature sequence.
+
+    Same as `libfmp.c3.normalize_feature_sequence`, vectorized over the
+    columns: columns whose norm is not above `threshold` are replaced by `v`
+    (by default the unit vector of the given norm).
+    """
+    assert norm in ['1', '2', 'max', 'z']
+    X = np.asarray(X, dtype=np.float64)
+    K = X.shape[0]
+
+    if norm == '1':
+        s = np.sum(np.abs(X), axis=0)
+        default = np.ones(K) / K
+    elif norm == '2':
+        s = np.sqrt(np.sum(X ** 2, axis=0))
+        default = np.ones(K) / np.sqrt(K)
+    elif norm == 'max':
+        s = np.max(np.abs(X), axis=0)
+        default = np.ones(K)
+    else:
+        mu = np.sum(X, axis=0) / K
+        X = X - mu
+        s = np.sqrt(np.sum(X ** 2, axis=0) / (K - 1))
+        default = np.zeros(K)
+    if v is None:
+        v = default
+
+    valid = s > threshold
+    X_norm = np.empty_like(X)
+    X_norm[:, valid] = X[:, valid] / s[valid]
+    X_norm[:, ~valid] = np.asarray(v, dtype=np.float64).reshape(K, 1)
+    return X_norm
+
+
+def compute_chromagram(y, sr, Fs=22050, N=4096, H=2048, gamma=None, version='STFT', norm='2', component=None):
+    """Compute chromagram of an audio signal
+
+    Notebook: C5/C5S2_ChordRec_Templates.ipynb
+
+    Args:
+        y (np.ndarray): Audio signal
+        sr (scalar): Sampling rate
+        Fs (scalar): Sampling rate (Default value = 22050)
+        N (int): Window size (Default value = 4096)
+        H (int): Hop size (Default value = 2048)
+        gamma (float): Constant for logarithmic compression (Default value = None)
+        version (str): Technique used for front-end decomposition ('STFT', 'IIS', 'CQT') (Default value = 'STFT')
+        norm (str): If not 'None', chroma vectors are normalized by norm as specified ('1', '2', 'max')
+            (Default value = '2')
+        component (str): 'harmonic' or 'percussive' to use only that HPSS component of the
+            spectrogram (only for 'STFT') (Default value = None)
+
+    Returns:
+        X (np.ndarray): Chromagram
+        Fs_X (scalar): Feature reate of chromagram
+        x (np.ndarray): Audio signal
+        Fs (scalar): Sampling rate of audio signal
+        x_dur (float): Duration (seconds) of audio signal
+    """
+    if component is not None and version != 'STFT':
+        raise ValueError("HPSS components are only supported for version='STFT'")
+    x = librosa.resample(y, orig_sr=sr, target_sr=Fs)
+    x_dur = x.shape[0] / Fs
+    if version == 'STFT':
+        # Compute chroma features with STFT
+        if gamma is None:
+            X = get_chroma(x, Fs, n_fft=N, hop_length=H, tuning=0, norm=None, component=component)
+        else:
+            if component is None:
+                X = get_power(x, n_fft=N, hop_length=H)
+            else:
+                X = get_component_magnitude(x, component, n_fft=N, hop_length=H) ** 2
+            X = np.log(1 + gamma * X)
+            X = librosa.feature.chroma_stft(S=X, sr=Fs, tuning=0, norm=None, hop_length=H, n_fft=N)
+    if version == 'CQT':
+        # Compute chroma features with CQT decomposition
+        X = get_chroma(x, Fs, method='cqt', hop_length=H, norm=None)
+    if version == 'IIR':
+        # Compute chroma features with filter bank (using IIR elliptic filter)
+        X = librosa.iirt(y=x, sr=Fs, win_length=N, hop_length=H, center=True, tuning=0.0)
+        if gamma is not None:
+            X = np.log(1.0 + gamma * X)
+        X = librosa.feature.chroma_cqt(C=X, bins_per_octave=12, n_octaves=7,
+                                       fmin=librosa.midi_to_hz(24), norm=None)
+    if norm is not None:
+        X = normalize_feature_sequence(X, norm=norm)
+    Fs_X = Fs / H
+    return X, Fs_X, x, Fs, x_dur
+
+
+def generate_chord_templates(nonchord=False):
+    """Generate chord templates of major and minor triads (and possibly nonchord)
+
+    Notebook: C5/C5S2_ChordRec_Templates.ipynb
+
+    Args:
+        nonchord (bool): If "True" then add nonchord template (Default value = False)
+
+    Returns:
+        chord_templates (np.ndarray): Matrix containing chord_templates as columns
+    """
+    template_cmaj = np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0]).T
+    template_cmin = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0]).T
+    num_chord = 24
+    if nonchord:
+        num_chord = 25
+    chord_templates = np.ones((12, num_chord))
+    for shift in range(12):
+        chord_templates[:, shift] = np.roll(template_cmaj, shift)
+        chord_templates[:, shift+12] = np.roll(template_cmin, shift)
+    return chord_templates
+
+
+def chord_recognition_template(X, norm_sim='1', nonchord=False):
+    """Conducts template-based chord recognition
+    with major and minor triads (and possibly nonchord)
+
+    Notebook: C5/C5S2_ChordRec_Templates.ipynb
+
+    Args:
+        X (np.ndarray): Chromagram
+        norm_sim (str): Specifies norm used for normalizing chord similarity matrix (Default value = '1')
+        nonchord (bool): If "True" then add nonchord template (Default value = False)
+
+    Returns:
+        chord_sim (np.ndarray): Chord similarity matrix
+        chord_max (np.ndarray): Binarized chord similarity matrix only containing maximizing chord
+    """
+    chord_templates = generate_chord_templates(nonchord=nonchord)
+    X_norm = normalize_feature_sequence(X, norm='2')
+    chord_templates_norm = normalize_feature_sequence(chord_templates, norm='2')
+    chord_sim = np.matmul(chord_templates_norm.T, X_norm)
+    if norm_sim is not None:
+        chord_sim = normalize_feature_sequence(chord_sim, norm=norm_sim)
+    chord_max = chord_index_to_binary(np.argmax(chord_sim, axis=0), chord_sim.shape[0])
+
+    return chord_sim, chord_max
+
+
+def chord_index_to_binary(chord_index: np.ndarray, num_chord: int) -> np.ndarray:
+    """One-hot (num_chord × frames) int32 matrix of a chord index sequence."""
+    chord_index = np.asarray(chord_index)
+    chord_max = np.zeros((num_chord, len(chord_index)), dtype=np.int32)
+    chord_max[chord_index, np.arange(len(chord_index))] = 1
+    return chord_max
+
+
+@jit(nopython=True, nogil=True)
+def viterbi_uniform_log(log_B, log_p, log_q):
+    """Viterbi decoding in log space for a uniform transition matrix
+
+    All states stay with probability p and move to every other state with
+    probability q = (1-p)/(K-1); the initial distribution is uniform. With
+    this structure the best predecessor of state j is either j itself or the
+    best (or, if that is j, second best) state of the previous frame, so
+    every frame costs O(K) instead of O(K²).
+
+    Args:
+        log_B (np.ndarray): Log observation likelihoods, shape=(K, N)
+        log_p (float): Log self-transition probability
+        log_q (float): Log probability of every change of state
+
+    Returns:
+        path (np.ndarray): Most likely state sequence, shape=(N,)
+    """
+    K, N = log_B.shape
+    path = np.zeros(N, dtype=np.int64)
+    if N == 0:
+        return path
+    back = np.zeros((K, N), dtype=np.int64)
+    delta = log_B[:, 0].copy()
+    new_delta = np.empty(K)
+    for n in range(1, N):
+        # 前一個frame最好與第二好的狀態
+        best, second = 0, -1
+        for i in range(1, K):
+            if delta[i] > delta[best]:
+                second = best
+                best = i
+            elif second < 0 or delta[i] > delta[second]:
+                second = i
+        for j in range(K):
+            other = best if best != j else second
+            stay = delta[j] + log_p
+            if other >= 0 and delta[other] + log_q > stay:
+                new_delta[j] = delta[other] + log_q + log_B[j, n]
+                back[j, n] = other
+            else:
+                new_delta[j] = stay + log_B[j, n]
+                back[j, n] = j
+        delta[:] = new_delta
+    path[N-1] = np.argmax(delta)
+    for n in range(N-1, 0, -1):
+        path[n-1] = back[path[n], n]
+    return path
+
+
+def chord_recognition_hmm(X, self_prob: float = 0.9, nonchord=False, eps: float = 1e-12,
+                          weights: Optional[np.ndarray] = None):
+    """Template-based chord recognition smoothed with an HMM
+
+    The template similarities (`chord_recognition_template`) are used as
+    observation likelihoods and the chord sequence is decoded with
+    `viterbi_uniform_log`, so isolated single-frame chord changes are
+    suppressed. Larger `self_prob` gives longer chords.
+
+    Args:
+        X (np.ndarray): Chromagram
+        self_prob (float): Probability of staying on the same chord from one frame to the next (Default value = 0.9)
+        nonchord (bool): If "True" then add nonchord template (Default value = False)
+        eps (float): Added to the likelihoods before taking the log (Default value = 1e-12)
+        weights (np.ndarray): Per-column weights of the log-likelihoods, e.g. the number of frames
+            pooled into every column (Default value = None)
+
+    Returns:
+        chord_sim (np.ndarray): Chord similarity matrix (normalized with 'max')
+        chord_max (np.ndarray): Binarized matrix of the decoded chord sequence
+    """
+    if not 0 < self_prob < 1:
+        raise ValueError(f"self_prob must be between 0 and 1, got {self_prob}")
+    chord_sim, _ = chord_recognition_template(X, norm_sim='max', nonchord=nonchord)
+    K = chord_sim.shape[0]
+    log_B = np.log(chord_sim + eps)
+    if weights is not None:
+        log_B = log_B * np.asarray(weights, dtype=np.float64)
+    path = viterbi_uniform_log(log_B, np.log(self_prob), np.log((1 - self_prob) / (K - 1)))
+    return chord_sim, chord_index_to_binary(path, K)
+
+
+def recognize_chords(X, self_prob: Optional[float] = None, beat_bounds: Optional[np.ndarray] = None,
+                     aggregate: str = "median"):
+    """Chord recognition of a chromagram, optionally beat-synchronous
+
+    The best template of every frame (`chord_recognition_template`), or the
+    HMM-smoothed sequence (`chord_recognition_hmm`) if `self_prob` is given.
+    With `beat_bounds` (see `get_beat_bounds`) the chroma is first pooled to
+    one column per beat (`beat_sync`), so there is one chord per beat and
+    the decoding runs on ~10-40× fewer columns; the results are repeated
+    back to frame resolution. Every beat counts with its number of frames in
+    the HMM, so `self_prob` keeps its per-frame meaning.
+
+    Args:
+        X (np.ndarray): Chromagram
+        self_prob (float): Self-transition probability of the HMM, None for no smoothing (Default value = None)
+        beat_bounds (np.ndarray): Beat boundaries in frames of ``X`` (Default value = None)
+        aggregate (str): Pooling of the frames of a beat, 'median' or 'mean' (Default value = 'median')
+
+    Returns:
+        chord_sim (np.ndarray): Chord similarity matrix (normalized with 'max')
+        chord_max (np.ndarray): Binarized matrix of the chord sequence
+    """
+    synced = None
+    if beat_bounds is not None:
+        synced = beat_sync(X, beat_bounds, aggregate=aggregate)
+        X = synced.X
+    if self_prob is None:
+        chord_sim, chord_max = chord_recognition_template(X, norm_sim='max')
+    else:
+        weights = None if synced is None else np.diff(synced.bounds)
+        chord_sim, chord_max = chord_recognition_hmm(X, self_prob=self_prob, weights=weights)
+    if synced is not None:
+        chord_sim, chord_max = synced.expand(chord_sim), synced.expand(chord_max)
+    return chord_sim, chord_max
+
+
+def chord_table(chord_max) -> List[str]:
+    # 計算chord_max依照第一個軸的最大值的index
+    chord_max_index = np.argmax(chord_max, axis=0)
+    # 用index找出對應的chord_labels
+    return [CHORD_LABELS[i] for i in chord_max_index]
+
+
+@dataclass
+class ChordResult:
+    chroma: np.ndarray
+    chord_sim: np.ndarray
+    chord_max: np.ndarray
+    duration: float
+
+    @property
+    def sec_per_frame(self) -> float:
+        return self.duration / self.chroma.shape[1]
+
+    @property
+    def times(self) -> np.ndarray:
+        return np.arange(self.chroma.shape[1]) * self.sec_per_frame
+
+    @property
+    def labels(self) -> List[str]:
+        return chord_table(self.chord_max)
+
+    @property
+    def segments(self) -> "ChordSegments":
+        return ChordSegments.from_chord_max(self.chord_max)
+
+
+@dataclass
+class ChordSegments:
+    """
+    Run-length encoded chord sequence: segment i covers the frames
+    `starts[i] <= n < ends[i]` and has the chord `label_names[labels[i]]`.
+    Neighbouring segments always have different chords.
+    """
+    starts: np.ndarray  # first frame of every segment
+    ends: np.ndarray    # one past the last frame
+    labels: np.ndarray  # index into label_names
+    label_names: List[str] = field(default_factory=lambda: list(CHORD_LABELS))
+
+    @classmethod
+    def from_indices(cls, chord_index: npt.ArrayLike, label_names: Optional[List[str]] = None) -> "ChordSegments":
+        """Builds the segments of a per-frame chord index sequence."""
+        chord_index = np.asarray(chord_index, dtype=np.int64)
+        if len(chord_index) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(empty, empty.copy(), empty.copy(), list(label_names or CHORD_LABELS))
+        # 和弦改變的位置就是新segment的開頭
+        starts = np.concatenate([[0], np.nonzero(np.diff(chord_index))[0] + 1])
+        ends = np.append(starts[1:], len(chord_index))
+        return cls(starts, ends, chord_index[starts], list(label_names or CHORD_LABELS))
+
+    @classmethod
+    def from_labels(cls, chords: npt.ArrayLike) -> "ChordSegments":
+        """
+        Builds the segments of a per-frame sequence of chord names. Names
+        outside `CHORD_LABELS` are appended to `label_names`.
+        """
+        chords = np.asarray(chords, dtype=object)
+        names, inverse = np.unique(chords.astype(str), return_inverse=True)
+        label_names = list(CHORD_LABELS) + [n for n in names if n not in CHORD_LABELS]
+        lookup = np.array([label_names.index(n) for n in names], dtype=np.int64)
+        return cls.from_indices(lookup[inverse] if len(chords) else [], label_names)
+
+    @classmethod
+    def from_chord_max(cls, chord_max: np.ndarray) -> "ChordSegments":
+        """Builds the segments of a binarized chord matrix (chords × frames)."""
+        label_names = list(CHORD_LABELS)
+        if chord_max.shape[0] > len(CHORD_LABELS):
+            label_names.append("N")  # nonchord template
+        return cls.from_indices(np.argmax(chord_max, axis=0), label_names)
+
+    @classmethod
+    def from_frame_table(cls, df) -> "ChordSegments":
+        """Builds the segments of a per-frame table with a "Chord" column."""
+        return cls.from_labels(df["Chord"].to_numpy())
+
+    @classmethod
+    def from_runs(cls, starts: npt.ArrayLike, labels: npt.ArrayLike, n_frames: int,
+                  label_names: Optional[List[str]] = None) -> "ChordSegments":
+        """
+        Builds the segments from start frames and labels in any order: each
+        segment lasts until the next start (the last one until `n_frames`),
+        the first one is extended to frame 0, starts outside [0, n_frames)
+        are clipped, and segments that become empty or repeat the previous
+        chord are merged.
+        """
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, max(0, n_frames - 1))
+        labels = np.asarray(labels, dtype=np.int64)
+        label_names = list(label_names or CHORD_LABELS)
+        if n_frames <= 0 or len(starts) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(empty, empty.copy(), empty.copy(), label_names)
+        order = np.argsort(starts, kind="stable")
+        starts, labels = starts[order], labels[order]
+        # 同一個起點只保留最後一個
+        keep = np.append(starts[1:] != starts[:-1], True)
+        starts, labels = starts[keep], labels[keep]
+        starts[0] = 0
+        # 與前一段相同的和弦合併
+        keep = np.concatenate([[True], labels[1:] != labels[:-1]])
+        starts, labels = starts[keep], labels[keep]
+        return cls(starts, np.append(starts[1:], n_frames), labels, label_names)
+
+    @classmethod
+    def from_table(cls, df, sec_per_frame: float, n_frames: int, shift_time: float = 0.0) -> "ChordSegments":
+        """
+        Builds the segments of a segment table with "Start(s)" and "Chord"
+        columns (e.g. an edited `to_dataframe`). End times are implied by the
+        next start; rows without start or chord are ignored.
+        """
+        df = df.dropna(subset=["Start(s)", "Chord"])
+        starts = np.round((df["Start(s)"].to_numpy(dtype=np.float64) - shift_time) / sec_per_frame)
+        chords = df["Chord"].astype(str).to_numpy()
+        label_names = list(CHORD_LABELS) + sorted(set(chords) - set(CHORD_LABELS))
+        lookup = {name: i for i, name in enumerate(label_names)}
+        labels = np.array([lookup[c] for c in chords], dtype=np.int64)
+        return cls.from_runs(starts, labels, n_frames, label_names)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def n_frames(self) -> int:
+        return int(self.ends[-1]) if len(self.ends) else 0
+
+    @property
+    def chords(self) -> List[str]:
+        """Chord name of every segment."""
+        return [self.label_names[i] for i in self.labels]
+
+    def to_indices(self) -> np.ndarray:
+        """Per-frame chord indices."""
+        return np.repeat(self.labels, self.ends - self.starts)
+
+    def to_labels(self) -> np.ndarray:
+        """Per-frame chord names."""
+        return np.asarray(self.label_names, dtype=object)[self.to_indices()]
+
+    def label_at(self, frames: npt.ArrayLike) -> np.ndarray:
+        """Chord index at the given frames."""
+        return self.labels[np.searchsorted(self.starts, frames, side='right') - 1]
+
+    def assign(self, start: int, end: int, chord) -> "ChordSegments":
+        """
+        Returns a copy with the frames start <= n < end set to `chord` (name
+        or index); only the segments around the span are touched.
+        """
+        if isinstance(chord, str):
+            label_names = list(self.label_names)
+            if chord not in label_names:
+                label_names.append(chord)
+            chord = label_names.index(chord)
+        else:
+            label_names = self.label_names
+        n_frames = self.n_frames
+        start, end = max(0, int(start)), min(n_frames, int(end))
+        if end <= start:
+            return ChordSegments(self.starts.copy(), self.ends.copy(), self.labels.copy(), list(label_names))
+        i0 = np.searchsorted(self.starts, start, side='right') - 1  # 包含start的segment
+        i1 = np.searchsorted(self.starts, end, side='left')         # end之後的第一個segment
+        starts = [self.starts[:i0 + 1], [start]]
+        labels = [self.labels[:i0 + 1], [chord]]
+        if end < n_frames and (i1 == len(self.starts) or self.starts[i1] != end):
+            # span結束在某個segment中間，後半段保留原本的和弦
+            starts.append([end])
+            labels.append([self.labels[i1 - 1]])
+        starts.append(self.starts[i1:])
+        labels.append(self.labels[i1:])
+        return ChordSegments.from_runs(np.concatenate(starts), np.concatenate(labels), n_frames, list(label_names))
+
+    def changed_span(self, other: "ChordSegments"):
+        """
+        The frame span (first, end) in which `other` differs from these
+        segments (end exclusive), or None if they are equal. Compared on the
+        segment boundaries only, without expanding to frames.
+        """
+        n_frames = max(self.n_frames, other.n_frames)
+        if n_frames == 0:
+            return None
+        bounds = np.union1d(np.append(self.starts, self.n_frames), np.append(other.starts, other.n_frames))
+        bounds = bounds[bounds < n_frames]
+
+        def names_at(segments, frames):
+            out = np.full(len(frames), None, dtype=object)
+            inside = frames < segments.n_frames
+            names = np.asarray(segments.label_names, dtype=object)
+            out[inside] = names[segments.label_at(frames[inside])]
+            return out
+
+        differ = np.nonzero(names_at(self, bounds) != names_at(other, bounds))[0]
+        if len(differ) == 0:
+            return None
+        ends = np.append(bounds[1:], n_frames)
+        return int(bounds[differ[0]]), int(ends[differ[-1]])
+
+    def to_frame_table(self, sec_per_frame: float, shift_time: float = 0.0):
+        """The per-frame table of the Chord page (Frame, Time(s), Chord)."""
+        import pandas as pd
+
+        frames = np.arange(self.n_frames)
+        return pd.DataFrame({
+            "Frame": frames,
+            "Time(s)": frames * sec_per_frame + shift_time,
+            "Chord": self.to_labels(),
+        })
+
+    def to_dataframe(self, sec_per_frame: Optional[float] = None, shift_time: float = 0.0):
+        """
+        One row per segment: Start/End frame (End exclusive), Chord and, if
+        `sec_per_frame` is given, the start/end time in seconds.
+        """
+        import pandas as pd
+
+        df = pd.DataFrame({"Start": self.starts, "End": self.ends, "Chord": self.chords})
+        if sec_per_frame is not None:
+            df["Start(s)"] = self.starts * sec_per_frame + shift_time
+            df["End(s)"] = self.ends * sec_per_frame + shift_time
+        return df
+
+
+def compute_chords(y: npt.ArrayLike, sr: int, self_prob: Optional[float] = None,
+                   beat_synchronous: bool = False, aggregate: str = "median",
+                   component: Optional[str] = None, beat_component: Optional[str] = None) -> ChordResult:
+    """
+    Template-based chord recognition of `y`: the best chord of every frame,
+    or the HMM-smoothed sequence (`chord_recognition_hmm`) if `self_prob`
+    is given. With `beat_synchronous` there is one chord per beat (see
+    `recognize_chords`); the result still has one column per chroma frame.
+    component="harmonic" uses the chroma of the harmonic part only, and
+    beat_component="percussive" the beats of the percussive part.
+    """
+    chroma, Fs_X, _, Fs, duration = compute_chromagram(y, sr, component=component)
+    bounds = None
+    if beat_synchronous:
+        bounds = get_beat_bounds(y, sr, chroma.shape[1], hop_length=int(round(Fs / Fs_X)), feature_sr=Fs,
+                                 component=beat_component)
+    chord_sim, chord_max = recognize_chords(chroma, self_prob=self_prob, beat_bounds=bounds, aggregate=aggregate)
+    return ChordResult(chroma, chord_sim, chord_max, duration)
+
+
+#%% Structure
+@jit(nopython=True, nogil=True)
+def compute_sm_dot(X, Y):
+    """Computes similarty matrix from feature sequences using dot (inner) product
+
+    Notebook: C4/C4S2_SSM.ipynb
+
+    Args:
+        X (np.ndarray): First sequence
+        Y (np.ndarray): Second Sequence
+
+    Returns:
+        S (float): Dot product
+    """
+    S = np.dot(np.transpose(X), Y)
+    return S
+
+
+def get_stacked_chroma(y: npt.ArrayLike, sr: int, hop_length: int = 1024) -> np.ndarray:
+    """
+    CQT chroma stacked with 10 delayed copies (delay 3), the feature of the
+    recurrence/self-similarity matrices.
+    """
+    def compute():
+        chroma = get_chroma(y, sr, method="cqt", hop_length=hop_length)
+        return librosa.feature.stack_memory(chroma, n_steps=10, delay=3)
+
+    return cached_feature(y, "stacked_chroma", (sr, hop_length), compute, persist=True)
+
+
+def get_ssm_feature(y: npt.ArrayLike, sr: int, hop_length: int = 1024, beat_synchronous: bool = False,
+                    aggregate: str = "median", beat_component: Optional[str] = None):
+    """
+    The feature of the self-similarity matrices: `get_stacked_chroma`, or
+    with `beat_synchronous` its pooled version with one column per beat
+    (`beat_sync`), the beats tracked on `beat_component` (see
+    `get_beat_bounds`).
+
+    Returns (X, bounds); bounds are the beat boundaries in frames, or None.
+    """
+    X = get_stacked_chroma(y, sr, hop_length)
+    if not beat_synchronous:
+        return X, None
+
+    def compute():
+        bounds = get_beat_bounds(y, sr, X.shape[1], hop_length, component=beat_component)
+        synced = beat_sync(X, bounds, aggregate=aggregate)
+        return synced.X, synced.bounds
+
+    return cached_feature(y, "beat_sync_ssm_feature", (sr, hop_length) + _sync_params(aggregate, beat_component),
+                          compute)
+
+
+def _sync_params(aggregate: str, beat_component: Optional[str]) -> tuple:
+    """Cache key part of the beat-synchronous features."""
+    return (aggregate,) + ((beat_component,) if beat_component is not None else ())
+
+
+def compute_recurrence(y: npt.ArrayLike, sr: int, affinity: bool = False, hop_length: int = 1024,
+                       beat_synchronous: bool = False, aggregate: str = "median",
+                       beat_component: Optional[str] = None) -> np.ndarray:
+    """
+    Computes the recurrence matrix of the stacked CQT chroma of `y`
+    (binary kNN recurrence, or cosine affinity if `affinity`), per frame or
+    per beat (see `get_ssm_feature`).
+    """
+    def compute():
+        # Pre-processing stage
+        chroma_stack, _ = get_ssm_feature(y, sr, hop_length, beat_synchronous, aggregate, beat_component)
+        if not affinity:
+            return librosa.segment.recurrence_matrix(chroma_stack, k=5)
+        return librosa.segment.recurrence_matrix(chroma_stack, metric='cosine', mode='affinity')
+
+    params = (sr, hop_length, affinity) + (_sync_params(aggregate, beat_component) if beat_synchronous else ())
+    return cached_feature(y, "recurrence_matrix", params, compute, persist=True)
+
+
+SSM_MODES = ("dense", "band", "knn")
+
+
+def compute_sparse_ssm(
+    y: npt.ArrayLike,
+    sr: int,
+    mode: str = "band",
+    hop_length: int = 1024,
+    bandwidth: int = 256,
+    k: int = 5,
+    affinity: bool = False,
+    beat_synchronous: bool = False,
+    aggregate: str = "median",
+    mutual: bool = False,
+    beat_component: Optional[str] = None,
+):
+    """
+    Sparse self-similarity matrix of the stacked CQT chroma (see `src.ssm`).
+
+    mode="band" keeps the cosine similarities within `bandwidth` frames of
+    the diagonal; mode="knn" keeps the `k` most similar frames of every frame
+    (binary links, or cosine similarities if `affinity`), linked if either
+    frame is a neighbour of the other, or only if both are with `mutual`.
+    Both hold raw cosine similarities, not the exp(-d/median) affinity of
+    `compute_recurrence`, so they do not reproduce the dense matrix.
+    The underlying arrays are cached, so only O(N·bandwidth) or O(N·k)
+    memory is used. With `beat_synchronous` the columns (and `bandwidth`)
+    are beats instead of frames.
+    """
+    X, _ = get_ssm_feature(y, sr, hop_length, beat_synchronous, aggregate, beat_component)
+    sync_params = _sync_params(aggregate, beat_component) if beat_synchronous else ()
+    if mode == "band":
+        U = cached_feature(y, "ssm_band", (sr, hop_length, bandwidth) + sync_params,
+                           lambda: ssm.banded_diagonals(ssm.normalize_columns(X), bandwidth), persist=True)
+        return ssm.band_matrix(U)
+    if mode == "knn":
+        indices, values = cached_feature(y, "ssm_knn", (sr, hop_length, k) + sync_params,
+                                         lambda: ssm.knn_neighbors(X, k), persist=True)
+        return ssm.knn_matrix(indices, values, binary=not affinity, mutual=mutual)
+    raise ValueError(f"Unsupported SSM mode: {mode}")
+
+
+def compute_ssm(y: npt.ArrayLike, sr: int, mode: str = "dense", hop_length: int = 1024,
+                affinity: bool = False, bandwidth: int = 256, k: int = 5,
+                beat_synchronous: bool = False, aggregate: str = "median", mutual: bool = False,
+                beat_component: Optional[str] = None):
+    """
+    The self-similarity matrix of the Structure page: the dense librosa
+    recurrence matrix for mode="dense", otherwise `compute_sparse_ssm`.
+    The modes use different similarities (librosa's kNN-sparsified
+    exp(-d/median) affinity vs. raw cosine), so their matrices and novelty
+    curves differ. With `beat_synchronous` the matrix has one row/column per
+    beat.
+    """
+    if mode == "dense":
+        return compute_recurrence(y, sr, affinity=affinity, hop_length=hop_length,
+                                  beat_synchronous=beat_synchronous, aggregate=aggregate,
+                                  beat_component=beat_component)
+    return compute_sparse_ssm(y, sr, mode=mode, hop_length=hop_length,
+                              bandwidth=bandwidth, k=k, affinity=affinity,
+                              beat_synchronous=beat_synchronous, aggregate=aggregate, mutual=mutual,
+                              beat_component=beat_component)
+
+
+def get_structure_chroma(y: npt.ArrayLike, sr: int, hop_length: int = 2205, n_fft: int = 4410) -> np.ndarray:
+    """
+    The base chroma of `compute_structure_ssm` (STFT chroma, 10 Hz at
+    22050 Hz), as in `libfmp.c4.compute_sm_from_filename`.
+    """
+    return get_chroma(y, sr, n_fft=n_fft, hop_length=hop_length, tuning=0, norm=2)
+
+
+def smooth_downsample_feature_sequence(X: np.ndarray, Fs: float, filt_len: int = 41,
+                                       down_sampling: int = 10, w_type: str = 'boxcar'):
+    """Smoothes and downsamples a feature sequence. Smoothing is achieved by convolution with a filter kernel
+
+    Notebook: C3/C3S1_FeatureSmoothing.ipynb
+
+    Args:
+        X (np.ndarray): Feature sequence
+        Fs (scalar): Frame rate of ``X``
+        filt_len (int): Length of smoothing filter (Default value = 41)
+        down_sampling (int): Downsampling factor (Default value = 10)
+        w_type (str): Window type of smoothing filter (Default value = 'boxcar')
+
+    Returns:
+        X_smooth (np.ndarray): Smoothed and downsampled feature sequence
+        Fs_feature (scalar): Frame rate of ``X_smooth``
+    """
+    filt_kernel = np.expand_dims(scipy.signal.get_window(w_type, filt_len), axis=0)
+    X_smooth = scipy.signal.convolve(X, filt_kernel, mode='same') / filt_len
+    X_smooth = X_smooth[:, ::down_sampling]
+    Fs_feature = Fs / down_sampling
+    return X_smooth, Fs_feature
+
+
+@jit(nopython=True, nogil=True)
+def filter_diag_mult_sm(S, L=1, tempo_rel_set=np.asarray([1]), direction=0):
+    """Path smoothing of similarity matrix by filtering in forward or backward direction
+    along various directions around main diagonal.
+    Note: Directions are simulated by resampling one axis using relative tempo values
+
+    Notebook: C4/C4S2_SSM-PathEnhancement.ipynb
+
+    Args:
+        S (np.ndarray): Self-similarity matrix (SSM)
+        L (int): Length of filter (Default value = 1)
+        tempo_rel_set (np.ndarray): Set of relative tempo values (Default value = np.asarray([1]))
+        direction (int): Direction of smoothing (0: forward; 1: backward) (Default value = 0)
+
+    Returns:
+        S_L_final (np.ndarray): Smoothed SM
+    """
+    N = S.shape[0]
+    M = S.shape[1]
+    num = len(tempo_rel_set)
+    S_L_final = np.zeros((N, M))
+
+    for s in range(0, num):
+        M_ceil = int(np.ceil(M / tempo_rel_set[s]))
+        resample = np.multiply(np.divide(np.arange(1, M_ceil+1), M_ceil), M)
+        np.around(resample, 0, resample)
+        resample = resample - 1
+        index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
+        S_resample = S[:, index_resample]
+
+        S_L = np.zeros((N, M_ceil))
+        S_extend_L = np.zeros((N + L, M_ceil + L))
+
+        # Forward direction
+        if direction == 0:
+            S_extend_L[0:N, 0:M_ceil] = S_resample
+            for pos in range(0, L):
+                S_L = S_L + S_extend_L[pos:(N + pos), pos:(M_ceil + pos)]
+
+        # Backward direction
+        if direction == 1:
+            S_extend_L[L:(N+L), L:(M_ceil+L)] = S_resample
+            for pos in range(0, L):
+                S_L = S_L + S_extend_L[(L-pos):(N + L - pos), (L-pos):(M_ceil + L - pos)]
+
+        S_L = S_L / L
+        resample = np.multiply(np.divide(np.arange(1, M+1), M), M_ceil)
+        np.around(resample, 0, resample)
+        resample = resample - 1
+        index_resample = np.maximum(resample, np.zeros(len(resample))).astype(np.int64)
+
+        S_resample_inv = S_L[:, index_resample]
+        S_L_final = np.maximum(S_L_final, S_resample_inv)
+
+    return S_L_final
+
+
+def compute_sm_ti(X, Y, L=1, tempo_rel_set=np.asarray([1]), shift_set=np.asarray([0]), direction=2):
+    """Compute enhanced similaity matrix by applying path smoothing and transpositions
+
+    Notebook: C4/C4S2_SSM-TranspositionInvariance.ipynb
+
+    Args:
+        X (np.ndarray): First feature sequence
+        Y (np.ndarray): Second feature sequence
+        L (int): Length of filter (Default value = 1)
+        tempo_rel_set (np.ndarray): Set of relative tempo values (Default value = np.asarray([1]))
+        shift_set (np.ndarray): Set of shift indices (Default value = np.asarray([0]))
+        direction (int): Direction of smoothing (0: forward; 1: backward; 2: both directions) (Default value = 2)
+
+    Returns:
+        S_TI (np.ndarray): Transposition-invariant SM
+        I_TI (np.ndarray): Transposition index matrix
+    """
+    tempo_rel_set = np.asarray(tempo_rel_set, dtype=np.float64)
+    for shift in shift_set:
+        Y_cyc = np.roll(Y, shift, axis=0)
+        S_cyc = compute_sm_dot(X, Y_cyc)
+
+        if direction == 0:
+            S_cyc = filter_diag_mult_sm(S_cyc, L, tempo_rel_set, direction=0)
+        if direction == 1:
+            S_cyc = filter_diag_mult_sm(S_cyc, L, tempo_rel_set, direction=1)
+        if direction == 2:
+            S_forward = filter_diag_mult_sm(S_cyc, L, tempo_rel_set=tempo_rel_set, direction=0)
+            S_backward = filter_diag_mult_sm(S_cyc, L, tempo_rel_set=tempo_rel_set, direction=1)
+            S_cyc = np.maximum(S_forward, S_backward)
+        if shift == shift_set[0]:
+            S_TI = S_cyc
+            I_TI = np.ones((S_cyc.shape[0], S_cyc.shape[1])) * shift
+        else:
+            I_TI[S_cyc > S_TI] = shift
+            S_TI = np.maximum(S_cyc, S_TI)
+
+    return S_TI, I_TI
+
+
+def threshold_matrix(S, thresh, strategy='absolute', scale=False, penalty=0.0, binarize=False):
+    """Treshold matrix in a relative fashion
+
+    Notebook: C4/C4S2_SSM-Thresholding.ipynb
+
+    Same as `libfmp.c4.threshold_matrix`, with the relative threshold found
+    by `np.partition` instead of a full sort.
+
+    Args:
+        S (np.ndarray): Input matrix
+        thresh (float or list): Treshold (meaning depends on strategy)
+        strategy (str): Thresholding strategy ('absolute', 'relative', 'local') (Default value = 'absolute')
+        scale (bool): If scale=True, then scaling of positive values to range [0,1] (Default value = False)
+        penalty (float): Set values below treshold to value specified (Default value = 0.0)
+        binarize (bool): Binarizes final matrix (positive: 1; otherwise: 0) (Default value = False)
+
+    Returns:
+        S_thresh (np.ndarray): Thresholded matrix
+    """
+    if np.min(S) < 0:
+        raise ValueError('All entries of the input matrix must be nonnegative')
+
+    S_thresh = np.copy(S)
+    N, M = S.shape
+    num_cells = N * M
+
+    if strategy == 'absolute':
+        S_thresh[S_thresh < thresh] = 0
+
+    if strategy == 'relative':
+        num_cells_below_thresh = int(np.round(S_thresh.size*(1-thresh)))
+        if num_cells_below_thresh < num_cells:
+            thresh_abs = np.partition(S_thresh, num_cells_below_thresh, axis=None)[num_cells_below_thresh]
+            S_thresh[S_thresh < thresh_abs] = 0
+        else:
+            S_thresh = np.zeros([N, M])
+
+    if strategy == 'local':
+        thresh_rel_row, thresh_rel_col = thresh
+        S_binary_row = np.zeros([N, M])
+        num_cells_row_below_thresh = int(np.round(M * (1-thresh_rel_row)))
+        if num_cells_row_below_thresh < M:
+            thresh_row = np.partition(S, num_cells_row_below_thresh, axis=1)[:, num_cells_row_below_thresh]
+            S_binary_row = (S >= thresh_row[:, None]).astype(np.float64)
+        S_binary_col = np.zeros([N, M])
+        num_cells_col_below_thresh = int(np.round(N * (1-thresh_rel_col)))
+        if num_cells_col_below_thresh < N:
+            thresh_col = np.partition(S, num_cells_col_below_thresh, axis=0)[num_cells_col_below_thresh]
+            S_binary_col = (S >= thresh_col[None, :]).astype(np.float64)
+        S_thresh = S * S_binary_row * S_binary_col
+
+    if scale:
+        cell_val_zero = S_thresh == 0
+        cell_val_pos = S_thresh > 0
+        min_value = np.min(S_thresh[cell_val_pos]) if np.any(cell_val_pos) else 0
+        max_value = np.max(S_thresh)
+        # max_value <= min_value 時libfmp只印出警告並保留原矩陣
+        if max_value > min_value:
+            S_thresh = np.divide((S_thresh - min_value), (max_value - min_value))
+            S_thresh[cell_val_zero] = penalty
+
+    if binarize:
+        S_thresh[S_thresh > 0] = 1
+        S_thresh[S_thresh < 0] = 0
+    return S_thresh
+
+
+@dataclass
+class StructureSSM:
+    X: np.ndarray   # smoothed, normalized chroma, shape=(12, n_frames)
+    Fs_X: float     # feature rate of X (and S)
+    S: np.ndarray   # thresholded SSM, shape=(n_frames, n_frames)
+    I: np.ndarray   # transposition index matrix
+    filt_len: int
+    down_sampling: int
+    duration: float  # seconds
+
+
+# (smoothing length L, downsampling H) of the SSMs compared by `SSM_Novelty`
+STRUCTURE_SSM_VARIANTS = ((11, 5), (41, 10))
+
+
+def compute_structure_ssm(
+    y: npt.ArrayLike,
+    sr: int,
+    L: int = 21,
+    H: int = 5,
+    L_smooth: int = 16,
+    tempo_rel_set=(1,),
+    shift_set=(0,),
+    strategy: str = 'relative',
+    scale: bool = True,
+    thresh: float = 0.15,
+    penalty: float = 0.0,
+    binarize: bool = False,
+) -> StructureSSM:
+    """
+    Computes a path-enhanced, thresholded chroma SSM of `y`.
+
+    Same steps and parameters as `libfmp.c4.compute_sm_from_filename`, but
+    from a signal in memory: the base chroma (`get_structure_chroma`) is
+    computed once per signal and shared by all (L, H) variants, and every
+    variant is cached.
+    """
+    tempo_rel_set = tuple(float(t) for t in np.atleast_1d(tempo_rel_set))
+    shift_set = tuple(int(s) for s in np.atleast_1d(shift_set))
+    thresh_key = tuple(thresh) if isinstance(thresh, (list, tuple)) else thresh
+    hop_length = 2205
+
+    def compute():
+        C = get_structure_chroma(y, sr, hop_length=hop_length)
+        X, _ = smooth_downsample_feature_sequence(C, sr / hop_length, filt_len=L, down_sampling=H)
+        X = normalize_feature_sequence(X, norm='2', threshold=0.001)
+        S, I = compute_sm_ti(X, X, L=L_smooth, tempo_rel_set=np.asarray(tempo_rel_set),
+                             shift_set=np.asarray(shift_set), direction=2)
+        S = threshold_matrix(S, thresh=thresh, strategy=strategy, scale=scale,
+                             penalty=penalty, binarize=binarize)
+        return X, S, I
+
+    params = (sr, L, H, L_smooth, tempo_rel_set, shift_set, strategy, scale, thresh_key, penalty, binarize)
+    X, S, I = cached_feature(y, "structure_ssm", params, compute, persist=True)
+    return StructureSSM(X, sr / hop_length / H, S, I, L, H, len(y) / sr)
+
+
+def compute_structure_ssms(y: npt.ArrayLike, sr: int, variants=STRUCTURE_SSM_VARIANTS,
+                           n_jobs: Optional[int] = None, **kwargs) -> List[StructureSSM]:
+    """
+    Computes `compute_structure_ssm(y, sr, L, H, **kwargs)` for every (L, H)
+    in `variants`. The base chroma is computed first, then the variants run
+    in a thread pool (the heavy steps are numpy/numba code that releases the
+    GIL).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    get_structure_chroma(y, sr)
+    with ThreadPoolExecutor(max_workers=n_jobs or len(variants) or 1) as pool:
+        futures = [pool.submit(compute_structure_ssm, y, sr, L=L, H=H, **kwargs) for L, H in variants]
+        return [f.result() for f in futures]
+
+
+@jit(nopython=True)
+def compute_kernel_checkerboard_gaussian(L: int =10 , var: float = 0.5, normalize=True) -> npt.ArrayLike:
+    """Compute Guassian-like checkerboard kernel [FMP, Section 4.4.1].
+    See also: https://scipython.com/blog/visualizing-the-bivariate-gaussian-distribution/
+
+    Notebook: C4/C4S4_NoveltySegmentation.ipynb
+
+    Args:
+        L (int): Parameter specifying the kernel size M=2*L+1
+        var (float): Variance parameter determing the tapering (epsilon) (Default value = 1.0)
+        normalize (bool): Normalize kernel (Default value = True)
+
+    Returns:
+        kernel (np.ndarray): Kernel matrix of size M x M
+    """
+    taper = np.sqrt(1/2) / (L * var)
+    axis = np.arange(-L, L+1)
+    gaussian1D = np.exp(-taper**2 * (axis**2))
+    gaussian2D = np.outer(gaussian1D, gaussian1D)
+    kernel_box = np.outer(np.sign(axis), np.sign(axis))
+    kernel = kernel_box * gaussian2D
+    if normalize:
+        kernel = kernel / np.sum(np.abs(kernel))
+    return kernel
+
+
+@lru_cache(maxsize=64)
+def get_checkerboard_kernel(L: int = 10, var: float = 0.5) -> np.ndarray:
+    """
+    Cached, read-only normalized Gaussian checkerboard kernel of size 2L+1
+    (see `compute_kernel_checkerboard_gaussian`).
+    """
+    kernel = compute_kernel_checkerboard_gaussian(L=int(L), var=float(var))
+    kernel.setflags(write=False)
+    return kernel
+
+
+def compute_novelty_ssm(S, kernel: npt.ArrayLike = None, L: int = 10, var: float = 0.5, exclude: bool =False) -> npt.ArrayLike:
+    """Compute novelty function from SSM [FMP, Section 4.4.1]
+
+    Notebook: C4/C4S4_NoveltySegmentation.ipynb
+
+    Same result as sliding the kernel along the main diagonal of the
+    zero-padded SSM (`novelty_ssm_reference`), but evaluated one diagonal at
+    a time: the entries S[n+i, n+i+d] under the kernel all lie on diagonal d
+    of S, so every diagonal contributes a 1-D correlation with diagonal d of
+    the kernel. Only the 4L+1 diagonals around the main diagonal are read,
+    and S is never padded or copied. `S` can be any object with a
+    `diagonal(k)` method, e.g. a numpy array or a scipy.sparse matrix.
+
+    Args:
+        S (np.ndarray): SSM
+        kernel (np.ndarray): Checkerboard kernel (if kernel==None, it will be computed) (Default value = None)
+        L (int): Parameter specifying the kernel size M=2*L+1 (Default value = 10)
+        var (float): Variance parameter determing the tapering (epsilon) (Default value = 0.5)
+        exclude (bool): Sets the first L and last L values of novelty function to zero (Default value = False)
+
+    Returns:
+        nov (np.ndarray): Novelty function
+    """
+    if kernel is None:
+        kernel = get_checkerboard_kernel(L, var)
+    kernel = np.asarray(kernel)
+    L = kernel.shape[0] // 2
+    N = S.shape[0]
+    nov = np.zeros(N)
+
+    for d in range(-2*L, 2*L + 1):
+        if abs(d) >= N:
+            continue
+        diag = np.asarray(S.diagonal(d), dtype=np.float64)
+        w = np.diagonal(kernel, d)
+        # nov[n] += sum_r diag[n-L+r] * w[r]，超出範圍的項為0(相當於補零)
+        full = np.convolve(diag, w[::-1])
+        shift = L - abs(d)  # nov[n] 對應 full[n + shift]
+        lo = max(0, -shift)
+        hi = min(N, len(full) - shift)
+        nov[lo:hi] += full[lo + shift:hi + shift]
+
+    if exclude:
+        right = np.min([L, N])
+        left = np.max([0, N-L])
+        nov[0:right] = 0
+        nov[left:N] = 0
+
+    return nov
+
+
+def compute_novelty_ssm_multiscale(S, L_set=(5, 10, 20, 40), var: float = 0.5,
+                                   exclude: bool = False) -> np.ndarray:
+    """
+    Novelty functions of `S` for several kernel sizes at once.
+
+    Same result as calling `compute_novelty_ssm(S, L=L, var=var)` for every L
+    in `L_set`, but each of the 4*max(L_set)+1 diagonals of S is extracted
+    only once and correlated with the diagonal-d weights of every kernel that
+    reaches it (extracting diagonals is the expensive part for sparse and
+    large SSMs). The kernels come from the `get_checkerboard_kernel` cache.
+
+    Args:
+        S: SSM (numpy array or scipy.sparse matrix)
+        L_set: Kernel size parameters (kernel size 2L+1) (Default value = (5, 10, 20, 40))
+        var (float): Variance parameter of the kernels (Default value = 0.5)
+        exclude (bool): Sets the first L and last L values of every novelty function to zero (Default value = False)
+
+    Returns:
+        nov (np.ndarray): Novelty functions, shape=(len(L_set), N)
+    """
+    L_set = [int(L) for L in L_set]
+    kernels = [get_checkerboard_kernel(L, var) for L in L_set]
+    L_max = max(L_set)
+    N = S.shape[0]
+    nov = np.zeros((len(L_set), N))
+
+    for d in range(-2*L_max, 2*L_max + 1):
+        if abs(d) >= N:
+            continue
+        diag = np.asarray(S.diagonal(d), dtype=np.float64)
+        for i, (L, kernel) in enumerate(zip(L_set, kernels)):
+            if abs(d) > 2*L:
+                continue
+            # 與 compute_novelty_ssm 相同：nov[n] += sum_r diag[n-L+r] * w[r]
+            full = np.convolve(diag, np.diagonal(kernel, d)[::-1])
+            shift = L - abs(d)
+            lo = max(0, -shift)
+            hi = min(N, len(full) - shift)
+            nov[i, lo:hi] += full[lo + shift:hi + shift]
+
+    if exclude:
+        for i, L in enumerate(L_set):
+            nov[i, :min(L, N)] = 0
+            nov[i, max(0, N-L):] = 0
+
+    return nov
+
+
+def novelty_ssm_reference(S, kernel: npt.ArrayLike = None, L: int = 10, var: float = 0.5, exclude: bool =False) -> npt.ArrayLike:
+    """
+    The original frame-by-frame loop of `compute_novelty_ssm` (as in libfmp),
+    kept as the reference for tests and benchmarks.
+    """
+    if kernel is None:
+        kernel = compute_kernel_checkerboard_gaussian(L=L, var=var)
+    N = S.shape[0]
+    M = 2*L + 1
+    nov = np.zeros(N)
+    # np.pad does not work with numba/jit
+    S_padded = np.pad(S, L, mode='constant')
+
+    for n in range(N):
+        # Does not work with numba/jit
+        nov[n] = np.sum(S_padded[n:n+M, n:n+M] * kernel)
+    if exclude:
+        right = np.min([L, N])
+        left = np.max([0, N-L])
+        nov[0:right] = 0
+        nov[left:N] = 0
+
+    return nov
+
+
+def benchmark_novelty_ssm(sizes=(500, 1000, 2000, 4000), L_set=(5, 10, 20, 40), seed: int = 0):
+    """
+    Times `compute_novelty_ssm` against `novelty_ssm_reference` on random
+    symmetric SSMs and returns a DataFrame with the seconds of both, the
+    speedup and the maximum absolute difference of the outputs.
+    """
+    import time
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for N in sizes:
+        X = rng.random((12, N))
+        X /= np.linalg.norm(X, axis=0)
+        S = X.T @ X
+        for L in L_set:
+            kernel = compute_kernel_checkerboard_gaussian(L=L, var=0.5)
+            t0 = time.perf_counter()
+            ref = novelty_ssm_reference(S, kernel=kernel, L=L)
+            t1 = time.perf_counter()
+            nov = compute_novelty_ssm(S, kernel=kernel, L=L)
+            t2 = time.perf_counter()
+            rows.append(dict(N=N, L=L, loop_seconds=t1 - t0, diagonal_seconds=t2 - t1,
+                             speedup=(t1 - t0) / (t2 - t1), max_abs_diff=np.max(np.abs(nov - ref))))
+    return pd.DataFrame(rows)
+
+
+@dataclass
+class NoveltyResult:
+    times: np.ndarray
+    novelty: np.ndarray
+    kernel_size: int
+
+
+def compute_novelty(y: npt.ArrayLike, sr: int, L: int = 10, hop_length: int = 1024,
+                    mode: str = "dense", bandwidth: int = 256, k: int = 5,
+                    beat_synchronous: bool = False, aggregate: str = "median",
+                    mutual: bool = False, beat_component: Optional[str] = None) -> NoveltyResult:
+    """
+    Computes the checkerboard-kernel novelty curve of the affinity
+    self-similarity matrix of the given mode (see `compute_ssm`; the modes
+    use different similarities, so the curves differ). With mode="band" and
+    bandwidth >= 2L the result equals the novelty of the dense cosine SSM
+    of the same features, not of the mode="dense" matrix. With
+    `beat_synchronous`, L and bandwidth count beats and `times` are the beat
+    starts.
+    """
+    R = compute_ssm(y, sr, mode=mode, hop_length=hop_length, affinity=True, bandwidth=bandwidth, k=k,
+                    beat_synchronous=beat_synchronous, aggregate=aggregate, mutual=mutual,
+                    beat_component=beat_component)
+    nov = compute_novelty_ssm(R, L=L, exclude=True)
+    frames = np.arange(len(nov))
+    if beat_synchronous:
+        frames = get_ssm_feature(y, sr, hop_length, True, aggregate, beat_component)[1][:-1]
+    times = librosa.frames_to_time(frames, sr=sr, hop_length=hop_length)
+    return NoveltyResult(times, nov, L)
+
+
+#%% Timbre
+@dataclass
+class SpectralCentroidResult:
+    times: np.ndarray
+    centroid: np.ndarray  # shape=(1, n_frames)
+
+
+@dataclass
+class RolloffResult:
+    times: np.ndarray
+    rolloff: np.ndarray      # shape=(1, n_frames)
+    rolloff_min: np.ndarray  # roll_percent=0.01
+    roll_percent: float
+
+
+@dataclass
+class SpectralBandwidthResult:
+    times: np.ndarray
+    bandwidth: np.ndarray  # shape=(1, n_frames)
+    centroid: np.ndarray
+
+
+@dataclass
+class HPSSResult:
+    D: np.ndarray
+    H: np.ndarray
+    P: np.ndarray
+    times: np.ndarray
+
+
+@dataclass
+class TimbreResult:
+    times: np.ndarray
+    descriptors: Dict[str, np.ndarray]  # see src.timbre.timbre_descriptors
+    roll_percents: tuple                # rows of descriptors["rolloff"]
+
+    def rolloff(self, roll_percent: float) -> np.ndarray:
+        """Rolloff frequencies of `roll_percent`, shape=(1, n_frames)."""
+        i = self.roll_percents.index(roll_percent)
+        return self.descriptors["rolloff"][i:i + 1]
+
+
+def compute_timbre(
+    y: npt.ArrayLike,
+    sr: int,
+    descriptors=timbre.TIMBRE_DESCRIPTORS,
+    roll_percents=(0.85,),
+    n_mfcc: int = 20,
+) -> TimbreResult:
+    """
+    All requested timbre descriptors of `y` from the shared magnitude
+    spectrogram in one sweep (`src.timbre.timbre_descriptors`), cached per
+    (signal, sr, descriptors, roll_percents, n_mfcc).
+    """
+    descriptors = tuple(sorted(set(descriptors)))
+    roll_percents = tuple(sorted(set(float(p) for p in roll_percents)))
+
+    def compute():
+        result = timbre.timbre_descriptors(get_magnitude(y), sr, descriptors=descriptors,
+                                           roll_percents=roll_percents, n_mfcc=n_mfcc, y=y)
+        return tuple(result[name] for name in descriptors)
+
+    values = cached_feature(y, "timbre", (sr, descriptors, roll_percents, n_mfcc), compute)
+    n_frames = get_magnitude(y).shape[1]
+    return TimbreResult(librosa.times_like(n_frames, sr=sr), dict(zip(descriptors, values)), roll_percents)
+
+
+def compute_spectral_centroid(y: npt.ArrayLike, sr: int) -> SpectralCentroidResult:
+    result = compute_timbre(y, sr, descriptors=("centroid",))
+    return SpectralCentroidResult(result.times, result.descriptors["centroid"])
+
+
+def compute_rolloff(y: npt.ArrayLike, sr: int, roll_percent: float = 0.99) -> RolloffResult:
+    result = compute_timbre(y, sr, descriptors=("rolloff",), roll_percents=(roll_percent, 0.01))
+    return RolloffResult(result.times, result.rolloff(roll_percent), result.rolloff(0.01), roll_percent)
+
+
+def compute_spectral_bandwidth(y: npt.ArrayLike, sr: int) -> SpectralBandwidthResult:
+    result = compute_timbre(y, sr, descriptors=("bandwidth", "centroid"))
+    return SpectralBandwidthResult(result.times, result.descriptors["bandwidth"], result.descriptors["centroid"])
+
+
+def compute_hpss(y: npt.ArrayLike, sr: int, downsample: int = 1) -> HPSSResult:
+    """
+    Harmonic/percussive separation of the STFT of `y` with the cached masks
+    of `get_hpss_masks` (equal to `librosa.decompose.hpss(D)` for
+    `downsample=1`, see `src.hpss`).
+    """
+    D = get_stft(y)
+    mask_harm, mask_perc = get_hpss_masks(y, downsample=downsample)
+    t = librosa.frames_to_time(np.arange(D.shape[1]), sr=sr)
+    return HPSSResult(D, D * mask_harm, D * mask_perc, t)
+
+
+def benchmark_hpss(durations=(30, 120, 240), sr: int = 22050, downsample=(1, 2, 3), seed: int = 0):
+    """
+    Times the masks of `src.hpss.hpss_masks` against
+    `librosa.decompose.hpss(..., mask=True)` on noise with clicks and
+    returns a DataFrame with the seconds of both, the speedup, the mean
+    absolute mask difference and the relative error of the harmonic part.
+    The numba functions are compiled before timing.
+    """
+    import time
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    # 先編譯numba函式，避免第一次的計時包含JIT編譯時間
+    hpss.hpss_masks(np.ones((8, 8), dtype=np.float32), kernel_size=3)
+    rows = []
+    for duration in durations:
+        n = int(duration * sr)
+        y = 0.1 * rng.standard_normal(n) + np.sin(2 * np.pi * 220 * np.arange(n) / sr)
+        y += librosa.clicks(times=np.arange(0, duration, 0.5), sr=sr, length=n)
+        S = np.abs(librosa.stft(y.astype(np.float32)))
+        t0 = time.perf_counter()
+        ref_harm, _ = librosa.decompose.hpss(S, mask=True)
+        t1 = time.perf_counter()
+        for f in downsample:
+            t2 = time.perf_counter()
+            mask_harm, _ = hpss.hpss_masks(S, downsample=f)
+            t3 = time.perf_counter()
+            rows.append(dict(seconds=duration, downsample=f, librosa_seconds=t1 - t0,
+                             fast_seconds=t3 - t2, speedup=(t1 - t0) / (t3 - t2),
+                             mask_mae=np.mean(np.abs(mask_harm - ref_harm)),
+                             harmonic_rel_error=np.linalg.norm(S * (mask_harm - ref_harm)) / np.linalg.norm(S * ref_harm)))
+    return pd.DataFrame(rows)
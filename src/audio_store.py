@@ -0,0 +1,67 @@
+import hashlib
+import io
+
+import librosa
+import numpy as np
+
+from src.cache import LRUCache, env_megabytes
+from src.features import register_signal
+
+# 解碼後音訊的快取，整個process共用（所有頁面、所有使用者）
+# 預算可用環境變數 AUDIOVIZ_AUDIO_CACHE_MB 調整
+_audio_cache = LRUCache(env_megabytes("AUDIOVIZ_AUDIO_CACHE_MB", 512))
+
+
+def content_hash(data: bytes) -> str:
+    """
+    Returns a hex digest identifying the raw (encoded) bytes of a file.
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def load_audio(file, sr: int = 22050):
+    """
+    Decodes an uploaded file, reusing the cached signal when the same bytes
+    were already decoded at the same sample rate.
+
+    Parameters
+    ----------
+    file : UploadedFile, bytes or file-like
+        The uploaded audio file.
+    sr : int, optional
+        Target sample rate (default 22050).
+
+    Returns
+    -------
+    y : np.ndarray
+        The decoded mono float32 signal. The array is shared between pages
+        and sessions and is therefore read-only.
+    sr : int
+        The sample rate of `y`.
+    """
+    if isinstance(file, (bytes, bytearray)):
+        data = bytes(file)
+    elif hasattr(file, "getvalue"):
+        data = file.getvalue()
+    else:
+        data = file.read()
+
+    key = (content_hash(data), sr)
+
+    def decode():
+        y, _ = librosa.load(io.BytesIO(data), sr=sr)
+        y = np.array(y, dtype=np.float32)  # 確保持有自己的記憶體，片段才能被辨識為它的view
+        y.flags.writeable = False
+        register_signal(y)
+        return y
+
+    y = _audio_cache.get_or_compute(key, decode)
+    return y, sr
+
+
+def audio_cache_stats() -> dict:
+    return _audio_cache.stats()
+
+
+def clear_audio_cache() -> None:
+    _audio_cache.clear()
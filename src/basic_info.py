@@ -10,7 +10,8 @@ from numpy import typing as npt
 import typing
 
 import plotly.graph_objects as go
-import streamlit as st 
+
+from src.analysis import compute_rms, compute_spectrogram
 
 def plot_waveform(
     x: npt.ArrayLike, 
@@ -96,22 +97,19 @@ def plot_spectrogram(
     ax : matplotlib.axes.Axes or None
         The generated axes object. If `use_plotly` is True, this value will be None.
     """
+    result = compute_spectrogram(y, sr)
     if use_plotly:
-        # Compute the spectrogram
-        Y = librosa.stft(y)
-        frequencies = librosa.fft_frequencies(sr=sr)
-        times = librosa.times_like(Y)
+        frequencies = result.frequencies
+        times = result.times
         get_note = np.vectorize(lambda x: librosa.hz_to_note(x) if x>0 else "")
         notes = get_note(frequencies)
-        notes_martix = np.repeat(notes.reshape(-1, 1), Y.shape[1], axis=1)
+        notes_martix = np.repeat(notes.reshape(-1, 1), result.S_db.shape[1], axis=1)
         
         # 建立圖表
         fig = go.Figure()
         fig.add_trace(
             go.Heatmap(
-                z=librosa.amplitude_to_db(
-                    np.abs(Y), ref=np.max
-                ),
+                z=result.S_db,
                 x=times + shift_time,
                 y=frequencies,
                 colorscale="Viridis",
@@ -136,11 +134,8 @@ def plot_spectrogram(
             fig, ax = plt.subplots()
         else:
             fig = ax.get_figure()
-        D = librosa.amplitude_to_db(
-            np.abs(librosa.stft(y)), ref=np.max
-        )
         img = librosa.display.specshow(
-            D, x_axis="time", y_axis="log", sr=sr, ax=ax
+            result.S_db, x_axis="time", y_axis="log", sr=sr, ax=ax
         )
         if show_colorbar:
             fig.colorbar(img, ax=ax, format="%+2.0f dB")
@@ -199,8 +194,9 @@ def signal_RMS_analysis(
     fig, ax, times, rms = signal_RMS_analysis(y, use_plotly=False)
     plt.show()
     """
-    rms = librosa.feature.rms(y = y)
-    times = librosa.times_like(rms) + shift_time
+    result = compute_rms(y)
+    rms = result.rms
+    times = result.times + shift_time
     
     if use_plotly:
         fig = go.Figure()
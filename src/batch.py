@@ -0,0 +1,379 @@
+"""
+Batch analysis of whole directories from the command line.
+
+    python -m src.batch music/ -o results/ -a rms,chroma,beats -j 4
+
+Every track gets its own output directory holding one table per analysis
+(parquet if pyarrow is installed, otherwise CSV) and a `manifest.json`
+recording the finished analyses. Running the same command again skips the
+analyses already recorded, so an interrupted run can simply be restarted.
+A per-file timing report is written to `<output>/timings.csv`.
+
+The analyses go through `src.analysis`, i.e. the same code and the same disk
+cache as the web UI.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src import analysis
+from src.audio_store import clear_audio_cache, load_audio
+from src.features import clear_feature_cache
+from src.streaming import analyze_stream
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aiff", ".aif")
+MANIFEST = "manifest.json"
+
+
+#%% 每個分析輸出一張表，每列為一個frame
+def _rms_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_rms(y, sr)
+    return pd.DataFrame({"time": result.times, "rms": result.rms[0]})
+
+
+def _chroma_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_chroma(y, sr)
+    df = pd.DataFrame(result.chroma.T, columns=analysis.CHROMA_LABELS)
+    df.insert(0, "time", result.times)
+    return df
+
+
+def _chords_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_chords(y, sr)
+    return pd.DataFrame({"time": result.times, "chord": result.labels})
+
+
+def _onsets_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_onsets(y, sr)
+    onset = np.zeros(len(result.envelope), dtype=bool)
+    onset[result.onset_frames] = True
+    return pd.DataFrame({"time": result.times, "strength": result.envelope, "onset": onset})
+
+
+def _beats_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_beats(y, sr)
+    beat = np.zeros(len(result.envelope), dtype=bool)
+    beat[result.beats] = True
+    return pd.DataFrame({"time": result.times, "strength": result.envelope, "beat": beat})
+
+
+def _tempo_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_static_tempo(y, sr)
+    return pd.DataFrame({"tempo": [result.tempo], "tempo_uniform_prior": [result.utempo]})
+
+
+def _timbre_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_timbre(y, sr, descriptors=("centroid", "bandwidth", "rolloff", "flatness", "zcr"),
+                                     roll_percents=(0.99, 0.01))
+    return pd.DataFrame({
+        "time": result.times,
+        "centroid": result.descriptors["centroid"][0],
+        "bandwidth": result.descriptors["bandwidth"][0],
+        "rolloff": result.rolloff(0.99)[0],
+        "rolloff_min": result.rolloff(0.01)[0],
+        "flatness": result.descriptors["flatness"][0],
+        "zcr": result.descriptors["zcr"][0],
+    })
+
+
+def _f0_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_f0(y, sr)
+    return pd.DataFrame({
+        "time": result.times,
+        "f0": result.f0,
+        "voiced": result.voiced_flag,
+        "voiced_prob": result.voiced_probs,
+    })
+
+
+def _novelty_table(y, sr) -> pd.DataFrame:
+    result = analysis.compute_novelty(y, sr)
+    return pd.DataFrame({"time": result.times, "novelty": result.novelty})
+
+
+def _stream_table(track: str) -> pd.DataFrame:
+    result = analyze_stream(track)
+    if result is None:
+        raise ValueError("track is shorter than one frame")
+    df = pd.DataFrame({
+        "time": result.times,
+        "rms": result.rms,
+        "onset_strength": result.onset_strength,
+        "centroid": result.centroid,
+        "bandwidth": result.bandwidth,
+        "rolloff": result.rolloff,
+        "flatness": result.flatness,
+    })
+    for label, row in zip(analysis.CHROMA_LABELS, result.chroma):
+        df[label] = row
+    return df
+
+
+ANALYSES: Dict[str, Callable[[np.ndarray, int], pd.DataFrame]] = {
+    "rms": _rms_table,
+    "chroma": _chroma_table,
+    "chords": _chords_table,
+    "onsets": _onsets_table,
+    "beats": _beats_table,
+    "tempo": _tempo_table,
+    "timbre": _timbre_table,
+    "f0": _f0_table,
+    "novelty": _novelty_table,
+}
+
+# 直接從檔案分段讀取計算，不需要把整首歌載入記憶體(適合很長的錄音)
+STREAM_ANALYSES: Dict[str, Callable[[str], pd.DataFrame]] = {
+    "stream": _stream_table,
+}
+
+
+#%% 輸入與輸出
+def find_tracks(inputs: List[str]) -> List[str]:
+    """
+    Expands the inputs into a sorted list of audio files. An input is a
+    directory (searched recursively), an audio file, or a text file listing
+    one path per line.
+    """
+    tracks = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for f in files:
+                    if f.lower().endswith(AUDIO_EXTENSIONS):
+                        tracks.add(os.path.join(root, f))
+        elif item.lower().endswith(".txt"):
+            with open(item, encoding="utf-8") as f:
+                tracks.update(line.strip() for line in f if line.strip())
+        else:
+            tracks.add(item)
+    return sorted(os.path.abspath(t) for t in tracks)
+
+
+def track_dir(output: str, track: str) -> str:
+    """
+    Output directory of a track: the file name plus a short hash of its
+    full path, so equal names in different folders do not collide.
+    """
+    stem = os.path.splitext(os.path.basename(track))[0]
+    digest = hashlib.blake2b(track.encode(), digest_size=4).hexdigest()
+    return os.path.join(output, f"{stem}-{digest}")
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _write_table(df: pd.DataFrame, path_stem: str, fmt: str) -> str:
+    path = f"{path_stem}.{fmt}"
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def read_manifest(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(directory: str, manifest: dict) -> None:
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+#%% worker
+def analyze_track(track: str, output: str, analyses: List[str], sr: int = 22050,
+                  fmt: str = "csv", overwrite: bool = False) -> List[dict]:
+    """
+    Runs the requested analyses on one track and writes their tables.
+
+    Returns one timing record per analysis with the keys track, analysis,
+    status ('done', 'skipped' or 'failed'), seconds and error.
+    """
+    directory = track_dir(output, track)
+    os.makedirs(directory, exist_ok=True)
+    manifest = {} if overwrite else read_manifest(directory)
+    manifest.setdefault("source", track)
+    done = manifest.setdefault("analyses", {})
+
+    records = []
+    todo = []
+    for name in analyses:
+        entry = done.get(name)
+        if entry and os.path.exists(os.path.join(directory, entry["file"])):
+            records.append(dict(track=track, analysis=name, status="skipped",
+                                seconds=entry["seconds"], error=""))
+        else:
+            todo.append(name)
+    if not todo:
+        return records
+
+    def run_analysis(name, compute):
+        t0 = time.perf_counter()
+        try:
+            df = compute()
+            path = _write_table(df, os.path.join(directory, name), fmt)
+        except Exception as e:
+            records.append(dict(track=track, analysis=name, status="failed",
+                                seconds=time.perf_counter() - t0, error=repr(e)))
+            traceback.print_exc()
+            return
+        seconds = time.perf_counter() - t0
+        done[name] = {"file": os.path.basename(path), "seconds": seconds}
+        _write_manifest(directory, manifest) # 每完成一項就記錄，中斷後可從這裡繼續
+        records.append(dict(track=track, analysis=name, status="done",
+                            seconds=seconds, error=""))
+
+    for name in [n for n in todo if n in STREAM_ANALYSES]:
+        run_analysis(name, lambda: STREAM_ANALYSES[name](track))
+    todo = [n for n in todo if n not in STREAM_ANALYSES]
+    if not todo:
+        return records
+
+    try:
+        t0 = time.perf_counter()
+        with open(track, "rb") as f:
+            y, sr = load_audio(f, sr=sr)
+        records.append(dict(track=track, analysis="load", status="done",
+                            seconds=time.perf_counter() - t0, error=""))
+        manifest["duration"] = len(y) / sr
+        manifest["sr"] = sr
+
+        for name in todo:
+            run_analysis(name, lambda: ANALYSES[name](y, sr))
+    except Exception as e:
+        records.append(dict(track=track, analysis="load", status="failed",
+                            seconds=0.0, error=repr(e)))
+    finally:
+        # worker會連續處理很多首歌，不保留上一首的記憶體快取
+        clear_audio_cache()
+        clear_feature_cache()
+    return records
+
+
+#%% CLI
+def run(tracks: List[str], output: str, analyses: List[str], workers: int = 1,
+        sr: int = 22050, fmt: str = "csv", overwrite: bool = False) -> pd.DataFrame:
+    """
+    Analyzes `tracks` with `workers` processes and returns the timing report.
+    """
+    os.makedirs(output, exist_ok=True)
+    records = []
+    if workers <= 1:
+        for i, track in enumerate(tracks, 1):
+            records += analyze_track(track, output, analyses, sr, fmt, overwrite)
+            _progress(i, len(tracks), track)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(analyze_track, track, output, analyses, sr, fmt, overwrite): track
+                for track in tracks
+            }
+            for i, future in enumerate(as_completed(futures), 1):
+                track = futures[future]
+                try:
+                    records += future.result()
+                except Exception as e:  # worker process crashed
+                    records.append(dict(track=track, analysis="load", status="failed",
+                                        seconds=0.0, error=repr(e)))
+                _progress(i, len(tracks), track)
+
+    report = pd.DataFrame(records, columns=["track", "analysis", "status", "seconds", "error"])
+    report.to_csv(os.path.join(output, "timings.csv"), index=False)
+    return report
+
+
+def _progress(i: int, n: int, track: str) -> None:
+    print(f"[{i}/{n}] {track}", flush=True)
+
+
+def _summary(report: pd.DataFrame) -> str:
+    if report.empty:
+        return "No tracks analyzed."
+    counts = report.groupby("status").size().to_dict()
+    ran = report[report["status"] == "done"]
+    per_analysis = ran.groupby("analysis")["seconds"].agg(["count", "mean", "sum"])
+    lines = [
+        "Status: " + ", ".join(f"{k}={v}" for k, v in counts.items()),
+        "Seconds per analysis:",
+        per_analysis.round(3).to_string(),
+    ]
+    failed = report[report["status"] == "failed"]
+    if not failed.empty:
+        lines.append(f"{failed['track'].nunique()} track(s) had failures, see timings.csv")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m src.batch",
+        description="Analyze audio files in batch and write per-track tables.",
+    )
+    parser.add_argument("inputs", nargs="+",
+                        help="audio files, directories, or .txt files listing one path per line")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("-a", "--analyses", default="all",
+                        help=f"comma separated subset of {','.join(ANALYSES)} (default: all), "
+                             "or 'stream' for block-wise features of very long recordings")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--sr", type=int, default=22050, help="sample rate (default: 22050)")
+    parser.add_argument("--format", choices=["auto", "parquet", "csv"], default="auto",
+                        help="table format; auto uses parquet when pyarrow is installed")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="recompute analyses already recorded in the manifests")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    if args.analyses == "all":
+        analyses = list(ANALYSES)
+    else:
+        analyses = [a.strip() for a in args.analyses.split(",") if a.strip()]
+        unknown = [a for a in analyses if a not in ANALYSES and a not in STREAM_ANALYSES]
+        if unknown:
+            print(f"Unknown analyses: {', '.join(unknown)}", file=sys.stderr)
+            return 2
+
+    fmt = args.format
+    if fmt == "auto":
+        fmt = "parquet" if parquet_available() else "csv"
+    elif fmt == "parquet" and not parquet_available():
+        print("Writing parquet requires pyarrow (pip install pyarrow)", file=sys.stderr)
+        return 2
+
+    tracks = find_tracks(args.inputs)
+    if not tracks:
+        print("No audio files found.", file=sys.stderr)
+        return 1
+
+    report = run(tracks, args.output, analyses, args.workers, args.sr, fmt, args.overwrite)
+    print(_summary(report))
+    return 1 if (report["status"] == "failed").any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,17 +11,26 @@ import soundfile as sf
 from numpy import typing as npt
 from typing import List, Tuple
 
+from src.features import get_db, get_mel_db
+from src.analysis import (
+    compute_beats,
+    compute_onset_strengths,
+    compute_onsets,
+    compute_plp,
+    compute_rate_curve,
+    compute_static_tempo,
+    compute_tempogram,
+    RateCurve,
+)
+
 def onsets_detection(y: npt.ArrayLike, sr: int, shift_array: npt.ArrayLike) -> tuple :
     """
         計算音檔的onset frames
     """
-    o_env = librosa.onset.onset_strength(y=y, sr=sr)
-    times = librosa.times_like(o_env, sr=sr)
-    onset_frames = librosa.onset.onset_detect(onset_envelope=o_env, sr=sr)
-    D = np.abs(librosa.stft(y))
+    result = compute_onsets(y, sr)
 
     fig, ax = plt.subplots()
-    librosa.display.specshow(librosa.amplitude_to_db(D, ref=np.max),
+    librosa.display.specshow(get_db(y),
                              x_axis='time', y_axis='log', ax=ax, sr=sr)
     ax.set_xticks(shift_array - shift_array[0],
                       shift_array)
@@ -30,7 +39,7 @@ def onsets_detection(y: npt.ArrayLike, sr: int, shift_array: npt.ArrayLike) -> t
     ax.set(title='Power spectrogram')
 
 
-    return fig, ax, (o_env, times, onset_frames)
+    return fig, ax, (result.envelope, result.times, result.onset_frames)
 
 def onset_click_plot(
     o_env, 
@@ -63,32 +72,20 @@ def onset_click_plot(
 
 def plot_onset_strength(y: npt.ArrayLike, sr:int, standard: bool = True, custom_mel: bool = False, cqt: bool = False, shift_array: npt.ArrayLike = None) -> tuple:
     
-    D = np.abs(librosa.stft(y))
-    times = librosa.times_like(D, sr)
+    result = compute_onset_strengths(y, sr, standard=standard, custom_mel=custom_mel, cqt=cqt)
+    times = result.times
 
     fig, ax = plt.subplots(nrows=2, sharex=True)
-    librosa.display.specshow(librosa.amplitude_to_db(D, ref=np.max),
+    librosa.display.specshow(get_db(y),
                              y_axis='log', x_axis='time', ax=ax[0], sr=sr)
     
     ax[0].set(title='Power spectrogram')
     ax[0].label_outer()
 
     # Standard Onset Fuction 
-
-    if standard :
-        onset_env_standard = librosa.onset.onset_strength(y=y, sr=sr)
-        ax[1].plot(times, 2 + onset_env_standard / onset_env_standard.max(), alpha=0.8, label='Mean (mel)')
-    
-    if custom_mel :
-        onset_env_mel = librosa.onset.onset_strength(y=y, sr=sr,
-                                                     aggregate=np.median,
-                                                     fmax=8000, n_mels=256)
-        ax[1].plot(times, 1 + onset_env_mel / onset_env_mel.max(), alpha=0.8, label='Median (custom mel)')
-    
-    if cqt :
-        C = np.abs(librosa.cqt(y=y, sr=sr))
-        onset_env_cqt = librosa.onset.onset_strength(sr=sr, S=librosa.amplitude_to_db(C, ref=np.max))
-        ax[1].plot(times, onset_env_cqt / onset_env_cqt.max(), alpha=0.8, label='Mean (CQT)')
+    offsets = {'Mean (mel)': 2, 'Median (custom mel)': 1, 'Mean (CQT)': 0} # 三條曲線上下錯開
+    for label, onset_env in result.envelopes.items():
+        ax[1].plot(times, offsets[label] + onset_env / onset_env.max(), alpha=0.8, label=label)
 
     ax[1].legend()
     ax[1].set(ylabel='Normalized strength', yticks=[])
@@ -100,26 +97,25 @@ def plot_onset_strength(y: npt.ArrayLike, sr:int, standard: bool = True, custom_
     return fig, ax
 
 
-def beat_analysis(y: npt.ArrayLike, sr:int, spec_type: str = 'mel', spec_hop_length: int = 512, shift_array: npt.ArrayLike = np.array([], dtype=np.float32), ax=None) :
-    
+def beat_analysis(y: npt.ArrayLike, sr:int, spec_type: str = 'mel', spec_hop_length: int = 512, shift_array: npt.ArrayLike = np.array([], dtype=np.float32), ax=None,
+                  component: str = None) :
+    """
+        component="percussive"時只用HPSS的打擊樂成分追蹤beat
+    """
     if ax is None:
         fig, ax = plt.subplots()
     else:
         fig = ax.get_figure()
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr, aggregate=np.median)
-    tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
-    times = librosa.times_like(onset_env, sr=sr, hop_length=spec_hop_length)
+    result = compute_beats(y, sr, component=component)
 
     if spec_type == 'mel':
-        M = librosa.feature.melspectrogram(y=y, sr=sr, hop_length=spec_hop_length)
-        librosa.display.specshow(librosa.power_to_db(M, ref=np.max), 
+        librosa.display.specshow(get_mel_db(y, sr, hop_length=spec_hop_length), 
                                  y_axis='mel', x_axis='time', hop_length=spec_hop_length,
                                  ax=ax, sr=sr)
         ax.set(title='Mel spectrogram')
 
     if spec_type == 'stft':
-        S = np.abs(librosa.stft(y))
-        img = librosa.display.specshow(librosa.amplitude_to_db(S, ref=np.max), 
+        img = librosa.display.specshow(get_db(y), 
                                        y_axis='log', x_axis='time', ax=ax, sr=sr)
         
         ax.set_title('Power spectrogram')
@@ -131,7 +127,7 @@ def beat_analysis(y: npt.ArrayLike, sr:int, spec_type: str = 'mel', spec_hop_len
     ax.set_xlabel('Time (s)')
     
     
-    return fig, ax, (times, onset_env, tempo, beats)
+    return fig, ax, (result.times, result.envelope, result.tempo, result.beats)
 
 def beat_plot(times, onset_env, tempo, beats, y_len, sr, shift_time, ax=None):
     """
@@ -156,14 +152,12 @@ def beat_plot(times, onset_env, tempo, beats, y_len, sr, shift_time, ax=None):
 
 def predominant_local_pulse(y: npt.ArrayLike, sr:int, shift_time:float=0) -> tuple :
 
-    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-    pulse = librosa.beat.plp(onset_envelope=onset_env, sr=sr)
-    beats_plp = np.flatnonzero(librosa.util.localmax(pulse))
-    times = librosa.times_like(pulse, sr=sr)
+    result = compute_plp(y, sr)
+    times = result.times
 
     fig, ax = plt.subplots()
-    ax.plot(times + shift_time, librosa.util.normalize(pulse),label='PLP')
-    ax.vlines(times[beats_plp] + shift_time, 0, 1, alpha=0.5, color='r', 
+    ax.plot(times + shift_time, librosa.util.normalize(result.pulse),label='PLP')
+    ax.vlines(times[result.beats] + shift_time, 0, 1, alpha=0.5, color='r', 
              linestyle='--', label='PLP Beats')
     ax.legend()
     ax.set(title="Predominant local pulse")
@@ -183,18 +177,9 @@ def static_tempo_estimation(y: npt.ArrayLike, sr: int, hop_length: int = 512) ->
   
   '''
 
-  onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-  tempo = librosa.beat.tempo(onset_envelope=onset_env, sr=sr)
-
-  # Static tempo estimation
-  prior = scipy.stats.uniform(30, 300)  # uniform over 30-300 BPM
-  utempo = librosa.beat.tempo(onset_envelope=onset_env, sr=sr, prior=prior)
-
-  tempo = tempo.item()
-  utempo = utempo.item()
-  ac = librosa.autocorrelate(onset_env, max_size=2 * sr // hop_length)
-  freqs = librosa.tempo_frequencies(len(ac), sr=sr,
-                                   hop_length=hop_length)
+  result = compute_static_tempo(y, sr, hop_length=hop_length)
+  tempo, utempo = result.tempo, result.utempo
+  ac, freqs = result.autocorrelation, result.freqs
 
   fig, ax = plt.subplots()
   ax.semilogx(freqs[1:], librosa.util.normalize(ac)[1:],
@@ -212,23 +197,21 @@ def static_tempo_estimation(y: npt.ArrayLike, sr: int, hop_length: int = 512) ->
 
 def plot_tempogram(y: npt.ArrayLike, sr: int, type: str = 'autocorr', hop_length: int = 512, shift_array: npt.ArrayLike = None) -> tuple :
     
-    oenv = librosa.onset.onset_strength(y=y, sr=sr, hop_length=hop_length)
-    tempogram = librosa.feature.fourier_tempogram(onset_envelope=oenv, sr=sr, hop_length=hop_length)
-    tempo = librosa.beat.tempo(onset_envelope=oenv, sr=sr, hop_length=hop_length)[0]
+    result = compute_tempogram(y, sr, kind=type, hop_length=hop_length)
+    tempo = result.tempo
 
     fig, ax = plt.subplots()
 
     if type == 'fourier' :
         # To determine which temp to show?
-        librosa.display.specshow(np.abs(tempogram), sr=sr, hop_length=hop_length, 
+        librosa.display.specshow(result.tempogram, sr=sr, hop_length=hop_length, 
                                  x_axis='time', y_axis='fourier_tempo', cmap='magma')
         ax.axhline(tempo, color='w', linestyle='--', alpha=1, label='Estimated tempo={:g}'.format(tempo))
         ax.legend(loc='upper right')
         # ax.title('Fourier Tempogram')
 
     if type == 'autocorr' :
-        ac_tempogram = librosa.feature.tempogram(onset_envelope=oenv, sr=sr, hop_length=hop_length, norm=None)
-        librosa.display.specshow(ac_tempogram, sr=sr, hop_length=hop_length, x_axis='time', y_axis='tempo', cmap='magma')
+        librosa.display.specshow(result.tempogram, sr=sr, hop_length=hop_length, x_axis='time', y_axis='tempo', cmap='magma')
         ax.axhline(tempo, color='w', linestyle='--', alpha=1, label='Estimated tempo={:g}'.format(tempo))
         ax.legend(loc='upper right')
         # ax.title('Autocorrelation Tempogram')
@@ -248,6 +231,7 @@ def plot_bpm(
     xtitle = "Time (s)",
     ytitle = "Beats / min",
     step_size: float = 0.5,
+    rate_curve: RateCurve = None,
 ) -> Tuple[plt.Figure, plt.Axes]:
     """
     Parameters:
@@ -255,6 +239,7 @@ def plot_bpm(
         time_shift (float): 將時間軸上的點向右移動的時間量。
         window_size (int): 用於計算移動平均數的窗口大小。
         plot_with_plotly (bool): 如果為 True，使用 Plotly 繪製曲線；否則，使用 Matplotlib 繪製曲線。
+        rate_curve (RateCurve): 已算好各種window的曲線時傳入，只會增量更新有變動的節拍。
 
     Returns:
         Tuple[plt.Figure, plt.Axes] or go.Figure: 返回繪製的圖形對象。
@@ -264,19 +249,11 @@ def plot_bpm(
         ValueError: 如果 `beat_times` 不是一個有效的數字數組。
         ValueError: 如果 `window_size` 不是正整數。
     """
-
-    def count_onset(x, onset_times, window=3.0):
-        delta = window/2.0
-        return len(onset_times[(onset_times > x-delta) & (onset_times < x+delta)])
-
-    def get_bpm_array(onset_times, window=3, step=0.5):
-        start_t = window/2.0
-        end_t = onset_times[-1] - window/2.0
-        time_array = np.arange(start_t, end_t, step)
-        bpm_array = np.array([count_onset(x, onset_times, window) for x in time_array]) * 60 / window
-        return time_array, bpm_array
-    
-    time_array, bpm_array = get_bpm_array(beat_times, window_size, step_size)
+    if rate_curve is not None and window_size in rate_curve.windows and rate_curve.step == step_size:
+        rate_curve.update(beat_times)
+        time_array, bpm_array = rate_curve.curve(window_size)
+    else:
+        time_array, bpm_array = compute_rate_curve(beat_times, window_size, step_size)
     
     if use_plotly:
         fig = go.Figure(data=go.Scatter(x=time_array + shift_time, y=bpm_array, mode='lines+markers', name=f'MA{window_size}'))
@@ -0,0 +1,125 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def nbytes_of(value) -> int:
+    """
+    Estimates the memory footprint of a cached value.
+
+    Numpy arrays report their buffer size, tuples/lists/dicts are summed
+    recursively and everything else counts as 0 bytes.
+    """
+    if isinstance(value, np.ndarray):
+        # view不持有記憶體，但為了保守估計仍計入
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes_of(v) for v in value)
+    if isinstance(value, dict):
+        return sum(nbytes_of(v) for v in value.values())
+    if hasattr(value, "__dataclass_fields__"):
+        return sum(nbytes_of(getattr(value, k)) for k in value.__dataclass_fields__)
+    return 0
+
+
+def env_megabytes(name: str, default: float) -> int:
+    """
+    Reads a size in megabytes from the environment variable `name`
+    and returns it in bytes.
+    """
+    try:
+        value = float(os.environ.get(name, default))
+    except ValueError:
+        value = float(default)
+    return int(value * 1024 * 1024)
+
+
+class LRUCache:
+    """
+    A thread-safe least-recently-used cache bounded by a byte budget.
+
+    Streamlit runs every session in its own thread of the same process,
+    so one instance of this class is shared by all pages and users.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Byte budget. When the total size of the stored values exceeds it,
+        the least recently used entries are evicted.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value) -> None:
+        size = nbytes_of(value)
+        with self._lock:
+            if key in self._data:
+                self.current_bytes -= self._sizes.pop(key)
+                del self._data[key]
+            if size > self.max_bytes:
+                # 單一項目超過預算時不快取
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.current_bytes += size
+            self._evict()
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the value stored under `key`, calling `compute()` and storing
+        its result on a miss.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict(self) -> None:
+        while self.current_bytes > self.max_bytes and self._data:
+            key, _ = self._data.popitem(last=False)
+            self.current_bytes -= self._sizes.pop(key)
+
+
+_MISSING = object()
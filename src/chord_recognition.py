@@ -10,6 +10,21 @@ import libfmp.c4
 
 import sys
 
+from src.features import get_chroma
+from src.heatmap import get_cmap, plot_heatmap, time_ticks
+
+from src.analysis import (
+    CHORD_LABELS,
+    ChordSegments,
+    chord_recognition_hmm,
+    chord_recognition_template,
+    chord_table,
+    compute_chromagram,
+    generate_chord_templates,
+    get_beat_bounds,
+    recognize_chords,
+)
+
 def compute_chromagram_from_filename(fn_wav, Fs=22050, N=4096, H=2048, gamma=None, version='STFT', norm='2'):
     """Compute chromagram for WAV file specified by filename
 
@@ -36,63 +51,15 @@ def compute_chromagram_from_filename(fn_wav, Fs=22050, N=4096, H=2048, gamma=Non
     x_dur = x.shape[0] / Fs
     if version == 'STFT':
         # Compute chroma features with STFT
-        X = librosa.stft(x, n_fft=N, hop_length=H, pad_mode='constant', center=True)
-        if gamma is not None:
-            X = np.log(1 + gamma * np.abs(X) ** 2)
+        if gamma is None:
+            X = get_chroma(x, Fs, n_fft=N, hop_length=H, tuning=0, norm=None)
         else:
-            X = np.abs(X) ** 2
-        X = librosa.feature.chroma_stft(S=X, sr=Fs, tuning=0, norm=None, hop_length=H, n_fft=N)
-    if version == 'CQT':
-        # Compute chroma features with CQT decomposition
-        X = librosa.feature.chroma_cqt(y=x, sr=Fs, hop_length=H, norm=None)
-    if version == 'IIR':
-        # Compute chroma features with filter bank (using IIR elliptic filter)
-        X = librosa.iirt(y=x, sr=Fs, win_length=N, hop_length=H, center=True, tuning=0.0)
-        if gamma is not None:
-            X = np.log(1.0 + gamma * X)
-        X = librosa.feature.chroma_cqt(C=X, bins_per_octave=12, n_octaves=7,
-                                       fmin=librosa.midi_to_hz(24), norm=None)
-    if norm is not None:
-        X = libfmp.c3.normalize_feature_sequence(X, norm=norm)
-    Fs_X = Fs / H
-    return X, Fs_X, x, Fs, x_dur
-
-def compute_chromagram(y, sr, Fs=22050, N=4096, H=2048, gamma=None, version='STFT', norm='2'):
-    """Compute chromagram for WAV file specified by filename
-
-    Notebook: C5/C5S2_ChordRec_Templates.ipynb
-
-    Args:
-        y (np.ndarray): Audio signal
-        sr (scalar): Sampling rate
-        Fs (scalar): Sampling rate (Default value = 22050)
-        N (int): Window size (Default value = 4096)
-        H (int): Hop size (Default value = 2048)
-        gamma (float): Constant for logarithmic compression (Default value = None)
-        version (str): Technique used for front-end decomposition ('STFT', 'IIS', 'CQT') (Default value = 'STFT')
-        norm (str): If not 'None', chroma vectors are normalized by norm as specified ('1', '2', 'max')
-            (Default value = '2')
-
-    Returns:
-        X (np.ndarray): Chromagram
-        Fs_X (scalar): Feature reate of chromagram
-        x (np.ndarray): Audio signal
-        Fs (scalar): Sampling rate of audio signal
-        x_dur (float): Duration (seconds) of audio signal
-    """
-    x = librosa.resample(y, sr, Fs)
-    x_dur = x.shape[0] / Fs
-    if version == 'STFT':
-        # Compute chroma features with STFT
-        X = librosa.stft(x, n_fft=N, hop_length=H, pad_mode='constant', center=True)
-        if gamma is not None:
+            X = librosa.stft(x, n_fft=N, hop_length=H, pad_mode='constant', center=True)
             X = np.log(1 + gamma * np.abs(X) ** 2)
-        else:
-            X = np.abs(X) ** 2
-        X = librosa.feature.chroma_stft(S=X, sr=Fs, tuning=0, norm=None, hop_length=H, n_fft=N)
+            X = librosa.feature.chroma_stft(S=X, sr=Fs, tuning=0, norm=None, hop_length=H, n_fft=N)
     if version == 'CQT':
         # Compute chroma features with CQT decomposition
-        X = librosa.feature.chroma_cqt(y=x, sr=Fs, hop_length=H, norm=None)
+        X = get_chroma(x, Fs, method='cqt', hop_length=H, norm=None)
     if version == 'IIR':
         # Compute chroma features with filter bank (using IIR elliptic filter)
         X = librosa.iirt(y=x, sr=Fs, win_length=N, hop_length=H, center=True, tuning=0.0)
@@ -125,57 +92,6 @@ def get_chord_labels(ext_minor='m', nonchord=False):
         chord_labels = chord_labels + ['N']
     return chord_labels
 
-def generate_chord_templates(nonchord=False):
-    """Generate chord templates of major and minor triads (and possibly nonchord)
-
-    Notebook: C5/C5S2_ChordRec_Templates.ipynb
-
-    Args:
-        nonchord (bool): If "True" then add nonchord template (Default value = False)
-
-    Returns:
-        chord_templates (np.ndarray): Matrix containing chord_templates as columns
-    """
-    template_cmaj = np.array([1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0]).T
-    template_cmin = np.array([1, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 0]).T
-    num_chord = 24
-    if nonchord:
-        num_chord = 25
-    chord_templates = np.ones((12, num_chord))
-    for shift in range(12):
-        chord_templates[:, shift] = np.roll(template_cmaj, shift)
-        chord_templates[:, shift+12] = np.roll(template_cmin, shift)
-    return chord_templates
-
-def chord_recognition_template(X, norm_sim='1', nonchord=False):
-    """Conducts template-based chord recognition
-    with major and minor triads (and possibly nonchord)
-
-    Notebook: C5/C5S2_ChordRec_Templates.ipynb
-
-    Args:
-        X (np.ndarray): Chromagram
-        norm_sim (str): Specifies norm used for normalizing chord similarity matrix (Default value = '1')
-        nonchord (bool): If "True" then add nonchord template (Default value = False)
-
-    Returns:
-        chord_sim (np.ndarray): Chord similarity matrix
-        chord_max (np.ndarray): Binarized chord similarity matrix only containing maximizing chord
-    """
-    chord_templates = generate_chord_templates(nonchord=nonchord)
-    X_norm = libfmp.c3.normalize_feature_sequence(X, norm='2')
-    chord_templates_norm = libfmp.c3.normalize_feature_sequence(chord_templates, norm='2')
-    chord_sim = np.matmul(chord_templates_norm.T, X_norm)
-    if norm_sim is not None:
-        chord_sim = libfmp.c3.normalize_feature_sequence(chord_sim, norm=norm_sim)
-    # chord_max = (chord_sim == chord_sim.max(axis=0)).astype(int)
-    chord_max_index = np.argmax(chord_sim, axis=0)
-    chord_max = np.zeros(chord_sim.shape).astype(np.int32)
-    for n in range(chord_sim.shape[1]):
-        chord_max[chord_max_index[n], n] = 1
-
-    return chord_sim, chord_max
-
 def plot_chord_recognition(y, sr) :
     import warnings
     warnings.warn("This function is deprecated and will be removed in future versions.", DeprecationWarning)
@@ -221,20 +137,7 @@ def plot_binary_template_chord_recognition(y, sr) :
     return fig, ax
 
 
-def chord_table(chord_max):
-    
-    chord_labels = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'] + ['Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
-    
-    # 計算chord_max依照第一個軸的最大值的index
-    chord_max_index = np.argmax(chord_max, axis=0)
-    # 用index找出對應的chord_labels
-    chord_results = [chord_labels[i] for i in chord_max_index]
-    
-    return chord_results
-
-
 def plot_chord(chroma, title="", figsize=(12, 6), cmap="coolwarm", include_minor=False, shift_time=0.0):
-    import seaborn as sns
     chroma_labels = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
     if include_minor:
         chroma_labels += ['Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
@@ -246,18 +149,12 @@ def plot_chord(chroma, title="", figsize=(12, 6), cmap="coolwarm", include_minor
     n_fft=4096, 
     hop_length=2048
     )
-    duration = times[-1]
-    target_values = np.arange(5, duration, 5)
-    x_ticks_loc = []
-    x_ticks_label = []
-    for target in target_values:
-        cloest_index = np.argmin(np.abs(times-target))
-        x_ticks_loc.append(cloest_index)
-        x_ticks_label.append(int(target)+shift_time)
+    x_ticks_loc, x_ticks_label = time_ticks(times, shift_time)
     
     fig, ax = plt.subplots(figsize=figsize)
     
-    sns.heatmap(chroma, ax=ax, cmap=cmap, linewidths=0.01, linecolor=(1, 1, 1, 0.1))
+    # 和弦結果(include_minor)用max降採樣，短的和弦才不會消失
+    plot_heatmap(chroma, ax=ax, cmap=cmap, reduce="max" if include_minor else "mean")
     ax.invert_yaxis()
     ax.set_yticks(
         np.arange(len(chroma_labels)) + 0.5,
@@ -274,33 +171,51 @@ def plot_chord(chroma, title="", figsize=(12, 6), cmap="coolwarm", include_minor
     )
     return fig, ax
 
+def _draw_chord_segments(ax, segments, x_min, x_max, chroma_labels=CHORD_LABELS):
+    """每個和弦一列，用broken_barh畫出[x_min, x_max)內的segment(超出範圍的部分剪掉)"""
+    color = get_cmap("crest")(1.0)
+    visible = (segments.ends > x_min) & (segments.starts < x_max)
+    starts = np.maximum(segments.starts[visible], x_min)
+    ends = np.minimum(segments.ends[visible], x_max)
+    chords = np.asarray(segments.chords, dtype=object)[visible]
+    for row, label in enumerate(chroma_labels):
+        mask = chords == label
+        if np.any(mask):
+            ax.broken_barh(list(zip(starts[mask], ends[mask] - starts[mask])), (row, 1), facecolors=color)
+
+
 def plot_user_chord(
     df,
     ax = None,
-    shift_time=0.0
+    shift_time=0.0,
+    span=None,
 ):
-    
-    import seaborn as sns
+    """
+    畫出使用者修改後的和弦
+
+    df: 每個frame一列、含"Chord"欄位的DataFrame，或ChordSegments
+    span: (start_frame, end_frame)，只畫這個範圍(例如剛修改過的區段)
+
+    每個和弦用broken_barh畫成一列色塊，成本只與segment數量有關，不需要建立24×N的矩陣
+    """
     chroma_labels = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B'] + ['Cm', 'C#m', 'Dm', 'D#m', 'Em', 'Fm', 'F#m', 'Gm', 'G#m', 'Am', 'A#m', 'Bm']
     
-    # 檢查df["Chord"]無chroma_labels以外的值
-    assert df["Chord"].isin(chroma_labels).all(), "Chord must be in chroma_labels"
-    
-    # 將df["Chord"]轉成chroma_labels的index
-    chord_index = df["Chord"].apply(lambda x: chroma_labels.index(x))
-    
-    # 建立一個24 * len(df)的矩陣，並將值設為0
-    chroma = np.zeros((24, len(df)))
-    # 依照chord_index的值將chroma的值設為1
-    chroma[chord_index, np.arange(len(df)),] = 1
+    segments = df if isinstance(df, ChordSegments) else ChordSegments.from_frame_table(df)
+    # 檢查沒有chroma_labels以外的值
+    assert set(segments.chords) <= set(chroma_labels), "Chord must be in chroma_labels"
+    n_frames = segments.n_frames
+    x_min, x_max = (0, n_frames) if span is None else (max(0, span[0]), min(n_frames, span[1]))
     
     # 繪圖
     if ax is None:
         fig, ax = plt.subplots(figsize=(12, 6))
     else:
         fig = ax.get_figure()
-    sns.heatmap(chroma, ax=ax, cmap='crest', linewidths=0.01, linecolor=(1, 1, 1, 0.1), cbar=False)
-    ax.invert_yaxis()
+    cmap = get_cmap("crest")
+    ax.set_facecolor(cmap(0.0))  # 與原本heatmap的0相同的底色
+    _draw_chord_segments(ax, segments, x_min, x_max, chroma_labels)
+    ax.set_xlim(x_min, x_max)
+    ax.set_ylim(0, len(chroma_labels))
     ax.set_yticks(
         np.arange(len(chroma_labels)) + 0.5,
         chroma_labels,
@@ -312,19 +227,13 @@ def plot_user_chord(
     
     # 計算時間標記
     times = librosa.times_like(
-    chroma, 
+    n_frames, 
     sr=22050, 
     n_fft=4096, 
     hop_length=2048
     )
-    duration = times[-1]
-    target_values = np.arange(5, duration, 5)
-    x_ticks_loc = []
-    x_ticks_label = []
-    for target in target_values:
-        cloest_index = np.argmin(np.abs(times-target))
-        x_ticks_loc.append(cloest_index)
-        x_ticks_label.append(int(target)+shift_time)
+    x_ticks_loc, x_ticks_label = time_ticks(times[x_min:x_max + 1] if span is not None else times, shift_time)
+    x_ticks_loc = [loc + x_min for loc in x_ticks_loc] if span is not None else x_ticks_loc
     # 繪製時間標記
     ax.set_xticks(
         x_ticks_loc,
@@ -352,31 +261,23 @@ def plot_chord_block(
     shift_time=0.0,
     ax=None
 ):
+    """
+    以色塊畫出和弦序列
+
+    chord_df: 每個frame一列、含"Chord"欄位的DataFrame，或ChordSegments
+    """
     if ax is None:
         fig, ax = plt.subplots(figsize=(20, 3))
     else:
         fig = ax.get_figure()
 
-    df = chord_df.copy()
-    grouped = df.groupby((df['Chord'] != df['Chord'].shift()).cumsum())
-    chord_grouped_df = pd.DataFrame(columns=["Start", "End", "Chord"])
-    for group_id, group_df in grouped:
-        start_index = group_df.index[0]
-        end_index = group_df.index[-1]
-        chord_value = group_df.iloc[0]["Chord"]
-        chord_grouped_df = chord_grouped_df.append({
-            "Start": start_index,
-            "End": end_index,
-            "Chord": chord_value
-            },
-            ignore_index=True
-        )  
-        
+    if isinstance(chord_df, ChordSegments):
+        segments = chord_df
+    else:
+        segments = ChordSegments.from_frame_table(chord_df)
+
     # 繪圖
-    for index, row in chord_grouped_df.iterrows():
-        start = row["Start"]
-        end = row["End"] + 1
-        chord = row["Chord"]
+    for start, end, chord in zip(segments.starts, segments.ends, segments.chords):
         color = chord_color_map[chord[0]]
         alpha = 0.8 if len(chord) == 2 else 0.5
         
@@ -387,7 +288,7 @@ def plot_chord_block(
     # 不顯示x軸
     ax.axes.xaxis.set_visible(False)
     # 設定x軸範圍
-    ax.set_xlim(0, chord_df.shape[0])
+    ax.set_xlim(0, segments.n_frames)
     # 設定標題
     ax.set_title("Chord Recognition Result")
     
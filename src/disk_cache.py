@@ -0,0 +1,177 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import librosa
+import numpy as np
+
+from src.cache import env_megabytes
+
+
+def _versions() -> str:
+    return f"librosa={librosa.__version__};numpy={np.__version__}"
+
+
+class DiskCache:
+    """
+    Persistent cache of analysis outputs stored as `.npy` files.
+
+    Every entry is a directory `<key>/` holding one `<i>.npy` file per
+    returned array, so results are memory-mapped on load instead of being
+    read into RAM. The modification time of an entry directory is refreshed
+    on every hit and the oldest entries are removed once the total size
+    exceeds `max_bytes`.
+
+    Parameters
+    ----------
+    directory : str
+        Directory holding the cache entries. Created if missing.
+    max_bytes : int
+        Size cap of the cache. 0 disables the cache.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._sizes = None  # key -> bytes，第一次使用時才掃描目錄
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(content_key: str, name: str, params: tuple) -> str:
+        """
+        Builds an entry key from the audio content hash, the function name,
+        its parameters and the versions of the libraries computing it.
+        """
+        text = repr((content_key, name, params, _versions()))
+        return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns the tuple of memory-mapped arrays stored under `key`,
+        or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            names = sorted(
+                (f for f in os.listdir(path) if f.endswith(".npy")),
+                key=lambda f: int(f[:-4]),
+            )
+            arrays = tuple(np.load(os.path.join(path, f), mmap_mode="r") for f in names)
+            os.utime(path)  # 更新LRU時間
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arrays
+
+    def put(self, key: str, arrays: tuple) -> None:
+        """
+        Stores `arrays` (a tuple of numpy arrays) under `key`.
+        """
+        if not self.enabled:
+            return
+        arrays = tuple(np.asarray(a) for a in arrays)
+        if any(a.dtype == object for a in arrays):
+            return
+        size = sum(a.nbytes for a in arrays)
+        if size > self.max_bytes:
+            return
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # 先寫到暫存目錄再改名，避免其他process讀到寫到一半的檔案
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+            for i, a in enumerate(arrays):
+                np.save(os.path.join(tmp, f"{i}.npy"), a)
+            try:
+                os.replace(tmp, os.path.join(self.directory, key))
+            except OSError:
+                # 其他process已寫入相同的key
+                shutil.rmtree(tmp, ignore_errors=True)
+                return
+        except OSError:
+            return
+
+        with self._lock:
+            sizes = self._scan()
+            sizes[key] = size
+            if sum(sizes.values()) > self.max_bytes:
+                self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self._sizes = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = self._scan() if self.enabled else {}
+            return {
+                "directory": self.directory,
+                "entries": len(sizes),
+                "bytes": sum(sizes.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _scan(self) -> dict:
+        if self._sizes is None:
+            self._sizes = {}
+            for entry in self._entries():
+                self._sizes[entry.name] = _dir_size(entry.path)
+        return self._sizes
+
+    def _entries(self):
+        try:
+            return [
+                e for e in os.scandir(self.directory)
+                if e.is_dir() and not e.name.startswith(".")
+            ]
+        except OSError:
+            return []
+
+    def _evict(self) -> None:
+        # 重新掃描一次，其他process(例如batch worker)也可能寫入同一個目錄
+        entries = self._entries()
+        sizes = {e.name: _dir_size(e.path) for e in entries}
+        mtimes = {}
+        for e in entries:
+            try:
+                mtimes[e.name] = e.stat().st_mtime
+            except OSError:
+                sizes.pop(e.name, None)
+        total = sum(sizes.values())
+        for name in sorted(sizes, key=lambda n: mtimes[n]):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            total -= sizes.pop(name)
+        self._sizes = sizes
+
+
+def _dir_size(path: str) -> int:
+    try:
+        return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+    except OSError:
+        return 0
+
+
+# 預設的磁碟快取，位置與大小可用環境變數調整
+# AUDIOVIZ_CACHE_DIR (預設 ~/.cache/audioviz)、AUDIOVIZ_DISK_CACHE_MB (預設 2048，0為停用)
+disk_cache = DiskCache(
+    os.environ.get("AUDIOVIZ_CACHE_DIR", os.path.join("~", ".cache", "audioviz")),
+    env_megabytes("AUDIOVIZ_DISK_CACHE_MB", 2048),
+)
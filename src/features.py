@@ -0,0 +1,623 @@
+import hashlib
+import weakref
+
+import librosa
+import numpy as np
+from numpy import typing as npt
+
+from src import hpss
+from src.cache import LRUCache, env_megabytes
+from src.disk_cache import DiskCache, disk_cache
+
+# 頻譜等特徵的快取，整個process共用
+# 預算可用環境變數 AUDIOVIZ_FEATURE_CACHE_MB 調整
+_feature_cache = LRUCache(env_megabytes("AUDIOVIZ_FEATURE_CACHE_MB", 1024))
+# 快取查詢未命中時的回傳值
+_MISSING = object()
+# id(y) -> (weakref(y), key)
+_key_memo = {}
+# id(y) -> weakref(y)，整首歌的訊號，片段(y_sub)為其view
+_full_signals = {}
+
+
+def register_signal(y: np.ndarray) -> None:
+    """
+    Registers a full-track signal. Frame-level features of slices of `y`
+    (e.g. `y_sub = y_all[start_index:end_index]` in segment mode) are then
+    cut out of the features of the whole track instead of being recomputed.
+
+    `y` must be read-only and own its memory.
+    """
+    if y.flags.writeable or y.base is not None:
+        raise ValueError("Only read-only arrays owning their data can be registered")
+    obj_id = id(y)
+    _full_signals[obj_id] = weakref.ref(y, lambda _: _full_signals.pop(obj_id, None))
+
+
+def _segment_of(y):
+    """
+    Returns (full, start) if `y` is a contiguous slice of a registered
+    full-track signal `full` starting at sample `start`, otherwise None.
+    """
+    base = getattr(y, "base", None)
+    if base is None or y is base:
+        return None
+    ref = _full_signals.get(id(base))
+    if ref is None or ref() is not base:
+        return None
+    if y.ndim != 1 or y.strides[0] != base.itemsize or y.dtype != base.dtype:
+        return None
+    offset = y.__array_interface__["data"][0] - base.__array_interface__["data"][0]
+    return base, offset // base.itemsize
+
+
+def signal_key(y: npt.ArrayLike) -> str:
+    """
+    Returns a key identifying the content of the signal `y`.
+
+    The hash of a read-only array is remembered for as long as the array
+    object lives, so passing the same `y_sub` to several functions within
+    one rerun hashes it only once. Slices of a registered full-track signal
+    are not hashed at all, their key is derived from the full track.
+    """
+    memo = _key_memo.get(id(y))
+    if memo is not None and memo[0]() is y:
+        return memo[1]
+
+    segment = _segment_of(y)
+    if segment is not None:
+        full, start = segment
+        return f"{signal_key(full)}[{start}:{start + len(y)}]"
+
+    arr = np.ascontiguousarray(y)
+    h = hashlib.blake2b(arr.view(np.uint8), digest_size=16)
+    h.update(f"{arr.dtype}{arr.shape}".encode())
+    key = h.hexdigest()
+
+    if isinstance(y, np.ndarray) and not y.flags.writeable:
+        obj_id = id(y)
+        _key_memo[obj_id] = (weakref.ref(y, lambda _: _key_memo.pop(obj_id, None)), key)
+    return key
+
+
+def _frame_segment(y, n_fft: int, hop_length: int, center: bool = True):
+    """
+    Checks whether the frames of `y` can be cut out of the frames of the
+    full track it is a slice of.
+
+    This holds for centered frames when the slice starts on the hop grid.
+    Frame k of the slice is then frame `start // hop_length + k` of the full
+    track, except for the first and last few frames: their windows reach past
+    the slice bounds, where the slice is zero-padded but the full track still
+    has audio.
+
+    Returns
+    -------
+    None or tuple
+        (full, first_frame, n_frames, n_left, n_right) where `n_left` and
+        `n_right` are the numbers of edge frames that must be recomputed.
+    """
+    segment = _segment_of(y)
+    if segment is None or not center:
+        return None
+    full, start = segment
+    if start % hop_length:
+        return None
+
+    n = len(y)
+    n_frames = 1 + n // hop_length
+    pad = n_fft // 2
+    # frame k 涵蓋 [k*hop - pad, k*hop - pad + n_fft)
+    n_left = -(-pad // hop_length) if start > 0 else 0
+    first_right = max(0, (n - n_fft + pad) // hop_length + 1)
+    n_right = n_frames - first_right if start + n < len(full) else 0
+    if n_left + n_right >= n_frames:
+        # 片段太短，直接計算
+        return None
+    return full, start // hop_length, n_frames, n_left, n_right
+
+
+def _slice_segment(y, frames, full_feature, from_stft, n_fft, hop_length, window, pad_mode):
+    """
+    Cuts the frames of the slice `y` out of `full_feature` (a frame-level
+    feature of the full track) and recomputes the edge frames whose window
+    padding differs. `from_stft` maps STFT columns to feature columns.
+
+    Returns a view of `full_feature` when no edge frame differs.
+    """
+    _, first, n_frames, n_left, n_right = frames
+    out = full_feature[..., first:first + n_frames]
+    if n_left == 0 and n_right == 0:
+        return out
+
+    out = out.copy()
+    y = np.asarray(y)
+    stft = lambda x: librosa.stft(x, n_fft=n_fft, hop_length=hop_length,
+                                  window=window, center=True, pad_mode=pad_mode)
+    # 只對邊界附近(至少n_fft長)的訊號重新計算STFT
+    if n_left:
+        length = max((n_left - 1) * hop_length - n_fft // 2 + n_fft, n_fft)
+        out[..., :n_left] = from_stft(stft(y[:length])[:, :n_left])
+    if n_right:
+        first_right = n_frames - n_right
+        # 起點對齊hop，且前面留有足夠的frame讓左側不受補零影響
+        n_context = -(-(n_fft // 2) // hop_length)
+        skip = max(0, min(first_right - n_context, (len(y) - n_fft) // hop_length))
+        out[..., first_right:] = from_stft(stft(y[skip * hop_length:])[:, first_right - skip:])
+    return out
+
+
+def _cached(key, compute, persist=False):
+    def compute_readonly():
+        if persist:
+            # key = (signal_key, name, *params)
+            disk_key = DiskCache.make_key(key[0], key[1], key[2:])
+            stored = disk_cache.get(disk_key)
+            if stored is not None:
+                return stored[0] if len(stored) == 1 else stored
+        value = compute()
+        # 快取的陣列會被多個頁面共用，避免被就地修改
+        for arr in (value if isinstance(value, tuple) else (value,)):
+            if isinstance(arr, np.ndarray):
+                arr.flags.writeable = False
+        if persist:
+            disk_cache.put(disk_key, value if isinstance(value, tuple) else (value,))
+        return value
+    return _feature_cache.get_or_compute(key, compute_readonly)
+
+
+def cached_feature(y: npt.ArrayLike, name: str, params: tuple, compute, persist: bool = False):
+    """
+    Returns `compute()` cached under (signal, name, params).
+
+    Parameters
+    ----------
+    y : np.ndarray
+        The signal the feature is computed from.
+    name : str
+        Name of the feature (usually the function computing it).
+    params : tuple
+        Every parameter the result depends on.
+    compute : callable
+        Called without arguments on a miss. Must return an array or a tuple
+        of arrays.
+    persist : bool, optional
+        Also store the result in the on-disk cache, so it survives a restart
+        of the process (default False). Use it for expensive results only.
+    """
+    return _cached((signal_key(y), name) + tuple(params), compute, persist=persist)
+
+
+def get_stft(
+    y: npt.ArrayLike,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    window: str = "hann",
+    center: bool = True,
+    pad_mode: str = "constant",
+) -> np.ndarray:
+    """
+    Returns the complex STFT of `y`, computed once per
+    (signal, n_fft, hop_length, window, center, pad_mode).
+
+    The default parameters are the ones of `librosa.stft`, so the result is
+    identical to `librosa.stft(y)`. The returned array is read-only.
+    """
+    key = (signal_key(y), "stft", n_fft, hop_length, window, center, pad_mode)
+    frames = _frame_segment(y, n_fft, hop_length, center)
+    if frames is not None:
+        return _cached(key, lambda: _slice_segment(
+            y, frames, get_stft(frames[0], n_fft, hop_length, window, center, pad_mode),
+            lambda D: D, n_fft, hop_length, window, pad_mode,
+        ))
+    return _cached(key, lambda: librosa.stft(
+        np.asarray(y), n_fft=n_fft, hop_length=hop_length,
+        window=window, center=center, pad_mode=pad_mode,
+    ))
+
+
+def get_magnitude(y: npt.ArrayLike, n_fft: int = 2048, hop_length: int = 512, window: str = "hann") -> np.ndarray:
+    """
+    Returns `np.abs(librosa.stft(y))` from the shared STFT.
+    """
+    key = (signal_key(y), "magnitude", n_fft, hop_length, window)
+    frames = _frame_segment(y, n_fft, hop_length)
+    if frames is not None:
+        return _cached(key, lambda: _slice_segment(
+            y, frames, get_magnitude(frames[0], n_fft, hop_length, window),
+            np.abs, n_fft, hop_length, window, "constant",
+        ))
+    return _cached(key, lambda: np.abs(get_stft(y, n_fft, hop_length, window)))
+
+
+def get_power(y: npt.ArrayLike, n_fft: int = 2048, hop_length: int = 512, window: str = "hann") -> np.ndarray:
+    """
+    Returns the power spectrogram `np.abs(librosa.stft(y))**2` from the shared STFT.
+    """
+    key = (signal_key(y), "power", n_fft, hop_length, window)
+    frames = _frame_segment(y, n_fft, hop_length)
+    if frames is not None:
+        return _cached(key, lambda: _slice_segment(
+            y, frames, get_power(frames[0], n_fft, hop_length, window),
+            lambda D: np.abs(D) ** 2, n_fft, hop_length, window, "constant",
+        ))
+    return _cached(key, lambda: get_magnitude(y, n_fft, hop_length, window) ** 2)
+
+
+def get_db(y: npt.ArrayLike, n_fft: int = 2048, hop_length: int = 512, window: str = "hann") -> np.ndarray:
+    """
+    Returns `librosa.amplitude_to_db(np.abs(librosa.stft(y)), ref=np.max)`
+    from the shared STFT.
+    """
+    key = (signal_key(y), "db", n_fft, hop_length, window)
+    return _cached(key, lambda: librosa.amplitude_to_db(
+        get_magnitude(y, n_fft, hop_length, window), ref=np.max
+    ))
+
+
+def get_mel(
+    y: npt.ArrayLike,
+    sr: int,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    window: str = "hann",
+    n_mels: int = 128,
+    fmax: float = None,
+) -> np.ndarray:
+    """
+    Returns the mel power spectrogram of `y`, derived from the shared power
+    spectrogram. Equal to `librosa.feature.melspectrogram(y=y, sr=sr, ...)`.
+    """
+    key = (signal_key(y), "mel", sr, n_fft, hop_length, window, n_mels, fmax)
+    frames = _frame_segment(y, n_fft, hop_length)
+    if frames is not None:
+        return _cached(key, lambda: _slice_segment(
+            y, frames, get_mel(frames[0], sr, n_fft, hop_length, window, n_mels, fmax),
+            lambda D: librosa.feature.melspectrogram(
+                S=np.abs(D) ** 2, sr=sr, n_mels=n_mels, fmax=fmax,
+            ),
+            n_fft, hop_length, window, "constant",
+        ))
+    return _cached(key, lambda: librosa.feature.melspectrogram(
+        S=get_power(y, n_fft, hop_length, window), sr=sr,
+        n_fft=n_fft, hop_length=hop_length, n_mels=n_mels, fmax=fmax,
+    ), persist=True)
+
+
+def get_mel_db(
+    y: npt.ArrayLike,
+    sr: int,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    window: str = "hann",
+    n_mels: int = 128,
+    fmax: float = None,
+) -> np.ndarray:
+    """
+    Returns `librosa.power_to_db(mel, ref=np.max)` of the shared mel spectrogram.
+    """
+    key = (signal_key(y), "mel_db", sr, n_fft, hop_length, window, n_mels, fmax)
+    return _cached(key, lambda: librosa.power_to_db(
+        get_mel(y, sr, n_fft, hop_length, window, n_mels, fmax), ref=np.max
+    ))
+
+
+HPSS_COMPONENTS = ("harmonic", "percussive")
+
+
+def get_hpss_masks(
+    y: npt.ArrayLike,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    kernel_size: int = 31,
+    power: float = 2.0,
+    margin: float = 1.0,
+    downsample: int = 1,
+) -> tuple:
+    """
+    Returns the (harmonic, percussive) soft masks of the shared magnitude
+    spectrogram (see `src.hpss.hpss_masks`, equal to
+    `librosa.decompose.hpss(..., mask=True)` for `downsample=1`), computed
+    once per (signal, n_fft, hop_length, kernel_size, power, margin, downsample).
+    """
+    key = (signal_key(y), "hpss_masks", n_fft, hop_length, kernel_size, power, margin, downsample)
+    return _cached(key, lambda: tuple(m.astype(np.float32) for m in hpss.hpss_masks(
+        get_magnitude(y, n_fft, hop_length), kernel_size=kernel_size, power=power,
+        margin=margin, downsample=downsample,
+    )))
+
+
+def get_component_magnitude(
+    y: npt.ArrayLike,
+    component: str,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    downsample: int = 1,
+) -> np.ndarray:
+    """
+    Returns the magnitude spectrogram of the harmonic or percussive part of
+    `y`: the shared magnitude times the cached HPSS mask (default
+    `get_hpss_masks` parameters).
+    """
+    if component not in HPSS_COMPONENTS:
+        raise ValueError(f"Unsupported component: {component}")
+    key = (signal_key(y), "component_magnitude", component, n_fft, hop_length, downsample)
+
+    def compute():
+        mask_harm, mask_perc = get_hpss_masks(y, n_fft, hop_length, downsample=downsample)
+        return get_magnitude(y, n_fft, hop_length) * (mask_harm if component == "harmonic" else mask_perc)
+
+    return _cached(key, compute)
+
+
+# CQT的最小hop：其倍數的hop直接從這個hop的CQT每隔幾個frame取一個
+CQT_BASE_HOP = 512
+
+
+def get_cqt(
+    y: npt.ArrayLike,
+    sr: int,
+    hop_length: int = 512,
+    fmin: float = None,
+    n_bins: int = 84,
+    bins_per_octave: int = 12,
+    tuning: float = 0.0,
+) -> np.ndarray:
+    """
+    Returns the constant-Q magnitude `np.abs(librosa.cqt(y, sr=sr, ...))`,
+    computed once per (signal, sr, fmin, n_bins, bins_per_octave, tuning)
+    and kept in the disk cache. `tuning=None` estimates the tuning from `y`
+    (as `librosa.feature.chroma_cqt` does).
+
+    CQT frames are centered, so frame k at hop `m * CQT_BASE_HOP` is frame
+    `m * k` at `CQT_BASE_HOP`: hops that are multiples of `CQT_BASE_HOP` are
+    decimated from that CQT (a read-only view, identical to computing them
+    directly). Other hops are computed and cached on their own.
+    """
+    if hop_length != CQT_BASE_HOP and hop_length % CQT_BASE_HOP == 0:
+        base = get_cqt(y, sr, CQT_BASE_HOP, fmin, n_bins, bins_per_octave, tuning)
+        return base[:, ::hop_length // CQT_BASE_HOP]
+
+    key = (signal_key(y), "cqt", sr, hop_length, fmin, n_bins, bins_per_octave, tuning)
+    return _cached(key, lambda: np.abs(librosa.cqt(
+        np.asarray(y), sr=sr, hop_length=hop_length, fmin=fmin,
+        n_bins=n_bins, bins_per_octave=bins_per_octave, tuning=tuning,
+    )), persist=True)
+
+
+CHROMA_METHODS = ("stft", "cqt")
+
+
+def _spectrogram(y, n_fft: int, hop_length: int, power: float, component: str = None) -> np.ndarray:
+    """`np.abs(stft) ** power` from the shared STFT (or of an HPSS component)."""
+    if component is not None:
+        S = get_component_magnitude(y, component, n_fft, hop_length)
+        return S if power == 1 else S ** power
+    if power == 2:
+        return get_power(y, n_fft, hop_length)
+    if power == 1:
+        return get_magnitude(y, n_fft, hop_length)
+    return get_magnitude(y, n_fft, hop_length) ** power
+
+
+def get_tuning_pitches(y: npt.ArrayLike, sr: int, n_fft: int = 2048, power: float = 2.0) -> np.ndarray:
+    """
+    The frequencies `librosa.estimate_tuning(S=S)` takes its tuning from:
+    the `piptrack` peaks of the spectrogram `S = np.abs(stft) ** power`
+    (hop `n_fft // 4`) whose magnitude is at least the median.
+    `librosa.pitch_tuning(pitches, bins_per_octave=b)` then gives the tuning
+    for any resolution `b` without touching the spectrogram again.
+    """
+    def compute():
+        pitch, mag = librosa.piptrack(S=_spectrogram(y, n_fft, n_fft // 4, power), sr=sr)
+        pitch_mask = pitch > 0
+        threshold = np.median(mag[pitch_mask]) if pitch_mask.any() else 0.0
+        return pitch[(mag >= threshold) & pitch_mask]
+
+    key = (signal_key(y), "tuning_pitches", sr, n_fft, power)
+    return _cached(key, compute)
+
+
+def get_chroma_tuning(y: npt.ArrayLike, sr: int, n_fft: int = 2048, power: float = 2.0,
+                      n_chroma: int = 12) -> float:
+    """
+    The tuning used by `get_chroma(method="stft", tuning=None)`: estimated
+    like `librosa.feature.chroma_stft`, always from the spectrogram at
+    librosa's default hop `n_fft // 4`, so that it does not depend on the
+    hop of the chroma.
+    """
+    return float(librosa.pitch_tuning(get_tuning_pitches(y, sr, n_fft, power), bins_per_octave=n_chroma))
+
+
+def get_chroma(
+    y: npt.ArrayLike,
+    sr: int,
+    method: str = "stft",
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    tuning: float = None,
+    n_chroma: int = 12,
+    norm: float = np.inf,
+    power: float = 2.0,
+    component: str = None,
+) -> np.ndarray:
+    """
+    Returns the chromagram of `y`, cached per
+    (signal, sr, method, n_fft, hop_length, tuning, n_chroma, norm, power,
+    component).
+
+    Parameters
+    ----------
+    y : np.ndarray
+        Audio signal.
+    sr : int
+        Sample rate of `y`.
+    method : str, optional
+        'stft' (`librosa.feature.chroma_stft` of the shared spectrogram
+        `np.abs(stft) ** power`) or 'cqt' (`librosa.feature.chroma_cqt` of
+        the shared CQT, see `get_cqt`). Default 'stft'.
+    n_fft : int, optional
+        FFT size (only for 'stft', default 2048).
+    hop_length : int, optional
+        Hop length (default 512).
+    tuning : float, optional
+        Tuning deviation in bins. None estimates it from the signal (see
+        `get_chroma_tuning`; for 'cqt' as `librosa.cqt` does). For 'stft'
+        the estimate always comes from the spectrogram at hop `n_fft // 4`,
+        so at any other `hop_length` it can differ slightly from the tuning
+        `librosa.feature.chroma_stft(y=y, hop_length=hop_length)` estimates.
+    n_chroma : int, optional
+        Number of chroma bins (default 12).
+    norm : float, optional
+        Column normalization (as `librosa.util.normalize`), None for none.
+        Default np.inf.
+    power : float, optional
+        Exponent of the STFT magnitude (only for 'stft', default 2).
+    component : str, optional
+        'harmonic' or 'percussive': use that HPSS component of the
+        spectrogram (`get_component_magnitude`, only for 'stft'). Default
+        None, the whole signal.
+
+    Returns
+    -------
+    np.ndarray
+        The chromagram (read-only).
+
+    Notes
+    -----
+    Frames are centered, so frame k at hop `m * h` is frame `m * k` at hop
+    `h`. If the chroma with the same parameters at a finer hop `h` (dividing
+    `hop_length`) is already cached, the coarser one is taken from it
+    instead of being recomputed from the audio. It takes every m-th frame
+    rather than pooling m frames: the frames at hop `m * h` are exactly
+    those frames, so the result is identical to computing it directly,
+    while pooling would smooth it. (Not for HPSS components: their masks
+    depend on the hop.)
+    """
+    if method not in CHROMA_METHODS:
+        raise ValueError(f"Unsupported chroma method: {method}")
+    if method == "cqt":
+        if component is not None:
+            raise ValueError("HPSS components are only supported for method='stft'")
+        # n_fft與power不影響CQT chroma
+        n_fft, power = None, None
+    params = (sr, method, n_fft, tuning, n_chroma, norm, power, component)
+    key = (signal_key(y), "chroma", hop_length) + params
+
+    def compute():
+        for h in range(hop_length // 2 if component is None else 0, 0, -1):
+            finer_key = key[:2] + (h,) + params
+            if hop_length % h != 0:
+                continue
+            # 只查一次：另一個session可能在查詢之間把它移出快取
+            finer = _feature_cache.get(finer_key, _MISSING)
+            if finer is not _MISSING:
+                return np.ascontiguousarray(finer[:, ::hop_length // h])
+
+        if method == "cqt":
+            C = get_cqt(y, sr, hop_length, n_bins=7 * 36, bins_per_octave=36, tuning=tuning)
+            return librosa.feature.chroma_cqt(C=C, sr=sr, hop_length=hop_length, norm=norm,
+                                              n_chroma=n_chroma, bins_per_octave=36)
+        resolved = get_chroma_tuning(y, sr, n_fft, power, n_chroma) if tuning is None else tuning
+        return librosa.feature.chroma_stft(S=_spectrogram(y, n_fft, hop_length, power, component), sr=sr,
+                                           n_fft=n_fft, tuning=resolved, norm=norm, n_chroma=n_chroma)
+
+    return _cached(key, compute)
+
+
+def get_onset_strength(
+    y: npt.ArrayLike,
+    sr: int,
+    aggregate="mean",
+    hop_length: int = 512,
+    n_mels: int = 128,
+    fmax: float = None,
+    spectrum: str = "mel",
+    component: str = None,
+) -> np.ndarray:
+    """
+    Returns the onset strength envelope of `y`, cached per
+    (signal, aggregate, hop_length, n_mels, fmax, spectrum, component).
+
+    Parameters
+    ----------
+    y : np.ndarray
+        Audio signal.
+    sr : int
+        Sample rate of `y`.
+    aggregate : str or callable, optional
+        'mean' or 'median' (or `np.mean` / `np.median`), the function used
+        to aggregate the spectral flux across frequency (default 'mean').
+    hop_length : int, optional
+        Hop length of the underlying spectrogram (default 512).
+    n_mels, fmax : optional
+        Parameters of the mel spectrogram (only for `spectrum='mel'`).
+    spectrum : str, optional
+        'mel' derives the envelope from the shared mel spectrogram, like
+        `librosa.onset.onset_strength(y=y, ...)`. 'cqt' uses the dB-scaled
+        constant-Q magnitude instead (default 'mel').
+    component : str, optional
+        'harmonic' or 'percussive': the mel spectrogram of that HPSS
+        component (`get_component_magnitude`, only for 'mel'). Default None.
+
+    Returns
+    -------
+    np.ndarray
+        The onset strength envelope (read-only).
+    """
+    if callable(aggregate):
+        aggregate = aggregate.__name__
+    if aggregate not in ("mean", "median"):
+        raise ValueError(f"Unsupported aggregate: {aggregate}")
+    if spectrum not in ("mel", "cqt"):
+        raise ValueError(f"Unsupported spectrum: {spectrum}")
+    if component is not None and spectrum != "mel":
+        raise ValueError("HPSS components are only supported for spectrum='mel'")
+
+    key = (signal_key(y), "onset", sr, aggregate, hop_length, n_mels, fmax, spectrum)
+    if component is not None:
+        key += (component,)
+
+    def compute():
+        if component is not None:
+            S = librosa.power_to_db(librosa.feature.melspectrogram(
+                S=get_component_magnitude(y, component, hop_length=hop_length) ** 2, sr=sr,
+                n_mels=n_mels, fmax=fmax,
+            ))
+        elif spectrum == "mel":
+            # 與 onset_strength(y=y) 相同：mel頻譜轉dB(ref=1.0)後計算spectral flux
+            S = librosa.power_to_db(get_mel(y, sr, hop_length=hop_length, n_mels=n_mels, fmax=fmax))
+        else:
+            S = librosa.amplitude_to_db(get_cqt(y, sr, hop_length=hop_length), ref=np.max)
+        return librosa.onset.onset_strength(
+            S=S, sr=sr, hop_length=hop_length, aggregate=getattr(np, aggregate)
+        )
+
+    return _cached(key, compute, persist=True)
+
+
+def get_pyin(
+    y: npt.ArrayLike,
+    sr: int,
+    fmin: float = 65.40639132514966,
+    fmax: float = 2093.004522404789,
+    frame_length: int = 2048,
+) -> tuple:
+    """
+    Returns `librosa.pyin(y, sr=sr, fmin=fmin, fmax=fmax)` as a tuple
+    (f0, voiced_flag, voiced_probs). The result is also kept in the disk cache.
+
+    The default `fmin`/`fmax` are C2 and C7.
+    """
+    key = (signal_key(y), "pyin", sr, fmin, fmax, frame_length)
+    return _cached(key, lambda: tuple(librosa.pyin(
+        np.asarray(y), sr=sr, fmin=fmin, fmax=fmax, frame_length=frame_length,
+    )), persist=True)
+
+
+def feature_cache_stats() -> dict:
+    return _feature_cache.stats()
+
+
+def clear_feature_cache() -> None:
+    _feature_cache.clear()
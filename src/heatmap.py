@@ -0,0 +1,146 @@
+"""
+Raster heatmaps for long feature matrices.
+
+`seaborn.heatmap` draws one patch per cell (plus grid lines), so a chroma or
+chord matrix of a 4-minute song becomes tens of thousands of artists and
+rendering dominates the page time. `plot_heatmap` draws the same picture as
+a single image: cell (i, j) covers [j, j+1) × [i, i+1) with row 0 at the top,
+exactly like `sns.heatmap`, so existing tick code (`ax.set_xticks(frames)`,
+`ax.invert_yaxis()`, yticks at i+0.5) keeps working.
+
+Columns are reduced to (about twice) the pixel width of the axes before
+drawing, and `time_ticks` limits the number of tick labels, so the cost of
+rendering does not depend on the length of the track.
+"""
+from typing import Optional
+
+import numpy as np
+from matplotlib import pyplot as plt
+from numpy import typing as npt
+
+
+def get_cmap(cmap):
+    """
+    Returns a matplotlib colormap; seaborn palettes such as "crest" or
+    "rocket" are looked up in seaborn (imported only when needed).
+    """
+    if not isinstance(cmap, str):
+        return cmap
+    try:
+        return plt.get_cmap(cmap)
+    except ValueError:
+        import seaborn as sns
+        return sns.color_palette(cmap, as_cmap=True)
+
+
+def decimate_columns(data: npt.ArrayLike, max_columns: int, reduce: str = "mean"):
+    """
+    Reduces `data` (rows × columns) to at most `max_columns` columns by
+    pooling blocks of `factor` neighbouring columns (the last block may be
+    shorter).
+
+    Returns the pooled matrix and the factor.
+    """
+    data = np.asarray(data)
+    n_columns = data.shape[1]
+    factor = max(1, int(np.ceil(n_columns / max(1, max_columns))))
+    if factor == 1:
+        return data, 1
+    starts = np.arange(0, n_columns, factor)
+    if reduce == "max":
+        return np.maximum.reduceat(data, starts, axis=1), factor
+    if reduce == "mean":
+        counts = np.diff(np.append(starts, n_columns))
+        return np.add.reduceat(data, starts, axis=1) / counts, factor
+    raise ValueError(f"Unsupported reduce: {reduce}")
+
+
+def plot_heatmap(
+    data: npt.ArrayLike,
+    ax=None,
+    cmap="rocket",
+    vmin: Optional[float] = None,
+    vmax: Optional[float] = None,
+    colorbar: bool = True,
+    max_columns: Optional[int] = None,
+    reduce: str = "mean",
+    x_offset: float = 0.0,
+):
+    """
+    Draws `data` like `sns.heatmap(data, ax=ax, cmap=cmap)` but as one
+    (rasterized) image.
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Matrix (rows × columns).
+    ax : matplotlib.axes.Axes, optional
+        Axes to draw on; a new figure is created if None.
+    cmap : str or Colormap, optional
+        Matplotlib or seaborn colormap (default "rocket", as sns.heatmap).
+    vmin, vmax : float, optional
+        Color limits (default: the range of `data`).
+    colorbar : bool, optional
+        Draw a colorbar next to the axes (default True).
+    max_columns : int, optional
+        Maximum number of image columns. By default twice the pixel width
+        of the axes.
+    reduce : str, optional
+        How columns are pooled when decimating: "mean" (default) or "max"
+        (keeps short events such as one-frame chords visible).
+    x_offset : float, optional
+        x coordinate of the first column (default 0), e.g. to draw a slice
+        of a longer matrix at its original frame positions.
+
+    Returns
+    -------
+    fig, ax, image
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if ax is None:
+        fig, ax = plt.subplots()
+    else:
+        fig = ax.get_figure()
+    n_rows, n_columns = data.shape
+
+    if max_columns is None:
+        max_columns = 2 * int(np.ceil(ax.get_window_extent().width))
+    if vmin is None:
+        vmin = np.nanmin(data) if data.size else 0.0
+    if vmax is None:
+        vmax = np.nanmax(data) if data.size else 1.0
+    image, factor = decimate_columns(data, max_columns, reduce=reduce)
+
+    # 與sns.heatmap相同：第0列在上方，每個cell佔一個單位
+    im = ax.imshow(image, cmap=get_cmap(cmap), vmin=vmin, vmax=vmax, aspect="auto",
+                   interpolation="nearest", origin="upper",
+                   extent=(x_offset, x_offset + image.shape[1] * factor, n_rows, 0))
+    im.set_rasterized(True)
+    ax.set_xlim(x_offset, x_offset + n_columns)
+    ax.set_ylim(n_rows, 0)
+    if colorbar:
+        fig.colorbar(im, ax=ax)
+    return fig, ax, im
+
+
+def time_ticks(times: npt.ArrayLike, shift_time: float = 0.0, step: float = 5, max_ticks: int = 50):
+    """
+    Frame positions and labels of time ticks every `step` seconds: the frame
+    whose time is closest to 5, 10, 15, ... s (within the range of `times`),
+    labelled `int(t) + shift_time`.
+    For long tracks the step grows (in multiples of `step`) so that there
+    are at most `max_ticks` ticks.
+
+    Returns (x_ticks_loc, x_ticks_label).
+    """
+    times = np.asarray(times)
+    if len(times) == 0:
+        return [], []
+    step = step * max(1, int(np.ceil((times[-1] - times[0]) / step / max_ticks)))
+    first = max(step, np.ceil(times[0] / step) * step)
+    target_values = np.arange(first, times[-1], step)
+    # 最接近target的frame(與np.argmin相同，距離相同時取前面的frame)
+    right = np.clip(np.searchsorted(times, target_values), 1, len(times) - 1)
+    left = right - 1
+    closest = np.where(np.abs(times[left] - target_values) <= np.abs(times[right] - target_values), left, right)
+    return list(closest), [int(target) + shift_time for target in target_values]
@@ -0,0 +1,143 @@
+"""
+Fast harmonic-percussive source separation (HPSS) masks.
+
+`librosa.decompose.hpss` median-filters the magnitude spectrogram along time
+(harmonic) and along frequency (percussive) with `scipy.ndimage.median_filter`,
+which sorts a full window for every output value. The running median here
+keeps the window sorted and only moves the value that leaves and the one
+that enters it, so every step costs O(kernel_size) instead of
+O(kernel_size log kernel_size) with a much smaller constant. The result is
+identical to librosa's (same 'reflect' edges, same soft masks).
+
+`hpss_masks(..., downsample=f)` additionally filters an f×f average-pooled
+magnitude with a kernel f times shorter and repeats the masks back to full
+resolution, trading a little accuracy for ~f² less work.
+"""
+from typing import Tuple
+
+import librosa
+import numpy as np
+from numba import jit
+from numpy import typing as npt
+
+
+@jit(nopython=True, nogil=True)
+def _reflect(j, n):
+    # 與scipy.ndimage的mode='reflect'相同：(d c b a | a b c d | d c b a)
+    while j < 0 or j >= n:
+        if j < 0:
+            j = -j - 1
+        else:
+            j = 2 * n - j - 1
+    return j
+
+
+@jit(nopython=True, nogil=True)
+def running_median_rows(X, kernel_size):
+    """
+    Median of every row of `X` over a centered window of `kernel_size`
+    (odd) values, edges reflected; equal to
+    `scipy.ndimage.median_filter(X, size=(1, kernel_size), mode='reflect')`.
+    """
+    n_rows, n = X.shape
+    h = kernel_size // 2
+    out = np.empty_like(X)
+    win = np.empty(kernel_size, dtype=X.dtype)
+    for r in range(n_rows):
+        x = X[r]
+        for j in range(kernel_size):
+            win[j] = x[_reflect(j - h, n)]
+        win.sort()
+        out[r, 0] = win[h]
+        for i in range(1, n):
+            old = x[_reflect(i - 1 - h, n)]
+            new = x[_reflect(i + h, n)]
+            # 把離開視窗的值換成新的值，再往左或往右移動到排序的位置
+            pos = np.searchsorted(win, old)
+            if new > old:
+                while pos + 1 < kernel_size and win[pos + 1] < new:
+                    win[pos] = win[pos + 1]
+                    pos += 1
+            else:
+                while pos > 0 and win[pos - 1] > new:
+                    win[pos] = win[pos - 1]
+                    pos -= 1
+            win[pos] = new
+            out[r, i] = win[h]
+    return out
+
+
+def median_filter_time(S: np.ndarray, kernel_size: int) -> np.ndarray:
+    """Running median of every frequency bin along time (harmonic part)."""
+    return running_median_rows(np.ascontiguousarray(S), kernel_size)
+
+
+def median_filter_freq(S: np.ndarray, kernel_size: int) -> np.ndarray:
+    """Running median of every frame along frequency (percussive part)."""
+    return running_median_rows(np.ascontiguousarray(S.T), kernel_size).T
+
+
+def _pool(S: np.ndarray, factor: int) -> np.ndarray:
+    """Averages factor×factor blocks (the last block of each axis may be smaller)."""
+    rows = np.arange(0, S.shape[0], factor)
+    cols = np.arange(0, S.shape[1], factor)
+    pooled = np.add.reduceat(np.add.reduceat(S, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, S.shape[0])), np.diff(np.append(cols, S.shape[1])))
+    return (pooled / counts).astype(S.dtype)
+
+
+def _unpool(M: np.ndarray, factor: int, shape) -> np.ndarray:
+    return np.repeat(np.repeat(M, factor, axis=0), factor, axis=1)[:shape[0], :shape[1]]
+
+
+def hpss_masks(
+    S: npt.ArrayLike,
+    kernel_size: int = 31,
+    power: float = 2.0,
+    margin: float = 1.0,
+    downsample: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Harmonic and percussive soft masks of the magnitude spectrogram `S`,
+    as `librosa.decompose.hpss(S, kernel_size, power, mask=True, margin)`.
+
+    Parameters
+    ----------
+    S : np.ndarray
+        Magnitude spectrogram (frequency bins × frames).
+    kernel_size : int, optional
+        Median filter length in frames (harmonic) and bins (percussive),
+        made odd if necessary. Default 31, as librosa.
+    power : float, optional
+        Exponent of the soft masks (default 2).
+    margin : float, optional
+        Separation margin (>= 1, default 1).
+    downsample : int, optional
+        With f > 1 the masks are computed on the f×f average-pooled
+        magnitude with kernel `kernel_size // f` and repeated back to the
+        shape of `S` (approximate). Default 1 (exact).
+
+    Returns
+    -------
+    mask_harm, mask_perc : np.ndarray
+        Masks with the shape of `S`.
+    """
+    if margin < 1:
+        raise ValueError(f"margin must be >= 1, got {margin}")
+    S = np.asarray(S)
+    if np.iscomplexobj(S):
+        S = np.abs(S)
+    shape = S.shape
+    if downsample > 1:
+        S = _pool(S, downsample)
+        kernel_size = kernel_size // downsample
+    kernel_size = max(1, kernel_size) | 1  # 奇數
+
+    harm = median_filter_time(S, kernel_size)
+    perc = median_filter_freq(S, kernel_size)
+    split_zeros = margin == 1
+    mask_harm = librosa.util.softmask(harm, perc * margin, power=power, split_zeros=split_zeros)
+    mask_perc = librosa.util.softmask(perc, harm * margin, power=power, split_zeros=split_zeros)
+    if downsample > 1:
+        mask_harm, mask_perc = _unpool(mask_harm, downsample, shape), _unpool(mask_perc, downsample, shape)
+    return mask_harm, mask_perc
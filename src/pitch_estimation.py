@@ -15,6 +15,9 @@ import seaborn as sns
 
 import pandas as pd
 
+from src.heatmap import plot_heatmap
+from src.analysis import compute_chroma, compute_cqt_db, compute_mel_spectrogram, compute_pitch_class
+
 
 def plot_mel_spectrogram(
         y: npt.ArrayLike, 
@@ -24,18 +27,18 @@ def plot_mel_spectrogram(
         ax = None,
         show_colorbar : bool = True,
         xlabel : str = 'Time (s)',
+        f0_backend : str = 'pyin',
     ):
+    """
+    Plots the mel spectrogram, optionally with the f0 curve estimated by
+    `f0_backend` ("pyin", "pyin_voiced" or "yin", see `src.f0`).
+    """
 
-    S = librosa.feature.melspectrogram(y=y, sr=sr)
-    S_dB = librosa.power_to_db(S, ref=np.max)
+    result = compute_mel_spectrogram(y, sr, with_pitch=with_pitch, f0_backend=f0_backend)
+    S_dB = result.S_db
 
     if with_pitch :
         
-        f0, voiced_flag, voiced_probs = librosa.pyin(y,
-                                                     fmin=librosa.note_to_hz('C2'),
-                                                     fmax=librosa.note_to_hz('C7'))
-        times = librosa.times_like(f0, sr=sr)
-        
         if ax is None:
             fig, ax = plt.subplots(figsize=(12,6))
         else:
@@ -43,7 +46,7 @@ def plot_mel_spectrogram(
         img = librosa.display.specshow(S_dB, x_axis='time',
                                        y_axis='mel', sr=sr, 
                                        fmax=8000, ax=ax)
-        ax.plot(times, f0, label='f0', color='cyan', linewidth=3)
+        ax.plot(result.times, result.f0, label='f0', color='cyan', linewidth=3)
         ax.set_xticks(shift_array - shift_array[0],
                       shift_array)
         if show_colorbar :
@@ -72,9 +75,9 @@ def plot_constant_q_transform(y: npt.ArrayLike, sr:int,
                               shift_array: npt.ArrayLike
     ) :
 
-    C = np.abs(librosa.cqt(y, sr=sr))
+    C_db = compute_cqt_db(y, sr)
     fig, ax = plt.subplots(figsize=(12,6))
-    img = librosa.display.specshow(librosa.amplitude_to_db(C, ref=np.max),
+    img = librosa.display.specshow(C_db,
                                    sr=sr, x_axis='time', y_axis='cqt_note', ax=ax)
     ax.set_xticks(shift_array - shift_array[0],
                       shift_array)
@@ -126,8 +129,8 @@ def plot_chroma(
     chroma_times : np.ndarray
         Array of times corresponding to the chromagram if return_data=True.
     """
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    chroma_times = librosa.times_like(chroma, sr=sr)
+    result = compute_chroma(y, sr)
+    chroma, chroma_times = result.chroma, result.times
     num_frames = chroma.shape[1]
     # 取出10個frame的index和chroma_t
     selected_frames = np.linspace(0, num_frames-1, intervals, dtype=int)
@@ -146,10 +149,11 @@ def plot_chroma(
         ax = None
     else:
         fig, ax = plt.subplots(figsize=(10, 4))
-        sns.heatmap(chroma, ax=ax)
+        plot_heatmap(chroma, ax=ax)
         ax.set_title("Chroma")
         ax.set_xlabel("Time(s)")
         ax.invert_yaxis()
+        ax.set_yticks(np.arange(12) + 0.5)
         ax.set_yticklabels(
             ["C", "C#(Db)", "D", "D#(Eb)", "E", "F", "F#(Gb)", "G", "G#(Ab)", "A", "A#(Bb)", "B"],
             rotation=0
@@ -168,6 +172,7 @@ def plot_pitch_class(
     resolution_ratio: int = 1,  # 音高類別解析度倍率，預設為 1
     use_plotly: bool = False,   # 是否使用 Plotly 繪圖，預設為 False
     return_data: bool = False,  # 是否回傳數據，預設為 False
+    spectrum: str = "stft",     # 使用的頻譜("stft"或"cqt")，預設為 "stft"
 ):
     """
     繪製音高類別出現機率的長條圖。此函式會計算音高類別出現機率，
@@ -179,6 +184,7 @@ def plot_pitch_class(
         resolution_ratio (int, optional): 音高類別解析度倍率，預設為 1
         use_plotly (bool, optional): 是否使用 Plotly 繪圖，預設為 False
         return_data (bool, optional): 是否回傳數據，預設為 False
+        spectrum (str, optional): 對應到音高類別的頻譜，"stft" 或 "cqt"，預設為 "stft"
 
     Returns:
         tuple: 若 return_data 為 False，回傳 tuple (fig, ax)，
@@ -194,20 +200,9 @@ def plot_pitch_class(
     # 計算音高類別出現機率
     note_names = ["C", "C#(Db)", "D", "D#(Eb)", "E", "F", "F#(Gb)", "G", "G#(Ab)", "A", "A#(Bb)", "B"]
     note_colors = ['#636EFA', '#00CC96']
-    chroma = librosa.feature.chroma_stft(
-        S=np.abs(librosa.stft(y)), 
-        sr=sr, 
-        n_chroma=12*resolution_ratio
-    )
-    note_probs = np.mean(chroma >= 1/np.sqrt(2), axis=1)
-    note_probs = note_probs / note_probs.sum() # normalize
-    # 將note_probs rolling (resolution_ratio/2)格
-    note_probs = np.roll(note_probs, resolution_ratio//2)
-    
-    # 建立位置mask
-    unit_pos = np.zeros(resolution_ratio, dtype=bool) # 一個音的標記長度
-    unit_pos[resolution_ratio//2] = True # 繪製中間為True
-    note_pos_mask = np.tile(unit_pos, 12) # 重複12次
+    result = compute_pitch_class(y, sr, resolution_ratio, spectrum=spectrum)
+    note_probs = result.probs
+    note_pos_mask = result.note_positions
 
     if use_plotly:
         fig = go.Figure()
@@ -0,0 +1,227 @@
+"""
+Sparse self-similarity matrices (SSM) for long tracks.
+
+A dense SSM needs O(N²) memory: 20 minutes at hop 512 are about 52000
+frames, i.e. 10 GB in float32. The functions here keep only
+
+- a band of `bandwidth` diagonals around the main diagonal (`banded_sm`), or
+- the `k` most similar frames of every frame (`knn_sm`),
+
+as `scipy.sparse` matrices, computed a block of rows at a time so the dense
+intermediate never exceeds `block_size × N` (kNN) or
+`block_size × (block_size + bandwidth)` (band).
+
+Similarities are inner products of L2-normalized feature columns (raw
+cosine similarity, without the exp(-d/median) kernel or the kNN
+sparsification of `librosa.segment.recurrence_matrix(mode='affinity')`).
+Both matrices support `.diagonal(k)`, so they can be passed to
+`compute_novelty_ssm` directly. The novelty with kernel size L of a band of
+at least 2L diagonals equals the novelty of the dense cosine SSM `X.T @ X`
+(of the normalized X); it is *not* the novelty of librosa's affinity matrix.
+"""
+from typing import Tuple
+
+import numpy as np
+import scipy.sparse
+from numpy import typing as npt
+
+
+def normalize_columns(X: npt.ArrayLike, threshold: float = 1e-6) -> np.ndarray:
+    """
+    L2-normalizes the columns of `X` (float32). Columns with a norm below
+    `threshold` become zero.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    norm = np.linalg.norm(X, axis=0)
+    return np.divide(X, norm, out=np.zeros_like(X), where=norm > threshold)
+
+
+def banded_diagonals(X: npt.ArrayLike, bandwidth: int, block_size: int = 2048) -> np.ndarray:
+    """
+    Returns `U` of shape (N, bandwidth+1) with `U[r, d] = X[:, r] · X[:, r+d]`
+    (0 past the end), computed a block of rows at a time.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    N = X.shape[1]
+    U = np.zeros((N, bandwidth + 1), dtype=np.float32)
+    offsets = np.arange(bandwidth + 1)
+    for r0 in range(0, N, block_size):
+        r1 = min(N, r0 + block_size)
+        c1 = min(N, r1 + bandwidth)
+        G = X[:, r0:r1].T @ X[:, r0:c1]  # (rows, rows+bandwidth)
+        rows = np.arange(r1 - r0)[:, None]
+        cols = rows + offsets[None, :]
+        valid = cols < G.shape[1]
+        U[r0:r1][valid] = G[np.broadcast_to(rows, cols.shape)[valid], cols[valid]]
+    return U
+
+
+def band_matrix(U: np.ndarray) -> scipy.sparse.dia_matrix:
+    """
+    Builds the symmetric N×N band matrix from the output of `banded_diagonals`.
+    """
+    N, n_diag = U.shape
+    bandwidth = n_diag - 1
+    offsets = np.arange(-bandwidth, bandwidth + 1)
+    data = np.zeros((len(offsets), N), dtype=U.dtype)
+    # 帶寬超過矩陣邊長時(例如beat-synchronous)，N-1以外的對角線都是0
+    for d in range(min(bandwidth, N - 1) + 1):
+        # dia格式：data[i, c] 存放 S[c - offsets[i], c]
+        data[bandwidth + d, d:] = U[:N - d, d]   # S[c-d, c] = U[c-d, d]
+        data[bandwidth - d, :N - d] = U[:N - d, d]  # S[c+d, c] = S[c, c+d] = U[c, d]
+    return scipy.sparse.dia_matrix((data, offsets), shape=(N, N))
+
+
+def banded_sm(X: npt.ArrayLike, bandwidth: int, block_size: int = 2048) -> scipy.sparse.dia_matrix:
+    """
+    Banded cosine self-similarity of the feature sequence `X` (features ×
+    frames): the entries with |i-j| <= bandwidth, all others are 0.
+    """
+    return band_matrix(banded_diagonals(normalize_columns(X), bandwidth, block_size))
+
+
+def knn_neighbors(
+    X: npt.ArrayLike,
+    k: int,
+    block_size: int = 256,
+    exclude: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (indices, similarities), both of shape (N, k): the `k` frames
+    most similar to every frame, ignoring frames closer than `exclude`
+    (1 excludes the frame itself, as `width=1` in
+    `librosa.segment.recurrence_matrix`). The neighbour sets are the same as
+    librosa's with `metric='cosine'`; row `i` holds the neighbours of frame
+    `i` (librosa returns them column-wise). Only these per-frame sets
+    match: how they are symmetrized is chosen in `knn_matrix`.
+    """
+    X = normalize_columns(X)
+    N = X.shape[1]
+    k = min(k, max(1, N - (2 * exclude - 1)))
+    indices = np.zeros((N, k), dtype=np.int64)
+    values = np.zeros((N, k), dtype=np.float32)
+    for r0 in range(0, N, block_size):
+        r1 = min(N, r0 + block_size)
+        G = X[:, r0:r1].T @ X  # (rows, N)
+        if exclude > 0:
+            rows = np.arange(r0, r1)
+            for e in range(-exclude + 1, exclude):
+                cols = rows + e
+                ok = (cols >= 0) & (cols < N)
+                G[(rows - r0)[ok], cols[ok]] = -np.inf
+        idx = np.argpartition(-G, k - 1, axis=1)[:, :k]
+        indices[r0:r1] = idx
+        values[r0:r1] = np.take_along_axis(G, idx, axis=1)
+    return indices, values
+
+
+def knn_matrix(indices: np.ndarray, values: np.ndarray, binary: bool = True,
+               sym: bool = True, mutual: bool = False) -> scipy.sparse.csr_matrix:
+    """
+    Builds the N×N kNN matrix from the output of `knn_neighbors`. With
+    `sym`, frames i and j are linked if either is a neighbour of the other
+    (union). With `mutual` they are linked only if each is a neighbour of
+    the other (intersection), like librosa's `sym=True`.
+    """
+    N, k = indices.shape
+    data = np.ones(N * k, dtype=np.float32) if binary else values.ravel()
+    S = scipy.sparse.csr_matrix((data, (np.repeat(np.arange(N), k), indices.ravel())), shape=(N, N))
+    if mutual:
+        S = S.minimum(S.T).tocsr()
+    elif sym:
+        S = S.maximum(S.T).tocsr()
+    return S
+
+
+def knn_sm(X: npt.ArrayLike, k: int, binary: bool = True, sym: bool = True,
+           mutual: bool = False, block_size: int = 256) -> scipy.sparse.csr_matrix:
+    """
+    kNN cosine self-similarity of the feature sequence `X`: every frame keeps
+    its `k` most similar frames (binary links or similarity values),
+    symmetrized as in `knn_matrix`.
+    """
+    return knn_matrix(*knn_neighbors(X, k, block_size), binary=binary, sym=sym, mutual=mutual)
+
+
+def pooled_image(S, max_size: int = 1000, how: str = "max") -> Tuple[np.ndarray, int]:
+    """
+    Downsamples a (sparse or dense) N×N matrix to at most `max_size` pixels
+    per side for plotting. Missing (sparse) entries count as 0.
+
+    Returns the image and the pooling factor (frames per pixel).
+    """
+    if how not in ("max", "mean"):
+        raise ValueError(f"Unsupported pooling: {how}")
+    N = S.shape[0]
+    factor = max(1, int(np.ceil(N / max_size)))
+    if factor == 1:
+        return (S.toarray() if scipy.sparse.issparse(S) else np.asarray(S)), 1
+    n = int(np.ceil(N / factor))
+    if not scipy.sparse.issparse(S):
+        return _pool_dense(np.asarray(S, dtype=np.float64), factor, n, how), factor
+
+    if isinstance(S, scipy.sparse.dia_matrix):
+        return _pool_dia(S, factor, n, how), factor
+
+    if S.nnz <= _SCATTER_MAX_NNZ:
+        # 非零值不多(kNN)：直接scatter到像素
+        coo = scipy.sparse.coo_matrix(S)
+        img = np.zeros((n, n), dtype=np.float64)
+        if how == "max":
+            np.maximum.at(img, (coo.row // factor, coo.col // factor), coo.data)
+        else:
+            np.add.at(img, (coo.row // factor, coo.col // factor), coo.data)
+            img /= factor ** 2
+        return img, factor
+
+    # 非零值很多：一次取factor列，只展開有非零值的欄位範圍
+    S = scipy.sparse.csr_matrix(S)
+    img = np.zeros((n, n), dtype=np.float64)
+    for p in range(n):
+        slab = S[p * factor:(p + 1) * factor]
+        if slab.nnz == 0:
+            continue
+        q0 = slab.indices.min() // factor
+        q1 = slab.indices.max() // factor + 1
+        block = slab[:, q0 * factor:q1 * factor].toarray()
+        img[p, q0:q1] = _pool_dense(block, factor, (1, q1 - q0), how)[0]
+    return img, factor
+
+
+# 超過這個非零值數量時，np.maximum.at比逐列展開慢
+_SCATTER_MAX_NNZ = 2_000_000
+
+
+def _pool_dia(S: scipy.sparse.dia_matrix, factor: int, n: int, how: str) -> np.ndarray:
+    """
+    Pools a banded dia matrix one slab of `factor` columns at a time, directly
+    from its diagonals (converting a wide band to csr/coo takes longer than
+    the pooling itself).
+    """
+    N = S.shape[0]
+    offsets = S.offsets
+    img = np.zeros((n, n), dtype=np.float64)
+    for q in range(n):
+        c0, c1 = q * factor, min(N, (q + 1) * factor)
+        cols = np.arange(c0, c1)
+        # dia格式：data[i, c] 存放 S[c - offsets[i], c]
+        rows = cols[None, :] - offsets[:, None]
+        valid = (rows >= 0) & (rows < N)
+        p0 = max(0, c0 - offsets.max()) // factor
+        p1 = min(n, (c1 - 1 - offsets.min()) // factor + 1)
+        block = np.zeros(((p1 - p0) * factor, factor), dtype=np.float64)
+        block[rows[valid] - p0 * factor, np.broadcast_to(cols - c0, rows.shape)[valid]] = \
+            S.data[:, c0:c1][valid]
+        img[p0:p1, q] = _pool_dense(block, factor, (p1 - p0, 1), how)[:, 0]
+    return img
+
+
+def _pool_dense(X: np.ndarray, factor: int, n, how: str) -> np.ndarray:
+    """Pools a dense block into `n` (or (rows, cols)) pixels, zero-padding the edges."""
+    rows, cols = (n, n) if np.isscalar(n) else n
+    padded = np.zeros((rows * factor, cols * factor), dtype=np.float64)
+    padded[:X.shape[0], :X.shape[1]] = X
+    blocks = padded.reshape(rows, factor, cols, factor)
+    if how == "max":
+        return np.maximum(blocks.max(axis=(1, 3)), 0.0)
+    return blocks.mean(axis=(1, 3))
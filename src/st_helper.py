@@ -80,4 +80,16 @@ def sengment_change_clean():
     """
     
     st.session_state["3-Time"]["onset_frames"] = []
-    st.session_state["3-Time"]["beat_frames"] = []
\ No newline at end of file
+    st.session_state["3-Time"]["beat_frames"] = []
+
+def get_rate_curve(name, event_times):
+    """
+        取得session中名為name的RateCurve(MA1~MA10一起計算)，第一次使用時建立
+        之後由plot_bpm增量更新，修改單一onset/beat時不需重算整條曲線
+    """
+    from src.analysis import RateCurve
+
+    curves = st.session_state.setdefault("rate_curves", {})
+    if name not in curves:
+        curves[name] = RateCurve(event_times, windows=range(1, 11))
+    return curves[name]
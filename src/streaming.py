@@ -0,0 +1,143 @@
+"""
+Block-wise analysis of long recordings.
+
+`librosa.load` keeps the whole signal in memory and every full-track feature
+holds a full-length spectrogram. The functions here read the file in
+overlapping blocks with `librosa.stream` and compute frame-level features one
+block at a time, so peak memory depends on `block_length` and not on the
+length of the recording. Only the (small) frame-level results grow with the
+track.
+
+Frames are not centered (`center=False`): frame `i` covers samples
+`[i*hop_length, i*hop_length + n_fft)`, and the reported times are the frame
+centers. The signal is analyzed at the file's native sample rate.
+"""
+from dataclasses import dataclass, fields
+from typing import Iterator, Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from src.timbre import timbre_descriptors
+
+
+@dataclass
+class StreamFeatures:
+    """
+    Frame-level features of a block (or of a whole stream once concatenated).
+    One column per frame in every array.
+    """
+    times: np.ndarray
+    rms: np.ndarray             # shape=(n_frames,)
+    onset_strength: np.ndarray  # shape=(n_frames,)
+    chroma: np.ndarray          # shape=(12, n_frames)
+    centroid: np.ndarray        # shape=(n_frames,)
+    bandwidth: np.ndarray       # shape=(n_frames,)
+    rolloff: np.ndarray         # shape=(n_frames,)
+    flatness: np.ndarray        # shape=(n_frames,)
+
+    @property
+    def n_frames(self) -> int:
+        return len(self.times)
+
+
+def iter_stream_features(
+    path,
+    block_length: int = 256,
+    n_fft: int = 2048,
+    hop_length: int = 512,
+    n_mels: int = 128,
+    roll_percent: float = 0.85,
+) -> Iterator[StreamFeatures]:
+    """
+    Yields the features of `path` block by block.
+
+    Parameters
+    ----------
+    path : str or file-like
+        Anything `soundfile.SoundFile` can open.
+    block_length : int, optional
+        Number of frames per block (default 256, about 6 s at 22050 Hz).
+        Every block holds `n_fft + (block_length-1)*hop_length` samples.
+    n_fft, hop_length : int, optional
+        Frame and hop size in samples.
+    n_mels : int, optional
+        Number of mel bands of the onset-strength spectrogram.
+    roll_percent : float, optional
+        Roll-off percentage of the spectral roll-off.
+
+    Notes
+    -----
+    The onset strength is computed like `librosa.onset.onset_strength` on a
+    mel spectrogram in dB, except that the dB values are not clipped to
+    `top_db` below the maximum (the maximum over the whole track is not known
+    while streaming). The last mel frame of each block is carried over so
+    the first difference of the next block is exact.
+    """
+    own_file = not isinstance(path, sf.SoundFile)
+    sfo = sf.SoundFile(path) if own_file else path
+    try:
+        yield from _iter_blocks(sfo, block_length, n_fft, hop_length, n_mels, roll_percent)
+    finally:
+        if own_file:
+            sfo.close()
+
+
+def _iter_blocks(sfo, block_length, n_fft, hop_length, n_mels, roll_percent):
+    sr = sfo.samplerate
+
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=n_mels)
+    window = librosa.filters.get_window("hann", n_fft, fftbins=True)
+    prev_mel_db = None  # 上一個block的最後一個frame，用來計算onset的差分
+    frame_offset = 0
+
+    for y_block in librosa.stream(sfo, block_length=block_length,
+                                  frame_length=n_fft, hop_length=hop_length):
+        if len(y_block) < n_fft:
+            break
+        S = np.abs(librosa.stft(y_block, n_fft=n_fft, hop_length=hop_length,
+                                window=window, center=False))
+        n_frames = S.shape[1]
+        power = S ** 2
+
+        rms = librosa.feature.rms(y=y_block, frame_length=n_fft, hop_length=hop_length,
+                                  center=False)[0]
+
+        mel_db = librosa.power_to_db(mel_basis @ power, top_db=None)
+        if prev_mel_db is None:
+            prev = mel_db[:, :1]  # 整首歌的第一個frame沒有前一個frame，差分為0
+        else:
+            prev = prev_mel_db
+        diff = np.diff(np.concatenate([prev, mel_db], axis=1), axis=1)
+        onset = np.mean(np.maximum(0.0, diff), axis=0)
+        prev_mel_db = mel_db[:, -1:]
+
+        chroma = librosa.feature.chroma_stft(S=power, sr=sr, n_fft=n_fft, tuning=0.0)
+        timbre = timbre_descriptors(S, sr, n_fft=n_fft, roll_percents=(roll_percent,),
+                                    descriptors=("centroid", "bandwidth", "rolloff", "flatness"))
+        centroid = timbre["centroid"][0]
+        bandwidth = timbre["bandwidth"][0]
+        rolloff = timbre["rolloff"][0]
+        flatness = timbre["flatness"][0]
+
+        frames = frame_offset + np.arange(n_frames)
+        times = (frames * hop_length + n_fft / 2) / sr  # frame的中心
+        frame_offset += n_frames
+
+        yield StreamFeatures(times, rms, onset, chroma, centroid, bandwidth, rolloff, flatness)
+
+
+def analyze_stream(path, **kwargs) -> Optional[StreamFeatures]:
+    """
+    Runs `iter_stream_features` over the whole file and concatenates the
+    blocks. Returns None if the file is shorter than one frame.
+    """
+    blocks = list(iter_stream_features(path, **kwargs))
+    if not blocks:
+        return None
+    merged = {}
+    for f in fields(StreamFeatures):
+        arrays = [getattr(b, f.name) for b in blocks]
+        merged[f.name] = np.concatenate(arrays, axis=-1)
+    return StreamFeatures(**merged)
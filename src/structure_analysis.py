@@ -1,6 +1,7 @@
 import numpy as np
 import os, sys, librosa
 from scipy import signal
+import scipy.sparse
 from matplotlib import pyplot as plt
 import matplotlib
 import matplotlib.gridspec as gridspec
@@ -19,21 +20,19 @@ from libfmp.b import FloatingBox
 from numpy import typing as npt
 import typing
 
-@jit(nopython=True)
-def compute_sm_dot(X, Y):
-    """Computes similarty matrix from feature sequences using dot (inner) product
-
-    Notebook: C4/C4S2_SSM.ipynb
-
-    Args:
-        X (np.ndarray): First sequence
-        Y (np.ndarray): Second Sequence
-
-    Returns:
-        S (float): Dot product
-    """
-    S = np.dot(np.transpose(X), Y)
-    return S
+from src.analysis import (
+    compute_kernel_checkerboard_gaussian,
+    compute_novelty,
+    compute_novelty_ssm,
+    compute_novelty_ssm_multiscale,
+    compute_recurrence,
+    compute_sm_dot,
+    compute_ssm,
+    compute_structure_ssms,
+    get_ssm_feature,
+    STRUCTURE_SSM_VARIANTS,
+)
+from src.ssm import pooled_image
 
 def plot_feature_ssm(X, Fs_X, S, Fs_S, ann, duration, color_ann=None,
                      title='', label='Time (seconds)', time=True,
@@ -45,9 +44,9 @@ def plot_feature_ssm(X, Fs_X, S, Fs_S, ann, duration, color_ann=None,
     Args:
         X: Feature representation
         Fs_X: Feature rate of ``X``
-        S: Similarity matrix (SM)
+        S: Similarity matrix (SM), dense or scipy.sparse
         Fs_S: Feature rate of ``S``
-        ann: Annotaions
+        ann: Annotaions (may be empty)
         duration: Duration
         color_ann: Color annotations (see :func:`libfmp.b.b_plot.plot_segments`) (Default value = None)
         title: Figure title (Default value = '')
@@ -62,6 +61,10 @@ def plot_feature_ssm(X, Fs_X, S, Fs_S, ann, duration, color_ann=None,
         fig: Handle for figure
         ax: Handle for axes
     """
+    if scipy.sparse.issparse(S):
+        # 稀疏矩陣先池化成較小的影像再繪製
+        S, factor = pooled_image(S)
+        Fs_S = Fs_S / factor
     cmap = libfmp.b.compressed_gray_cmap(alpha=-10)
     fig, ax = plt.subplots(3, 3, gridspec_kw={'width_ratios': [0.1, 1, 0.05],
                                               'wspace': 0.2,
@@ -74,11 +77,16 @@ def plot_feature_ssm(X, Fs_X, S, Fs_S, ann, duration, color_ann=None,
                          title='', xlabel='', ylabel='', colorbar=True)
     ax[1, 1].set_xticks([])
     ax[1, 1].set_yticks([])
+    ax[2, 2].axis('off')
+    ax[2, 0].axis('off')
+    if len(ann) == 0:
+        # 沒有標註(例如上傳的音檔)時不畫segments
+        ax[2, 1].axis('off')
+        ax[1, 0].axis('off')
+        return fig, ax
     libfmp.b.plot_segments(ann, ax=ax[2, 1], time_axis=time, fontsize=fontsize,
                            colors=color_ann,
                            time_label=label, time_max=duration*Fs_X)
-    ax[2, 2].axis('off')
-    ax[2, 0].axis('off')
     libfmp.b.plot_segments(ann, ax=ax[1, 0], time_axis=time, fontsize=fontsize,
                            direction='vertical', colors=color_ann,
                            time_label=label, time_max=duration*Fs_X)
@@ -103,7 +111,20 @@ def SSM_chorma(wav_fn:str, anno_fn: str, hop_size: int = 4096, Nfft: int = 1024)
                                title='Chroma feature (Fs=%0.2f)'%Fs_X)
     return fig, ax
 
-def plot_self_similarity(y_ref: npt.ArrayLike, sr: int, affinity: bool = False, hop_length: int = 1024) -> None:
+def plot_self_similarity(
+    y_ref: npt.ArrayLike,
+    sr: int,
+    affinity: bool = False,
+    hop_length: int = 1024,
+    mode: str = "dense",
+    bandwidth: int = 256,
+    k: int = 5,
+    max_size: int = 1000,
+    beat_synchronous: bool = False,
+    aggregate: str = "median",
+    mutual: bool = False,
+    beat_component: str = None,
+) -> None:
     '''
     To visualize the similarity matrix of the signal
 
@@ -112,137 +133,157 @@ def plot_self_similarity(y_ref: npt.ArrayLike, sr: int, affinity: bool = False,
     sr: sampling rate
     affinity: to use affinity or not
     hop_size
+    mode: "dense", "band" or "knn" (sparse matrices, see `src.ssm`)
+    bandwidth: number of diagonals kept by mode="band"
+    k: number of neighbours kept by mode="knn"
+    mutual: mode="knn" links only mutual neighbours (like librosa's sym=True)
+    max_size: sparse matrices are max-pooled to at most max_size pixels per side
+    beat_synchronous: one row/column per beat instead of per frame
+    aggregate: pooling of the frames of a beat, "median" or "mean"
+    beat_component: "percussive" tracks the beats on the percussive part (see `get_beat_bounds`)
     '''
 
-
-    # Pre-processing stage
-    chroma = librosa.feature.chroma_cqt(y=y_ref, sr=sr, hop_length=hop_length)
-    chroma_stack = librosa.feature.stack_memory(chroma, n_steps=10, delay=3)
+    R = compute_ssm(y_ref, sr, mode=mode, hop_length=hop_length, affinity=affinity,
+                    bandwidth=bandwidth, k=k, beat_synchronous=beat_synchronous, aggregate=aggregate,
+                    mutual=mutual, beat_component=beat_component)
+    coords = None
+    if beat_synchronous:
+        # beat長度不一，以beat邊界的時間當座標
+        _, bounds = get_ssm_feature(y_ref, sr, hop_length, True, aggregate, beat_component)
+        coords = librosa.frames_to_time(bounds, sr=sr, hop_length=hop_length)
 
     fig, ax = plt.subplots()
 
-    if not affinity:
-        R = librosa.segment.recurrence_matrix(chroma_stack, k=5)
-        imgsim = librosa.display.specshow(R, x_axis='s', y_axis='s',
-                                        hop_length=hop_length)
-        plt.title('Binary recurrence (symmetric)')
-        plt.colorbar()
-
+    if mode == "dense":
+        if not affinity:
+            imgsim = librosa.display.specshow(R, x_axis='s', y_axis='s', x_coords=coords, y_coords=coords,
+                                            hop_length=hop_length)
+            plt.title('Binary recurrence (symmetric)')
+            plt.colorbar()
+
+        else:
+            imgaff = librosa.display.specshow(R, x_axis='s', y_axis='s', x_coords=coords, y_coords=coords,
+                                            cmap='magma_r', hop_length=hop_length)
+            plt.title('Affinity recurrence')
+            plt.colorbar()
     else:
-        R_aff = librosa.segment.recurrence_matrix(chroma_stack, metric='cosine',mode='affinity')
-        imgaff = librosa.display.specshow(R_aff, x_axis='s', y_axis='s',
-                                        cmap='magma_r', hop_length=hop_length)
-        plt.title('Affinity recurrence')
-        plt.colorbar()
+        img, factor = pooled_image(R, max_size=max_size)
+        cmap = 'gray_r' if (mode == "knn" and not affinity) else 'magma_r'
+        if beat_synchronous:
+            # beat長度不一：像素的邊界為(每factor個)beat邊界的時間，與dense及novelty相同的時間軸
+            N = R.shape[0]
+            edges = coords[np.append(np.arange(0, N, factor), N)]
+            im = ax.pcolormesh(edges, edges, img, cmap=cmap, shading='flat', rasterized=True)
+            ax.set_aspect('equal')
+        else:
+            extent = img.shape[0] * factor * hop_length / sr
+            im = ax.imshow(img, origin='lower', aspect='equal', interpolation='nearest',
+                           cmap=cmap, extent=[0, extent, 0, extent])
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Time (s)')
+        if mode == "band" and beat_synchronous:
+            ax.set_title(f'Banded cosine similarity (±{bandwidth} beats)')
+        elif mode == "band":
+            ax.set_title(f'Banded cosine similarity (±{bandwidth * hop_length / sr:.1f} s)')
+        else:
+            ax.set_title(f'{"Cosine" if affinity else "Binary"} {"mutual " if mutual else ""}kNN recurrence (k={k})')
+        fig.colorbar(im, ax=ax)
 
     return fig, ax
 
-@jit(nopython=True)
-def compute_kernel_checkerboard_gaussian(L: int =10 , var: float = 0.5, normalize=True) -> npt.ArrayLike:
-    """Compute Guassian-like checkerboard kernel [FMP, Section 4.4.1].
-    See also: https://scipython.com/blog/visualizing-the-bivariate-gaussian-distribution/
-
-    Notebook: C4/C4S4_NoveltySegmentation.ipynb
 
-    Args:
-        L (int): Parameter specifying the kernel size M=2*L+1
-        var (float): Variance parameter determing the tapering (epsilon) (Default value = 1.0)
-        normalize (bool): Normalize kernel (Default value = True)
-
-    Returns:
-        kernel (np.ndarray): Kernel matrix of size M x M
+def plot_novelty(
+    y_ref: npt.ArrayLike,
+    sr: int,
+    L: int = 10,
+    hop_length: int = 1024,
+    mode: str = "dense",
+    bandwidth: int = 256,
+    k: int = 5,
+    shift_time: float = 0.0,
+    beat_synchronous: bool = False,
+    aggregate: str = "median",
+    mutual: bool = False,
+    beat_component: str = None,
+):
+    """
+    Plots the checkerboard novelty curve of the affinity self-similarity
+    matrix computed in `mode` (see `compute_novelty`).
+    """
+    result = compute_novelty(y_ref, sr, L=L, hop_length=hop_length, mode=mode,
+                             bandwidth=bandwidth, k=k, beat_synchronous=beat_synchronous,
+                             aggregate=aggregate, mutual=mutual, beat_component=beat_component)
+    fig, ax = plt.subplots(figsize=(10, 3))
+    ax.plot(result.times + shift_time, result.novelty, color='k')
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Novelty')
+    ax.set_title(f'Novelty ($L_\\mathrm{{kernel}}$ = {L})')
+    ax.set_xlim([shift_time, shift_time + result.times[-1]])
+    return fig, ax, result
+
+def plot_ssm_novelty(
+    y: npt.ArrayLike,
+    sr: int,
+    ann=None,
+    color_ann=None,
+    variants=STRUCTURE_SSM_VARIANTS,
+    L_kernel_set=(5, 10, 20, 40),
+    figsize=(10, 6),
+):
     """
-    taper = np.sqrt(1/2) / (L * var)
-    axis = np.arange(-L, L+1)
-    gaussian1D = np.exp(-taper**2 * (axis**2))
-    gaussian2D = np.outer(gaussian1D, gaussian1D)
-    kernel_box = np.outer(np.sign(axis), np.sign(axis))
-    kernel = kernel_box * gaussian2D
-    if normalize:
-        kernel = kernel / np.sum(np.abs(kernel))
-    return kernel
+    Chroma SSMs at several smoothing/downsampling settings and their novelty
+    curves for several kernel sizes (libfmp's novelty comparison).
 
+    y, sr: signal
+    ann, color_ann: optional structure annotation (seconds) and its colors
+    variants: (smoothing length L, downsampling H) of every SSM
+    L_kernel_set: novelty kernel sizes
 
-def compute_novelty_ssm(S, kernel: npt.ArrayLike = None, L: int = 10, var: float = 0.5, exclude: bool =False) -> npt.ArrayLike:
-    """Compute novelty function from SSM [FMP, Section 4.4.1]
+    Returns (ssm_figs, fig, ax, ssms, novelties): one figure per SSM, the
+    (kernel × SSM) grid of novelty curves, the `StructureSSM` results and one
+    (len(L_kernel_set), n_frames) novelty matrix per SSM.
+    """
+    # 只解碼/計算一次chroma，各組參數共用
+    ssms = compute_structure_ssms(y, sr, variants=variants, L_smooth=1, thresh=1)
 
-    Notebook: C4/C4S4_NoveltySegmentation.ipynb
+    ssm_figs = []
+    for r in ssms:
+        ann_frames = libfmp.c4.convert_structure_annotation(ann, Fs=r.Fs_X) if ann else []
+        fig, ax = plot_feature_ssm(r.X, 1, r.S, 1, ann_frames, r.duration*r.Fs_X,
+                                   label='Time (frames)', color_ann=color_ann, clim_X=[0,1], clim=[0,1],
+                                   title='Feature rate: %0.0f Hz'%(r.Fs_X), figsize=(4.5, 5.5))
+        ssm_figs.append(fig)
 
-    Args:
-        S (np.ndarray): SSM
-        kernel (np.ndarray): Checkerboard kernel (if kernel==None, it will be computed) (Default value = None)
-        L (int): Parameter specifying the kernel size M=2*L+1 (Default value = 10)
-        var (float): Variance parameter determing the tapering (epsilon) (Default value = 0.5)
-        exclude (bool): Sets the first L and last L values of novelty function to zero (Default value = False)
+    num_kernel = len(L_kernel_set)
+    num_SSM = len(ssms)
+    fig, ax = plt.subplots(num_kernel, num_SSM, figsize=figsize, squeeze=False)
+    novelties = []
+    for s, r in enumerate(ssms):
+        # 所有kernel大小一次算完，每條對角線只讀一次
+        nov_set = compute_novelty_ssm_multiscale(r.S, L_kernel_set, exclude=True)
+        novelties.append(nov_set)
+        for t, L_kernel in enumerate(L_kernel_set):
+            fig_nov, ax_nov, line_nov = libfmp.b.plot_signal(nov_set[t], Fs=r.Fs_X,
+                    color='k', ax=ax[t,s], figsize=figsize,
+                    title='Feature rate = %0.0f Hz, $L_\mathrm{kernel}$ = %d'%(r.Fs_X, L_kernel))
+            if ann:
+                libfmp.b.plot_segments_overlay(ann, ax=ax_nov, colors=color_ann, alpha=0.1,
+                                               edgecolor='k', print_labels=False)
+    fig.tight_layout()
+    return ssm_figs, fig, ax, ssms, novelties
 
-    Returns:
-        nov (np.ndarray): Novelty function
-    """
-    if kernel is None:
-        kernel = compute_kernel_checkerboard_gaussian(L=L, var=var)
-    N = S.shape[0]
-    M = 2*L + 1
-    nov = np.zeros(N)
-    # np.pad does not work with numba/jit
-    S_padded = np.pad(S, L, mode='constant')
-
-    for n in range(N):
-        # Does not work with numba/jit
-        nov[n] = np.sum(S_padded[n:n+M, n:n+M] * kernel)
-    if exclude:
-        right = np.min([L, N])
-        left = np.max([0, N-L])
-        nov[0:right] = 0
-        nov[left:N] = 0
-
-    return nov
 
 def SSM_Novelty(wav_filename:str, anno_csv_filename: str) -> None :
 
     float_box = libfmp.b.FloatingBox()
 
-    fn_wav = os.path.join(wav_filename)
     ann, color_ann = libfmp.c4.read_structure_annotation(os.path.join(anno_csv_filename), 
                                                          fn_ann_color=anno_csv_filename)
+    x, Fs = librosa.load(os.path.join(wav_filename), sr=22050)
 
-    S_dict = {}
-    Fs_dict = {}
-    x, x_duration, X, Fs_X, S, I = libfmp.c4.compute_sm_from_filename(fn_wav, 
-                                                    L=11, H=5, L_smooth=1, thresh=1)
-
-    S_dict[0], Fs_dict[0] = S, Fs_X
-    ann_frames = libfmp.c4.convert_structure_annotation(ann, Fs=Fs_X) 
-    fig, ax = libfmp.c4.plot_feature_ssm(X, 1, S, 1, ann_frames, x_duration*Fs_X,
-                label='Time (frames)', color_ann=color_ann, clim_X=[0,1], clim=[0,1], 
-                title='Feature rate: %0.0f Hz'%(Fs_X), figsize=(4.5, 5.5))
-    float_box.add_fig(fig)
-
-    x, x_duration, X, Fs_X, S, I = libfmp.c4.compute_sm_from_filename(fn_wav, 
-                                                    L=41, H=10, L_smooth=1, thresh=1)
-    S_dict[1], Fs_dict[1] = S, Fs_X
-    ann_frames = libfmp.c4.convert_structure_annotation(ann, Fs=Fs_X) 
-    fig, ax = libfmp.c4.plot_feature_ssm(X, 1, S, 1, ann_frames, x_duration*Fs_X,
-                label='Time (frames)', color_ann=color_ann, clim_X=[0,1], clim=[0,1], 
-                title='Feature rate: %0.0f Hz'%(Fs_X), figsize=(4.5, 5.5))
-    float_box.add_fig(fig)
+    ssm_figs, fig, ax, ssms, novelties = plot_ssm_novelty(x, Fs, ann=ann, color_ann=color_ann)
+    for fig_ssm in ssm_figs:
+        float_box.add_fig(fig_ssm)
     float_box.show()
-
-    figsize=(10,6)
-    L_kernel_set = [5, 10, 20, 40]
-    num_kernel = len(L_kernel_set)
-    num_SSM = len(S_dict)
-
-    fig, ax = plt.subplots(num_kernel, num_SSM, figsize=figsize)
-    for s in range(num_SSM):
-        for t in range(num_kernel):
-            L_kernel = L_kernel_set[t]
-            S = S_dict[s]
-            nov = compute_novelty_ssm(S, L=L_kernel, exclude=True)        
-            fig_nov, ax_nov, line_nov = libfmp.b.plot_signal(nov, Fs = Fs_dict[s], 
-                    color='k', ax=ax[t,s], figsize=figsize, 
-                    title='Feature rate = %0.0f Hz, $L_\mathrm{kernel}$ = %d'%(Fs_dict[s],L_kernel)) 
-            libfmp.b.plot_segments_overlay(ann, ax=ax_nov, colors=color_ann, alpha=0.1, 
-                                           edgecolor='k', print_labels=False)
-    plt.tight_layout()
     plt.show()  
     
\ No newline at end of file
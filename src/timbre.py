@@ -0,0 +1,137 @@
+"""
+Timbre descriptors of one magnitude spectrogram in a single sweep.
+
+`librosa.feature.spectral_centroid`, `spectral_bandwidth`, `spectral_rolloff`
+and `spectral_flatness` each normalize or reduce the spectrogram on their
+own; bandwidth computes the centroid again and every rolloff percentage
+does its own cumulative sum. `timbre_descriptors` shares the intermediate
+results instead:
+
+- one column normalization for centroid and bandwidth,
+- one cumulative sum for any number of rolloff percentages,
+- one power spectrogram for flatness and the MFCCs,
+
+and gives the same values as the librosa functions with default parameters.
+The zero-crossing rate is computed from the signal on the frame grid of the
+spectrogram (`librosa.feature.zero_crossing_rate(y, frame_length=n_fft,
+hop_length=hop_length)`).
+"""
+from typing import Dict, Optional, Sequence
+
+import librosa
+import numpy as np
+from numpy import typing as npt
+
+TIMBRE_DESCRIPTORS = ("centroid", "bandwidth", "rolloff", "flatness", "contrast", "zcr", "mfcc")
+
+
+def _rolloff(S: np.ndarray, freq: np.ndarray, roll_percents: Sequence[float]) -> np.ndarray:
+    """Rolloff frequencies of every percentage (rows) from one cumulative sum."""
+    total_energy = np.cumsum(S, axis=0)
+    rolloff = np.empty((len(roll_percents), S.shape[1]), dtype=freq.dtype)
+    for i, roll_percent in enumerate(roll_percents):
+        if not 0.0 < roll_percent < 1.0:
+            raise ValueError(f"roll_percent must lie in the range (0, 1), got {roll_percent}")
+        # 第一個累積能量 >= 門檻的bin
+        index = np.count_nonzero(total_energy < roll_percent * total_energy[-1], axis=0)
+        rolloff[i] = freq[np.minimum(index, len(freq) - 1)]
+    return rolloff
+
+
+def _zero_crossing_rate(y: np.ndarray, frame_length: int, hop_length: int) -> np.ndarray:
+    """`librosa.feature.zero_crossing_rate(y, frame_length, hop_length)[0]`."""
+    y = np.pad(y, frame_length // 2, mode="edge")
+    signs = np.signbit(np.where(np.abs(y) <= 1e-10, 0.0, y))
+    # 相鄰樣本的過零點累積數，每個frame只計算frame內的frame_length - 1對
+    counts = np.concatenate([[0], np.cumsum(signs[1:] != signs[:-1])])
+    starts = np.arange(0, len(y) - frame_length + 1, hop_length)
+    return (counts[starts + frame_length - 1] - counts[starts]) / frame_length
+
+
+def timbre_descriptors(
+    S: npt.ArrayLike,
+    sr: int,
+    n_fft: Optional[int] = None,
+    hop_length: int = 512,
+    descriptors: Sequence[str] = TIMBRE_DESCRIPTORS,
+    roll_percents: Sequence[float] = (0.85,),
+    n_mfcc: int = 20,
+    n_mels: int = 128,
+    y: Optional[npt.ArrayLike] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Computes the requested timbre descriptors of the magnitude spectrogram `S`.
+
+    Parameters
+    ----------
+    S : np.ndarray
+        Magnitude spectrogram (frequency bins × frames), non-negative.
+    sr : int
+        Sample rate.
+    n_fft : int, optional
+        FFT size of `S` (default `2 * (S.shape[0] - 1)`).
+    hop_length : int, optional
+        Hop of `S`, only used for "zcr" (default 512).
+    descriptors : sequence of str, optional
+        Any of `TIMBRE_DESCRIPTORS` (default all).
+    roll_percents : sequence of float, optional
+        Rolloff percentages in (0, 1), default (0.85,) as librosa.
+    n_mfcc, n_mels : int, optional
+        Number of MFCCs (default 20) and of the mel bands they are computed
+        from (default 128).
+    y : np.ndarray, optional
+        The signal of `S`, required for "zcr".
+
+    Returns
+    -------
+    dict
+        Descriptor name -> array with one column per frame: "centroid",
+        "bandwidth" and "flatness" have shape (1, n_frames), "rolloff"
+        (len(roll_percents), n_frames), "contrast" (7, n_frames), "zcr"
+        (1, n_frames) and "mfcc" (n_mfcc, n_frames).
+    """
+    unknown = set(descriptors) - set(TIMBRE_DESCRIPTORS)
+    if unknown:
+        raise ValueError(f"Unsupported timbre descriptors: {sorted(unknown)}")
+    S = np.asarray(S)
+    if np.any(S < 0):
+        raise ValueError("S must be a non-negative magnitude spectrogram")
+    if n_fft is None:
+        n_fft = 2 * (S.shape[0] - 1)
+    freq = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    result = {}
+
+    if "centroid" in descriptors or "bandwidth" in descriptors:
+        # 與librosa.util.normalize(S, norm=1, axis=0)相同：能量過小的frame保持原值
+        norm = S.sum(axis=0, keepdims=True)
+        S_norm = S / np.where(norm < np.finfo(S.dtype).tiny, 1.0, norm)
+        centroid = freq @ S_norm
+        if "centroid" in descriptors:
+            result["centroid"] = centroid[np.newaxis]
+        if "bandwidth" in descriptors:
+            deviation = (freq[:, np.newaxis] - centroid) ** 2
+            result["bandwidth"] = np.sqrt(np.sum(S_norm * deviation, axis=0))[np.newaxis]
+
+    if "rolloff" in descriptors:
+        result["rolloff"] = _rolloff(S, freq, roll_percents)
+
+    if "flatness" in descriptors or "mfcc" in descriptors:
+        power = S ** 2
+        if "flatness" in descriptors:
+            S_thresh = np.maximum(1e-10, power)
+            gmean = np.exp(np.mean(np.log(S_thresh), axis=0))
+            result["flatness"] = (gmean / np.mean(S_thresh, axis=0))[np.newaxis]
+        if "mfcc" in descriptors:
+            mel = librosa.feature.melspectrogram(S=power, sr=sr, n_fft=n_fft, n_mels=n_mels)
+            result["mfcc"] = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=n_mfcc)
+
+    if "contrast" in descriptors:
+        result["contrast"] = librosa.feature.spectral_contrast(S=S, sr=sr, n_fft=n_fft)
+
+    if "zcr" in descriptors:
+        if y is None:
+            raise ValueError("The zero-crossing rate needs the signal y")
+        zcr = _zero_crossing_rate(np.asarray(y), n_fft, hop_length)
+        result["zcr"] = zcr[np.newaxis, :S.shape[1]]
+
+    return result
@@ -8,15 +8,26 @@ from numpy import typing as npt
 from matplotlib import pyplot as plt
 import scipy
 
+from src.features import get_magnitude, get_db
+from src.analysis import (
+    TimbreResult,
+    compute_hpss,
+    compute_timbre,
+)
 
-def spectral_centroid_analysis(y: npt.ArrayLike, sr: int, shift_array: npt.ArrayLike) -> None :
 
-    S, phase = librosa.magphase(librosa.stft(y=y))
-    cent = librosa.feature.spectral_centroid(S=S)
-    times = librosa.times_like(cent, sr)
+def spectral_centroid_analysis(y: npt.ArrayLike, sr: int, shift_array: npt.ArrayLike,
+                               timbre: TimbreResult = None) -> None :
+    """
+        timbre: compute_timbre的結果，多個分析共用同一次計算
+    """
+
+    if timbre is None:
+        timbre = compute_timbre(y, sr, descriptors=("centroid",))
+    cent, times = timbre.descriptors["centroid"], timbre.times
 
     fig, ax = plt.subplots()
-    librosa.display.specshow(librosa.amplitude_to_db(S, ref=np.max),
+    librosa.display.specshow(get_db(y),
                              y_axis='log', x_axis='time', ax=ax, sr=sr)
     ax.plot(times, cent.T, label='Spectral centroid', color='w')
     ax.legend(loc='upper right')
@@ -30,19 +41,25 @@ def spectral_centroid_analysis(y: npt.ArrayLike, sr: int, shift_array: npt.Array
     return fig, ax, result
 
 
-def rolloff_frequency_analysis(y: npt.ArrayLike, sr: int, roll_percent:float = 0.99,
-                               shift_array: npt.ArrayLike =None) -> None :
+def rolloff_frequency_analysis(y: npt.ArrayLike, sr: int, roll_percent = 0.99,
+                               shift_array: npt.ArrayLike =None, timbre: TimbreResult = None) -> None :
+    """
+        roll_percent可以是一個或多個百分比，全部從同一個累積和計算
+        回傳的result: 時間、每個roll_percent的rolloff、rolloff(0.01)
+    """
 
-    rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr, roll_percent=roll_percent)
-    rolloff_min = librosa.feature.spectral_rolloff(y=y, sr=sr, roll_percent=0.01)
-    times = librosa.times_like(rolloff, sr)
-    S, phase = librosa.magphase(librosa.stft(y))
+    roll_percents = [roll_percent] if np.isscalar(roll_percent) else list(roll_percent)
+    if timbre is None:
+        timbre = compute_timbre(y, sr, descriptors=("rolloff",), roll_percents=roll_percents + [0.01])
+    rolloff = np.vstack([timbre.rolloff(p) for p in roll_percents])
+    rolloff_min, times = timbre.rolloff(0.01), timbre.times
 
     fig, ax = plt.subplots()
-    librosa.display.specshow(librosa.amplitude_to_db(S, ref=np.max),
+    librosa.display.specshow(get_db(y),
                              y_axis='log', x_axis='time', ax=ax, sr=sr)
-    ax.plot(librosa.times_like(rolloff,sr), rolloff[0], label=f'Roll-off frequency ({roll_percent})')
-    ax.plot(librosa.times_like(rolloff,sr), rolloff_min[0], color='w',
+    for p, r in zip(roll_percents, rolloff):
+        ax.plot(times, r, label=f'Roll-off frequency ({p})')
+    ax.plot(times, rolloff_min[0], color='w',
             label='Roll-off frequency (0.01)')
     ax.legend(loc='lower right')
     ax.set(title='log Power spectrogram')
@@ -54,19 +71,19 @@ def rolloff_frequency_analysis(y: npt.ArrayLike, sr: int, roll_percent:float = 0
 
     return fig, ax, result
 
-def spectral_bandwidth_analysis(y: npt.ArrayLike, sr: int, shift_array: npt.ArrayLike =None) -> None :
+def spectral_bandwidth_analysis(y: npt.ArrayLike, sr: int, shift_array: npt.ArrayLike =None,
+                                timbre: TimbreResult = None) -> None :
     
-    S, phase = librosa.magphase(librosa.stft(y=y))
-    spec_bw = librosa.feature.spectral_bandwidth(S=S)
-    times = librosa.times_like(spec_bw, sr)
+    if timbre is None:
+        timbre = compute_timbre(y, sr, descriptors=("bandwidth", "centroid"))
+    spec_bw, centroid, times = timbre.descriptors["bandwidth"], timbre.descriptors["centroid"], timbre.times
 
     fig, ax = plt.subplots(nrows=2, sharex=True)
-    centroid = librosa.feature.spectral_centroid(S=S, sr=sr)
     ax[0].semilogy(times, spec_bw[0], label='Spectral bandwidth')
     ax[0].set(ylabel='Hz', xticks=[], xlim=[times.min(), times.max()])
     ax[0].legend()
     ax[0].label_outer()
-    librosa.display.specshow(librosa.amplitude_to_db(S, ref=np.max),
+    librosa.display.specshow(get_db(y),
                              y_axis='log', x_axis='time', ax=ax[1], sr=sr)
     ax[1].set(title='log Power spectrogram')
     ax[1].fill_between(times, np.maximum(0, centroid[0] - spec_bw[0]),
@@ -83,18 +100,58 @@ def spectral_bandwidth_analysis(y: npt.ArrayLike, sr: int, shift_array: npt.Arra
     return fig, ax, result
 
 
+DESCRIPTOR_TITLES = {
+    "flatness": "Spectral flatness",
+    "contrast": "Spectral contrast",
+    "zcr": "Zero-crossing rate",
+    "mfcc": "MFCC",
+}
+
+
+def timbre_descriptor_analysis(y: npt.ArrayLike, sr: int, descriptor: str,
+                               shift_array: npt.ArrayLike =None, timbre: TimbreResult = None) -> None :
+    """
+        畫出flatness、contrast、zcr或mfcc；一維的畫曲線，多維的畫熱圖
+    """
+
+    if timbre is None:
+        timbre = compute_timbre(y, sr, descriptors=(descriptor,))
+    values, times = timbre.descriptors[descriptor], timbre.times
+
+    fig, ax = plt.subplots()
+    if values.shape[0] == 1:
+        ax.plot(times, values[0], label=DESCRIPTOR_TITLES[descriptor])
+        ax.set(xlim=[times.min(), times.max()])
+        ax.legend(loc='upper right')
+    else:
+        img = librosa.display.specshow(values, x_axis='time', ax=ax, sr=sr)
+        ax.set(ylabel='Band' if descriptor == 'contrast' else 'Coefficient')
+        fig.colorbar(img, ax=ax)
+    ax.set(title=DESCRIPTOR_TITLES[descriptor])
+    ax.set_xticks(shift_array - shift_array[0],
+                         shift_array)
+    ax.autoscale()
+
+    result = np.vstack((times, values))
+
+    return fig, ax, result
+
+
 def harmonic_percussive_source_separation(y: npt.ArrayLike, sr: int,
-        shift_array: npt.ArrayLike =None                                      
+        shift_array: npt.ArrayLike =None,
+        downsample: int = 1,
     ) -> None :
+    """
+        downsample > 1 時在降採樣的頻譜上計算遮罩(較快，近似)
+    """
 
-    D = librosa.stft(y)
-    H, P = librosa.decompose.hpss(D)
-    t = librosa.frames_to_time(np.arange(D.shape[1]), sr=sr)
+    result = compute_hpss(y, sr, downsample=downsample)
+    D, H, P, t = result.D, result.H, result.P, result.times
     
     fig, ax = plt.subplots(nrows=3, sharex=False, sharey=False, figsize=(12, 8))
     # 設置子圖之間的水平間距和垂直間距
     plt.subplots_adjust(hspace=0.6, wspace=0.3)
-    img = librosa.display.specshow(librosa.amplitude_to_db(np.abs(D),ref=np.max),
+    img = librosa.display.specshow(get_db(y),
                                    y_axis='log', x_axis='time', ax=ax[0], sr=sr)
     ax[0].set(title='Full power spectrogram')
     #// ax[0].label_outer()
@@ -103,7 +160,7 @@ def harmonic_percussive_source_separation(y: npt.ArrayLike, sr: int,
                          shift_array)
     ax[0].autoscale()
 
-    librosa.display.specshow(librosa.amplitude_to_db(np.abs(H), ref=np.max(np.abs(D))),
+    librosa.display.specshow(librosa.amplitude_to_db(np.abs(H), ref=np.max(get_magnitude(y))),
                              y_axis='log', x_axis='time', ax=ax[1], sr=sr)
     ax[1].set(title='Harmonic power spectrogram')
     #// ax[1].label_outer()
@@ -112,7 +169,7 @@ def harmonic_percussive_source_separation(y: npt.ArrayLike, sr: int,
                          shift_array)
     ax[1].autoscale()
 
-    librosa.display.specshow(librosa.amplitude_to_db(np.abs(P), ref=np.max(np.abs(D))),
+    librosa.display.specshow(librosa.amplitude_to_db(np.abs(P), ref=np.max(get_magnitude(y))),
                              y_axis='log', x_axis='time', ax=ax[2], sr=sr)
     ax[2].set(title='Percussive power spectrogram')
     ax[2].set_xticks(shift_array - shift_array[0],
@@ -0,0 +1,62 @@
+import librosa
+import numpy as np
+import pytest
+import scipy.ndimage
+
+from src import hpss
+
+
+@pytest.fixture
+def magnitude():
+    rng = np.random.default_rng(0)
+    S = rng.random((65, 120)).astype(np.float32)
+    S[10, :] += 3.0  # 和聲：一條水平線
+    S[:, 40] += 3.0  # 打擊：一條垂直線
+    return S
+
+
+@pytest.mark.parametrize("kernel_size", [1, 3, 7, 31])
+def test_running_median_rows_matches_scipy(magnitude, kernel_size):
+    expected = scipy.ndimage.median_filter(magnitude, size=(1, kernel_size), mode='reflect')
+    np.testing.assert_array_equal(hpss.running_median_rows(magnitude, kernel_size), expected)
+
+
+def test_running_median_with_kernel_longer_than_signal():
+    X = np.random.default_rng(1).random((3, 5))
+    expected = scipy.ndimage.median_filter(X, size=(1, 31), mode='reflect')
+    np.testing.assert_array_equal(hpss.running_median_rows(X, 31), expected)
+
+
+def test_median_filter_freq_matches_scipy(magnitude):
+    expected = scipy.ndimage.median_filter(magnitude, size=(17, 1), mode='reflect')
+    np.testing.assert_array_equal(hpss.median_filter_freq(magnitude, 17), expected)
+
+
+@pytest.mark.parametrize("power, margin", [(2.0, 1.0), (1.0, 1.0), (2.0, 2.0)])
+def test_hpss_masks_match_librosa(magnitude, power, margin):
+    mask_harm, mask_perc = hpss.hpss_masks(magnitude, power=power, margin=margin)
+    ref_harm, ref_perc = librosa.decompose.hpss(magnitude, mask=True, power=power, margin=margin)
+    np.testing.assert_allclose(mask_harm, ref_harm, atol=1e-6)
+    np.testing.assert_allclose(mask_perc, ref_perc, atol=1e-6)
+
+
+def test_hpss_masks_accept_complex_stft(magnitude):
+    D = magnitude * np.exp(1j * np.random.default_rng(2).random(magnitude.shape))
+    mask_harm, _ = hpss.hpss_masks(D)
+    ref_harm, _ = librosa.decompose.hpss(D, mask=True)
+    np.testing.assert_allclose(mask_harm, ref_harm, atol=1e-6)
+
+
+@pytest.mark.parametrize("downsample", [2, 3])
+def test_downsampled_masks_keep_shape_and_separate(magnitude, downsample):
+    mask_harm, mask_perc = hpss.hpss_masks(magnitude, downsample=downsample)
+    assert mask_harm.shape == mask_perc.shape == magnitude.shape
+    np.testing.assert_allclose(mask_harm + mask_perc, 1.0, atol=1e-5)
+    # 水平線主要是和聲，垂直線主要是打擊
+    assert mask_harm[10, 80:100].mean() > 0.5
+    assert mask_perc[30:50, 40].mean() > 0.5
+
+
+def test_hpss_masks_reject_margin_below_one(magnitude):
+    with pytest.raises(ValueError):
+        hpss.hpss_masks(magnitude, margin=0.5)
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+import scipy.sparse
+
+from src.analysis import compute_novelty_ssm, compute_novelty_ssm_multiscale, novelty_ssm_reference
+
+
+def block_ssm(sizes=(30, 45, 25), seed=0):
+    """SSM of a sequence with len(sizes) homogeneous parts, plus noise."""
+    labels = np.repeat(np.arange(len(sizes)), sizes)
+    S = (labels[:, None] == labels[None, :]).astype(np.float64)
+    S += 0.1 * np.random.default_rng(seed).random(S.shape)
+    return (S + S.T) / 2
+
+
+@pytest.mark.parametrize("L", [1, 4, 10])
+@pytest.mark.parametrize("exclude", [False, True])
+def test_novelty_matches_frame_loop(L, exclude):
+    S = block_ssm()
+    np.testing.assert_allclose(compute_novelty_ssm(S, L=L, exclude=exclude),
+                               novelty_ssm_reference(S, L=L, exclude=exclude), atol=1e-10)
+
+
+def test_novelty_with_kernel_larger_than_ssm():
+    S = block_ssm(sizes=(4, 5))
+    np.testing.assert_allclose(compute_novelty_ssm(S, L=8), novelty_ssm_reference(S, L=8), atol=1e-10)
+
+
+def test_novelty_accepts_sparse_ssm():
+    S = block_ssm()
+    np.testing.assert_allclose(compute_novelty_ssm(scipy.sparse.csr_matrix(S), L=5),
+                               novelty_ssm_reference(S, L=5), atol=1e-10)
+
+
+@pytest.mark.parametrize("exclude", [False, True])
+def test_multiscale_novelty_matches_single_kernels(exclude):
+    S = block_ssm()
+    L_set = (2, 5, 10, 40)
+    nov = compute_novelty_ssm_multiscale(S, L_set=L_set, exclude=exclude)
+    assert nov.shape == (len(L_set), S.shape[0])
+    for row, L in zip(nov, L_set):
+        np.testing.assert_allclose(row, compute_novelty_ssm(S, L=L, exclude=exclude), atol=1e-10)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from src import ssm
+from src.analysis import compute_novelty_ssm
+
+
+@pytest.fixture
+def features():
+    rng = np.random.default_rng(0)
+    # 三段不同的特徵，novelty在段落邊界有峰值
+    X = np.concatenate([rng.random((12, n)) + 2 * np.eye(12)[:, [i]] for i, n in enumerate((60, 80, 70))], axis=1)
+    return X
+
+
+def test_banded_sm_matches_dense_cosine(features):
+    X = ssm.normalize_columns(features)
+    dense = X.T @ X
+    bandwidth = 25
+    band = ssm.banded_sm(features, bandwidth, block_size=32).toarray()
+    i, j = np.indices(dense.shape)
+    np.testing.assert_allclose(band, np.where(np.abs(i - j) <= bandwidth, dense, 0), atol=1e-5)
+
+
+def test_banded_sm_with_bandwidth_longer_than_matrix(features):
+    X = ssm.normalize_columns(features[:, :20])
+    np.testing.assert_allclose(ssm.banded_sm(X, 64).toarray(), X.T @ X, atol=1e-5)
+
+
+@pytest.mark.parametrize("L", [5, 10])
+def test_band_novelty_equals_dense_cosine_novelty(features, L):
+    X = ssm.normalize_columns(features)
+    dense = compute_novelty_ssm(X.T @ X, L=L)
+    band = compute_novelty_ssm(ssm.banded_sm(features, 2 * L), L=L)
+    np.testing.assert_allclose(band, dense, atol=1e-4)
+
+
+def test_knn_neighbors_are_most_similar_frames(features):
+    k = 4
+    indices, values = ssm.knn_neighbors(features, k, block_size=50)
+    X = ssm.normalize_columns(features)
+    G = X.T @ X
+    np.fill_diagonal(G, -np.inf)
+    expected = -np.sort(-G, axis=1)[:, :k]
+    np.testing.assert_allclose(np.sort(values, axis=1)[:, ::-1], expected, atol=1e-5)
+    assert not np.any(indices == np.arange(len(indices))[:, None])
+
+
+def test_knn_matrix_union_and_mutual(features):
+    indices, values = ssm.knn_neighbors(features, 3)
+    directed = ssm.knn_matrix(indices, values, sym=False).toarray()
+    union = ssm.knn_matrix(indices, values).toarray()
+    mutual = ssm.knn_matrix(indices, values, mutual=True).toarray()
+    np.testing.assert_array_equal(union, np.maximum(directed, directed.T))
+    np.testing.assert_array_equal(mutual, np.minimum(directed, directed.T))
@@ -0,0 +1,65 @@
+import librosa
+import numpy as np
+import pytest
+
+from src import timbre
+
+SR = 22050
+
+
+@pytest.fixture
+def signal():
+    rng = np.random.default_rng(0)
+    t = np.arange(3 * SR) / SR
+    y = np.sin(2 * np.pi * 440 * t) + 0.3 * rng.standard_normal(len(t))
+    y[SR:SR + SR // 2] = 0.0  # 靜音的frame
+    return y.astype(np.float32)
+
+
+@pytest.fixture
+def magnitude(signal):
+    return np.abs(librosa.stft(signal))
+
+
+def test_centroid_and_bandwidth_match_librosa(magnitude):
+    result = timbre.timbre_descriptors(magnitude, SR, descriptors=("centroid", "bandwidth"))
+    np.testing.assert_allclose(result["centroid"], librosa.feature.spectral_centroid(S=magnitude, sr=SR),
+                               rtol=1e-5, atol=1e-3)
+    np.testing.assert_allclose(result["bandwidth"], librosa.feature.spectral_bandwidth(S=magnitude, sr=SR),
+                               rtol=1e-5, atol=1e-3)
+
+
+def test_rolloff_percents_match_librosa(magnitude):
+    percents = (0.01, 0.5, 0.85, 0.99)
+    result = timbre.timbre_descriptors(magnitude, SR, descriptors=("rolloff",), roll_percents=percents)
+    assert result["rolloff"].shape == (len(percents), magnitude.shape[1])
+    for row, p in zip(result["rolloff"], percents):
+        np.testing.assert_allclose(row, librosa.feature.spectral_rolloff(S=magnitude, sr=SR, roll_percent=p)[0])
+
+
+def test_flatness_contrast_and_mfcc_match_librosa(signal, magnitude):
+    result = timbre.timbre_descriptors(magnitude, SR, descriptors=("flatness", "contrast", "mfcc"))
+    np.testing.assert_allclose(result["flatness"], librosa.feature.spectral_flatness(S=magnitude),
+                               rtol=1e-5, atol=1e-7)
+    np.testing.assert_allclose(result["contrast"], librosa.feature.spectral_contrast(S=magnitude, sr=SR),
+                               rtol=1e-5)
+    np.testing.assert_allclose(result["mfcc"], librosa.feature.mfcc(y=signal, sr=SR), rtol=1e-4, atol=1e-3)
+
+
+def test_zero_crossing_rate_matches_librosa(signal, magnitude):
+    result = timbre.timbre_descriptors(magnitude, SR, descriptors=("zcr",), y=signal)
+    expected = librosa.feature.zero_crossing_rate(signal, frame_length=2048, hop_length=512)
+    np.testing.assert_allclose(result["zcr"], expected)
+
+
+def test_only_requested_descriptors_are_returned(magnitude):
+    assert set(timbre.timbre_descriptors(magnitude, SR, descriptors=("centroid",))) == {"centroid"}
+
+
+def test_invalid_arguments(magnitude):
+    with pytest.raises(ValueError):
+        timbre.timbre_descriptors(magnitude, SR, descriptors=("loudness",))
+    with pytest.raises(ValueError):
+        timbre.timbre_descriptors(magnitude, SR, descriptors=("rolloff",), roll_percents=(1.0,))
+    with pytest.raises(ValueError):
+        timbre.timbre_descriptors(magnitude, SR, descriptors=("zcr",))